@@ -1,42 +1,159 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_migrate import Migrate, upgrade
 from dotenv import load_dotenv
 import os
-from sqlalchemy import inspect
+import sqlite3
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_babel import Babel
 import click
 
+from .engines import engine_options
+from .replicas import RoutingSession
+
 load_dotenv()  # load .env
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 login_manager = LoginManager()
 login_manager.login_view = "auth.login"
-migrate = Migrate()
+# API clients get 401 instead of a redirect to the login form
+login_manager.blueprint_login_views["api"] = None
 babel = Babel()
 
-def create_app():
+@event.listens_for(Engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite only enforces foreign keys (and ON DELETE CASCADE) when asked, per connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+class _MigrateCommand(click.Command):
+    # `flask db`, loading Flask-Migrate (and with it alembic, mako and
+    # pygments) only when it runs instead of in every web worker
+    def make_context(self, info_name, args, parent=None, **extra):
+        from flask.cli import ScriptInfo
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as group
+
+        app = parent.ensure_object(ScriptInfo).load_app()
+        if "migrate" not in app.extensions:
+            Migrate(app, db)
+        return group.make_context(info_name, args, parent=parent, **extra)
+
+def create_app(config=None):
     app = Flask(__name__)
     app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY", "devkey")
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["DB_POOL_SIZE"] = int(os.environ.get("DB_POOL_SIZE", 5))
+    app.config["DB_MAX_OVERFLOW"] = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+    app.config["DB_POOL_TIMEOUT"] = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+    app.config["DB_POOL_RECYCLE"] = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    app.config["DB_POOL_PRE_PING"] = os.environ.get("DB_POOL_PRE_PING", "1") == "1"
+    app.config["DB_STATEMENT_TIMEOUT_MS"] = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 0))
+    app.config["DATABASE_REPLICA_URLS"] = [
+        url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+    ]
+    app.config["REPLICA_CHECK_INTERVAL"] = float(os.environ.get("REPLICA_CHECK_INTERVAL", 5))
+    app.config["REPLICA_MAX_LAG"] = float(os.environ.get("REPLICA_MAX_LAG", 10))
+    app.config["REPLICA_READ_YOUR_WRITES"] = float(os.environ.get("REPLICA_READ_YOUR_WRITES", 5))
     app.config['BABEL_DEFAULT_LOCALE'] = 'en'
     app.config['BABEL_SUPPORTED_LOCALES'] = ['en', 'sk']  # English and Slovak
+    app.config["ACTIVITIES_PAGE_SIZE"] = int(os.environ.get("ACTIVITIES_PAGE_SIZE", 50))
+    app.config["ACTIVITIES_MAX_PAGE_SIZE"] = int(os.environ.get("ACTIVITIES_MAX_PAGE_SIZE", 500))
+    app.config["IMPORT_CHUNK_SIZE"] = int(os.environ.get("IMPORT_CHUNK_SIZE", 5000))
+    app.config["IMPORT_BATCH_SIZE"] = int(os.environ.get("IMPORT_BATCH_SIZE", 1000))
+    app.config["IMPORT_SPOOL_DIR"] = os.environ.get("IMPORT_SPOOL_DIR")
+    app.config["IMPORT_JOB_STALE_AFTER"] = int(os.environ.get("IMPORT_JOB_STALE_AFTER", 600))
+    app.config["LIVE_POLL_INTERVAL"] = float(os.environ.get("LIVE_POLL_INTERVAL", 1.0))
+    app.config["LIVE_MAX_SECONDS"] = float(os.environ.get("LIVE_MAX_SECONDS", 55))
+    app.config["LIVE_MAX_EVENTS"] = int(os.environ.get("LIVE_MAX_EVENTS", 200))
+    app.config["LIVE_MAX_STREAMS"] = int(os.environ.get("LIVE_MAX_STREAMS", 4))
+    app.config["API_PAGE_SIZE"] = int(os.environ.get("API_PAGE_SIZE", 100))
+    app.config["API_MAX_PAGE_SIZE"] = int(os.environ.get("API_MAX_PAGE_SIZE", 1000))
+    app.config["API_GZIP_MIN_BYTES"] = int(os.environ.get("API_GZIP_MIN_BYTES", 1024))
+    app.config["API_GZIP_LEVEL"] = int(os.environ.get("API_GZIP_LEVEL", 6))
+    app.config["CHANGES_PAGE_SIZE"] = int(os.environ.get("CHANGES_PAGE_SIZE", 10000))
+    app.config["SEARCH_RESULT_LIMIT"] = int(os.environ.get("SEARCH_RESULT_LIMIT", 50))
+    app.config["AUTOCOMPLETE_LIMIT"] = int(os.environ.get("AUTOCOMPLETE_LIMIT", 20))
+    app.config["AUTOCOMPLETE_CHECK_INTERVAL"] = float(os.environ.get("AUTOCOMPLETE_CHECK_INTERVAL", 2.0))
+    app.config["CACHE_BACKEND"] = os.environ.get("CACHE_BACKEND", "sqlite")
+    app.config["CACHE_PATH"] = os.environ.get("CACHE_PATH")
+    app.config["DASHBOARD_CACHE_TTL"] = float(os.environ.get("DASHBOARD_CACHE_TTL", 30))
+    app.config["DASHBOARD_CACHE_SIZE"] = int(os.environ.get("DASHBOARD_CACHE_SIZE", 32))
+    app.config["FRAGMENT_CACHE_TTL"] = float(os.environ.get("FRAGMENT_CACHE_TTL", 3600))
+    app.config["FRAGMENT_CACHE_SIZE"] = int(os.environ.get("FRAGMENT_CACHE_SIZE", 5000))
+    app.config["JINJA_BYTECODE_CACHE"] = os.environ.get("JINJA_BYTECODE_CACHE", "1") == "1"
+    app.config["JINJA_BYTECODE_CACHE_DIR"] = os.environ.get("JINJA_BYTECODE_CACHE_DIR")
+    app.config["USER_CACHE_TTL"] = float(os.environ.get("USER_CACHE_TTL", 60))
+    app.config["USER_CACHE_SIZE"] = int(os.environ.get("USER_CACHE_SIZE", 1024))
+    app.config["LOGIN_THROTTLE"] = os.environ.get("LOGIN_THROTTLE", "1") == "1"
+    app.config["LOGIN_IP_BURST"] = int(os.environ.get("LOGIN_IP_BURST", 20))
+    app.config["LOGIN_IP_PER_MINUTE"] = float(os.environ.get("LOGIN_IP_PER_MINUTE", 30))
+    app.config["LOGIN_USER_BURST"] = int(os.environ.get("LOGIN_USER_BURST", 10))
+    app.config["LOGIN_USER_PER_MINUTE"] = float(os.environ.get("LOGIN_USER_PER_MINUTE", 5))
+    app.config["THROTTLE_BACKEND"] = os.environ.get("THROTTLE_BACKEND", "sqlite")
+    app.config["THROTTLE_PATH"] = os.environ.get("THROTTLE_PATH")
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD")
+    app.config["PROXY_FIX_X_FOR"] = int(os.environ.get("PROXY_FIX_X_FOR", 0))
+    app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED", "1") == "1"
+    app.config["METRICS_DIR"] = os.environ.get("METRICS_DIR")
+    app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+    app.config["SLOW_QUERY_MS"] = float(os.environ.get("SLOW_QUERY_MS", 200))
+    app.config["N_PLUS_ONE_THRESHOLD"] = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 10))
+    if config:
+        app.config.update(config)
+    app.config.setdefault(
+        "SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config["SQLALCHEMY_DATABASE_URI"], app.config)
+    )
+
+    if app.config["PROXY_FIX_X_FOR"]:
+        # Behind a reverse proxy: take the client address (for login throttling) from X-Forwarded-For
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_X_FOR"])
 
     db.init_app(app)
     login_manager.init_app(app)
-    migrate.init_app(app, db)
+    app.cli.add_command(_MigrateCommand("db", help="Perform database migrations."))
     babel.init_app(app, default_locale="en", default_timezone="Europe/Bratislava")
 
     # Import models here to avoid circular imports
     from .models import User, Customer, Activity
 
-    # Flask-Login user loader
+    # Flask-Login user loader, served from the user cache
+    from .user_cache import init_user_cache, load_user as load_cached_user
+    init_user_cache(app)
+
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return load_cached_user(int(user_id))
     
+    from .autocomplete import init_autocomplete
+    init_autocomplete(app)
+
+    from .dashboard_cache import init_dashboard_cache
+    init_dashboard_cache(app)
+
+    from .fragments import init_fragments
+    init_fragments(app)
+
+    from .metrics import init_metrics
+    init_metrics(app)
+
+    from .replicas import init_replicas
+    init_replicas(app)
+
+    from .live import init_live
+    init_live(app)
+
+    from .throttle import init_throttle
+    init_throttle(app)
+
+    from .auth import init_password_hashing
+    init_password_hashing(app)
+
     # Blueprints
     from .auth import auth_bp
     app.register_blueprint(auth_bp, url_prefix="/auth")
@@ -44,9 +161,45 @@ def create_app():
     from .main import main_bp
     app.register_blueprint(main_bp)
 
+    from .api import api_bp
+    app.register_blueprint(api_bp, url_prefix="/api/v1")
+
     # Optional: Register translation CLI commands
     register_translation_commands(app)
 
+    from .search import register_search_commands
+    register_search_commands(app)
+
+    from .bench import register_bench_commands
+    register_bench_commands(app)
+
+    from .queryplans import register_plan_commands
+    register_plan_commands(app)
+
+    from .rollups import register_rollup_commands
+    register_rollup_commands(app)
+
+    from .analytics import register_analytics_commands
+    register_analytics_commands(app)
+
+    from .archive import register_archive_commands
+    register_archive_commands(app)
+
+    from .jobs import register_job_commands
+    register_job_commands(app)
+
+    from .changes import register_change_commands
+    register_change_commands(app)
+
+    from .replicas import register_replica_commands
+    register_replica_commands(app)
+
+    from .fragments import register_template_commands
+    register_template_commands(app)
+
+    from .throttle import register_throttle_commands
+    register_throttle_commands(app)
+
     return app
 
 def register_translation_commands(app):
@@ -0,0 +1,381 @@
+import sys
+from datetime import date, datetime, timedelta
+
+import click
+from sqlalchemy import Date, and_, bindparam, cast, delete, event, func, insert, select, update
+
+from . import db
+from .archive import all_activities, reaches
+from .models import Activity, ArchivedActivity, Customer, MonthlyActivityStats, User
+from .rollups import old_value
+
+# Revenue and activity counts per day, week or month, optionally split by
+# customer or creator. Whole months come from the activity_monthly summary
+# (one row per month, customer and creator, kept up to date like the customer
+# rollups), so long historical ranges cost the same whatever the number of
+# activities; days, weeks and the partial months at the edges of a range are
+# grouped from the activities table. Either way the GROUP BY runs in SQL and
+# the results are combined as DataFrames.
+
+monthly = MonthlyActivityStats.__table__
+activities = Activity.__table__
+archived = ArchivedActivity.__table__
+
+GRANULARITIES = ("day", "week", "month")
+GROUPINGS = ("customer", "creator")
+# pandas frequency of each granularity's bucket starts
+FREQUENCIES = {"day": "D", "week": "W-MON", "month": "MS"}
+# Longest series a request may ask for
+MAX_BUCKETS = 1000
+# Summary rows whose revenue differs by more than this are reported as drift
+REVENUE_TOLERANCE = 0.005
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def bucket_start(value, granularity):
+    """First day of the day, week (Monday) or month ``value`` falls in."""
+    day = value.date() if isinstance(value, datetime) else value
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return month_start(day)
+    return day
+
+
+def bucket(column, granularity, dialect):
+    """SQL expression truncating the timestamp ``column`` to its bucket start."""
+    if dialect == "postgresql":
+        return func.date_trunc(granularity, column)
+    # SQLite: ISO date strings
+    if granularity == "day":
+        return func.date(column)
+    if granularity == "week":
+        return func.date(column, "weekday 0", "-6 days")
+    return func.strftime("%Y-%m-01", column)
+
+
+def _month_column(column, dialect):
+    expression = bucket(column, "month", dialect)
+    # SQLite keeps dates as ISO text already; CAST would make a number of it
+    return cast(expression, Date) if dialect == "postgresql" else expression
+
+
+def _as_date(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+# -- maintenance -------------------------------------------------------------
+
+def _ensure_rows(connection, keys):
+    rows = [
+        {"month": month, "customer_id": customer_id, "creator_id": creator_id, "activity_count": 0, "revenue": 0.0}
+        for month, customer_id, creator_id in keys
+    ]
+    if not rows:
+        return
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        for row in rows:
+            if connection.execute(select(monthly.c.month).where(
+                monthly.c.month == row["month"],
+                monthly.c.customer_id == row["customer_id"],
+                monthly.c.creator_id == row["creator_id"],
+            )).first() is None:
+                connection.execute(insert(monthly), row)
+        return
+    connection.execute(
+        dialect_insert(monthly).on_conflict_do_nothing(index_elements=["month", "customer_id", "creator_id"]),
+        rows
+    )
+
+
+def apply_deltas(connection, deltas):
+    """Apply ``{(month, customer_id, creator_id): [count, revenue]}`` to the summary rows."""
+    deltas = {key: value for key, value in deltas.items() if value[0] or value[1]}
+    if not deltas:
+        return
+    _ensure_rows(connection, [key for key, (count, _) in deltas.items() if count > 0])
+    key_matches = and_(
+        monthly.c.month == bindparam("b_month", type_=monthly.c.month.type),
+        monthly.c.customer_id == bindparam("b_customer"),
+        monthly.c.creator_id == bindparam("b_creator"),
+    )
+    params = [
+        {"b_month": month, "b_customer": customer_id, "b_creator": creator_id, "b_count": count, "b_revenue": revenue}
+        for (month, customer_id, creator_id), (count, revenue) in deltas.items()
+    ]
+    connection.execute(
+        update(monthly).where(key_matches).values(
+            activity_count=monthly.c.activity_count + bindparam("b_count"),
+            revenue=monthly.c.revenue + bindparam("b_revenue"),
+        ),
+        params
+    )
+    emptied = [row for row in params if row["b_count"] < 0]
+    if emptied:
+        connection.execute(
+            delete(monthly).where(key_matches, monthly.c.activity_count <= 0),
+            [{"b_month": row["b_month"], "b_customer": row["b_customer"], "b_creator": row["b_creator"]}
+             for row in emptied]
+        )
+
+
+def _totals_to_deltas(totals, sign):
+    deltas = {}
+    for month, customer_id, creator_id, count, revenue in totals:
+        entry = deltas.setdefault((_as_date(month), customer_id, creator_id), [0, 0.0])
+        entry[0] += sign * count
+        entry[1] += sign * (revenue or 0.0)
+    return deltas
+
+
+def add_totals(connection, totals):
+    """Add bulk-inserted activities, given as ``(month, customer_id, creator_id, count, revenue)`` rows."""
+    apply_deltas(connection, _totals_to_deltas(totals, 1))
+
+
+def remove_totals(connection, totals):
+    """Subtract bulk-deleted activities, given like :func:`add_totals`."""
+    apply_deltas(connection, _totals_to_deltas(totals, -1))
+
+
+def _after_flush(session, flush_context):
+    deleted_customers = {obj.id for obj in session.deleted if isinstance(obj, Customer)}
+    deltas = {}
+
+    def change(customer_id, creator_id, timestamp, price, sign):
+        entry = deltas.setdefault((month_start(timestamp), customer_id, creator_id), [0, 0.0])
+        entry[0] += sign
+        entry[1] += sign * (price or 0.0)
+
+    for obj in session.new:
+        if isinstance(obj, Activity):
+            change(obj.customer_id, obj.creator_id, obj.timestamp, obj.price, 1)
+
+    fields = ("customer_id", "creator_id", "timestamp", "price")
+    for obj in session.deleted:
+        if isinstance(obj, Activity) and obj.customer_id not in deleted_customers:
+            change(*(old_value(obj, field) for field in fields), -1)
+
+    for obj in session.dirty:
+        if not isinstance(obj, Activity) or obj in session.deleted:
+            continue
+        old = [old_value(obj, field) for field in fields]
+        if old == [getattr(obj, field) for field in fields]:
+            continue
+        if old[0] not in deleted_customers:
+            change(*old, -1)
+        change(obj.customer_id, obj.creator_id, obj.timestamp, obj.price, 1)
+
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+event.listen(db.session, "after_flush", _after_flush)
+
+
+def _actual_totals(dialect):
+    # Archived activities count too
+    rows = all_activities("customer_id", "creator_id", "price", "timestamp")
+    month = _month_column(rows.c.timestamp, dialect)
+    return (
+        select(
+            month.label("month"),
+            rows.c.customer_id,
+            rows.c.creator_id,
+            func.count().label("activity_count"),
+            func.coalesce(func.sum(rows.c.price), 0.0).label("revenue"),
+        )
+        .group_by(month, rows.c.customer_id, rows.c.creator_id)
+    )
+
+
+def rebuild(connection):
+    """Recompute the monthly summary from the activities and archive tables."""
+    connection.execute(delete(monthly))
+    connection.execute(
+        insert(monthly).from_select(
+            ["month", "customer_id", "creator_id", "activity_count", "revenue"],
+            _actual_totals(connection.dialect.name)
+        )
+    )
+
+
+def verify(connection):
+    """Return ``(month, customer_id, creator_id, stored, actual)`` for every summary row that drifted."""
+    key = ["month", "customer_id", "creator_id"]
+    stored = _frame(connection.execute(select(
+        monthly.c.month, monthly.c.customer_id, monthly.c.creator_id, monthly.c.activity_count, monthly.c.revenue
+    )).all(), key + ["activity_count", "revenue"], "month")
+    actual = _frame(
+        connection.execute(_actual_totals(connection.dialect.name)).all(),
+        key + ["activity_count", "revenue"], "month"
+    )
+    both = stored.merge(actual, on=key, how="outer", suffixes=("", "_actual")).fillna(0)
+    drifted = both[
+        (both["activity_count"] != both["activity_count_actual"])
+        | ((both["revenue"] - both["revenue_actual"]).abs() > REVENUE_TOLERANCE)
+    ]
+    return [
+        (row.month.date(), int(row.customer_id), int(row.creator_id),
+         (int(row.activity_count), row.revenue), (int(row.activity_count_actual), row.revenue_actual))
+        for row in drifted.itertuples()
+    ]
+
+
+# -- queries -----------------------------------------------------------------
+
+def _frame(rows, columns, bucket_column="bucket"):
+    import pandas as pd
+
+    # Transposed first: building a DataFrame from Row objects goes cell by cell
+    frame = pd.DataFrame(dict(zip(columns, zip(*rows))) if rows else {name: [] for name in columns})
+    frame[bucket_column] = pd.to_datetime(frame[bucket_column].map(_as_date))
+    return frame
+
+
+def _from_monthly(first, stop, key):
+    # Whole months [first, stop) from the summary table
+    columns = [monthly.c.month.label("bucket")] + ([monthly.c[key]] if key else [])
+    return db.session.execute(
+        select(*columns, func.sum(monthly.c.activity_count), func.sum(monthly.c.revenue))
+        .where(monthly.c.month >= first, monthly.c.month < stop)
+        .group_by(*columns)
+    ).all()
+
+
+def _from_activities(start, stop, granularity, key):
+    # Activities with start <= timestamp < stop, grouped in SQL; the archive
+    # is grouped the same way when the range reaches back to it
+    first = datetime.combine(start, datetime.min.time())
+    tables = [activities] + ([archived] if reaches(first) else [])
+    rows = []
+    for table in tables:
+        expression = bucket(table.c.timestamp, granularity, db.session.get_bind().dialect.name).label("bucket")
+        columns = [expression] + ([table.c[key]] if key else [])
+        rows += db.session.execute(
+            select(*columns, func.count(), func.coalesce(func.sum(table.c.price), 0.0))
+            .where(table.c.timestamp >= first, table.c.timestamp < datetime.combine(stop, datetime.min.time()))
+            .group_by(*columns)
+        ).all()
+    return rows
+
+
+def _labels(key, ids):
+    if not ids:
+        return {}
+    column, label = (Customer.id, Customer.name) if key == "customer_id" else (User.id, User.username)
+    return dict(db.session.execute(select(column, label).where(column.in_(ids))).all())
+
+
+def summarize(start, end, granularity="month", group_by=None, top=10):
+    """Counts and revenue for activities from ``start`` to ``end`` (dates, inclusive).
+
+    Raises ValueError when the range holds more than ``MAX_BUCKETS`` buckets.
+
+    Returns a JSON-serialisable dict with the bucket start dates and one
+    series per group: the ``top`` customers or creators by revenue plus
+    "other" (key None) for the rest, or a single series without ``group_by``.
+    """
+    # pandas is only loaded by the workers that serve analytics (see "Startup" in the README)
+    import pandas as pd
+
+    key = f"{group_by}_id" if group_by else None
+    stop = end + timedelta(days=1)
+    buckets = pd.date_range(bucket_start(start, granularity), end, freq=FREQUENCIES[granularity])
+    if len(buckets) > MAX_BUCKETS:
+        raise ValueError(f"More than {MAX_BUCKETS} {granularity}s")
+
+    rows = []
+    if granularity == "month":
+        first_full = start if start.day == 1 else month_start(month_start(start) + timedelta(days=32))
+        last_full = month_start(stop)
+        if first_full < last_full:
+            rows += _from_monthly(first_full, last_full, key)
+            if start < first_full:
+                rows += _from_activities(start, first_full, granularity, key)
+            if last_full < stop:
+                rows += _from_activities(last_full, stop, granularity, key)
+        else:
+            rows += _from_activities(start, stop, granularity, key)
+    else:
+        rows += _from_activities(start, stop, granularity, key)
+
+    frame = _frame(rows, ["bucket"] + ([key] if key else []) + ["count", "revenue"])
+    if key:
+        by_group = frame.groupby(key)["revenue"].sum().sort_values(ascending=False)
+        leaders = by_group.index[:top].tolist()
+        frame[key] = frame[key].where(frame[key].isin(leaders), -1)
+    else:
+        leaders = []
+        frame["group"] = -1
+        key = "group"
+    table = (
+        frame.groupby(["bucket", key])[["count", "revenue"]].sum()
+        .unstack(key, fill_value=0)
+        .reindex(buckets, fill_value=0)
+    )
+
+    labels = _labels(key, leaders) if group_by else {}
+    series = []
+    for group in leaders + [-1]:
+        if ("count", group) not in table.columns:
+            continue
+        series.append({
+            "key": None if group == -1 else int(group),
+            "label": labels.get(group, str(group)) if group != -1 else None,
+            "count": table[("count", group)].astype(int).tolist(),
+            "revenue": table[("revenue", group)].round(2).tolist(),
+        })
+    return {
+        "granularity": granularity,
+        "group_by": group_by,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "buckets": [day.date().isoformat() for day in buckets],
+        "series": series,
+        "total_count": int(frame["count"].sum()),
+        "total_revenue": round(float(frame["revenue"].sum()), 2),
+    }
+
+
+def register_analytics_commands(app):
+    @app.cli.group()
+    def analytics():
+        """Monthly activity summary commands"""
+        pass
+
+    @analytics.command("rebuild")
+    def rebuild_command():
+        """Recompute the monthly summary from the activities table"""
+        with db.engine.begin() as connection:
+            rebuild(connection)
+        click.echo("Monthly activity summary rebuilt.")
+
+    @analytics.command("verify")
+    @click.option("--fix", is_flag=True, help="Rebuild the summary when drift is found")
+    def verify_command(fix):
+        """Compare the monthly summary with the activities table"""
+        with db.engine.begin() as connection:
+            drift = verify(connection)
+            for month, customer_id, creator_id, stored, expected in drift[:50]:
+                click.echo(f"{month} customer {customer_id} creator {creator_id}: stored {stored}, actual {expected}")
+            if drift and fix:
+                rebuild(connection)
+                click.echo(f"{len(drift)} drifted rows; summary rebuilt.")
+                return
+        if drift:
+            click.echo(f"{len(drift)} drifted rows.")
+            sys.exit(1)
+        click.echo("Monthly activity summary matches the activities table.")
@@ -0,0 +1,203 @@
+import gzip
+import hashlib
+import json
+
+from flask import Blueprint, Response, current_app, jsonify, request, url_for
+from flask_babel import gettext
+from flask_login import login_required
+from sqlalchemy import event
+from sqlalchemy.orm import attributes
+from werkzeug.exceptions import HTTPException
+
+from . import archive, changes, db, queries, versions
+from .models import Customer, CustomerStats, User
+from .replicas import replica_reads
+
+# Read-only JSON API, /api/v1. Lists are paged with opaque cursors
+# (?after=<next_cursor of the previous page>), ?fields= picks the fields, and
+# responses are gzipped for clients that accept it. Every response carries a
+# strong ETag built from the change feed counter, which moves with every
+# customer or activity write, the usernames counter (activities show their
+# creator's name) and the request: when If-None-Match matches, the answer is
+# 304 before any data is queried or serialized.
+
+api_bp = Blueprint("api", __name__)
+
+CUSTOMER_FIELDS = {
+    "id": Customer.id,
+    "name": Customer.name,
+    "email": Customer.email,
+    "phone": Customer.phone,
+    "address": Customer.address,
+    "created_at": Customer.created_at,
+    "updated_at": Customer.updated_at,
+    "activity_count": CustomerStats.activity_count,
+    "revenue": CustomerStats.revenue,
+    "last_activity_at": CustomerStats.last_activity_at,
+}
+CUSTOMER_DEFAULT_FIELDS = ("id", "name", "email", "phone", "address")
+STATS_FIELDS = {"activity_count", "revenue", "last_activity_at"}
+# Columns of queries.activity_rows(), as exposed here
+ACTIVITY_FIELDS = ("id", "customer_id", "customer_name", "text", "price", "timestamp", "creator_name")
+# Moved by username changes, which the change feed counter does not follow
+USERNAMES = "usernames"
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _value(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def _fields(allowed, default):
+    requested = request.args.get("fields")
+    if not requested:
+        return list(default)
+    fields = [name.strip() for name in requested.split(",") if name.strip()]
+    unknown = [name for name in fields if name not in allowed]
+    if unknown or not fields:
+        raise BadRequest(gettext("Unknown fields: %(fields)s. Available: %(available)s.",
+                                 fields=", ".join(unknown), available=", ".join(allowed)))
+    return list(dict.fromkeys(fields))
+
+
+def _limit():
+    config = current_app.config
+    limit = request.args.get("limit", config["API_PAGE_SIZE"], type=int)
+    return max(1, min(limit, config["API_MAX_PAGE_SIZE"]))
+
+
+def _etag(version, encoding):
+    # The same URL at the same counter value always serializes to the same bytes
+    key = "\n".join([request.endpoint, json.dumps(request.view_args, sort_keys=True),
+                     json.dumps(sorted(request.args.items(multi=True))), str(version)])
+    digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+    return f"{version}-{digest}" + ("-gzip" if encoding else "")
+
+
+def _page(items, next_cursor):
+    payload = {"items": items, "next_cursor": next_cursor, "next": None}
+    if next_cursor is not None:
+        payload["next"] = url_for(
+            request.endpoint, **request.view_args, **{**request.args.to_dict(), "after": next_cursor}
+        )
+    return payload
+
+
+def conditional(build):
+    """Answer with ``build()`` as JSON, or 304 when the client's ETag is current."""
+    counters = versions.current_many(db.session.connection(), (changes.COUNTER, USERNAMES))
+    version = f"{counters[changes.COUNTER]}.{counters[USERNAMES]}"
+    encoding = "gzip" if request.accept_encodings["gzip"] else None
+    etag = _etag(version, encoding)
+    headers = {"Cache-Control": "private, no-cache", "Vary": "Accept-Encoding, Cookie"}
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+    try:
+        payload = build()
+    except BadRequest as error:
+        return jsonify({"error": str(error)}), 400
+    body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode()
+    if encoding and len(body) < current_app.config["API_GZIP_MIN_BYTES"]:
+        # Too small to be worth it; the ETag must name the bytes actually sent
+        encoding = None
+        etag = _etag(version, encoding)
+    if encoding:
+        body = gzip.compress(body, compresslevel=current_app.config["API_GZIP_LEVEL"], mtime=0)
+        headers["Content-Encoding"] = "gzip"
+    response = Response(body, mimetype="application/json", headers=headers)
+    response.set_etag(etag)
+    return response
+
+
+@api_bp.errorhandler(HTTPException)
+def _http_error(error):
+    return jsonify({"error": error.description}), error.code
+
+
+@api_bp.route("/customers")
+@login_required
+@replica_reads
+def customers():
+    def build():
+        fields = _fields(CUSTOMER_FIELDS, CUSTOMER_DEFAULT_FIELDS)
+        limit = _limit()
+        after = request.args.get("after")
+        if after is not None:
+            try:
+                after = int(after)
+            except ValueError:
+                raise BadRequest(gettext("Invalid cursor."))
+        rows = db.session.execute(queries.customer_page(
+            [CUSTOMER_FIELDS[name] for name in fields], limit,
+            after=after,
+            with_stats=bool(STATS_FIELDS & set(fields)),
+        )).all()
+        # Column 0 is always the id, for the cursor
+        items = [{name: _value(value) for name, value in zip(fields, row[1:])} for row in rows[:limit]]
+        return _page(items, str(rows[limit - 1][0]) if len(rows) > limit else None)
+    return conditional(build)
+
+
+def _activities(customer_id=None):
+    fields = _fields(ACTIVITY_FIELDS, ACTIVITY_FIELDS)
+    limit = _limit()
+    after = queries.decode_cursor(request.args.get("after"))
+    if request.args.get("after") and after is None:
+        raise BadRequest(gettext("Invalid cursor."))
+    filters = {
+        "customer_id": customer_id or request.args.get("customer_id", type=int),
+        "text": request.args.get("text", type=str),
+        "start_date": request.args.get("start_date"),
+        "end_date": request.args.get("end_date"),
+    }
+    try:
+        rows = archive.activity_page(filters, limit, after=after)
+    except ValueError:
+        raise BadRequest(gettext("Dates must be YYYY-MM-DD."))
+    items = [{name: _value(getattr(row, name)) for name in fields} for row in rows[:limit]]
+    last = rows[limit - 1] if len(rows) > limit else None
+    return _page(items, queries.encode_cursor(last.timestamp, last.id) if last else None)
+
+
+@api_bp.route("/activities")
+@login_required
+@replica_reads
+def activities():
+    return conditional(_activities)
+
+
+@api_bp.route("/customers/<int:customer_id>/activities")
+@login_required
+@replica_reads
+def customer_activities(customer_id):
+    def build():
+        # Inside build: a 304 for a known page needs no lookup
+        db.get_or_404(Customer, customer_id, description=gettext("No such customer."))
+        return _activities(customer_id)
+    return conditional(build)
+
+
+def _after_flush(session, flush_context):
+    if any(isinstance(obj, User) and attributes.get_history(obj, "username").has_changes()
+           for obj in session.dirty):
+        session.info["usernames_changed"] = True
+
+
+def _before_commit(session):
+    session.flush()
+    if session.info.pop("usernames_changed", False):
+        versions.bump(session.connection(), USERNAMES)
+
+
+def _after_rollback(session):
+    session.info.pop("usernames_changed", None)
+
+
+event.listen(db.session, "after_flush", _after_flush)
+event.listen(db.session, "before_commit", _before_commit)
+event.listen(db.session, "after_rollback", _after_rollback)
@@ -0,0 +1,153 @@
+import heapq
+import sys
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import delete, func, insert, literal, select, union_all
+
+from . import db, queries
+from .models import Activity, ArchivedActivity
+
+# Old activities live in activities_archive once `flask archive move` has
+# moved them there, so the activities table and its indexes stay the size of
+# the recent data everyone works with. Reads consult the archive only when
+# they reach back past the newest archived timestamp: a page of /activities
+# that is complete with newer rows, or a date filter starting after that
+# point, never touches it. Customer rollups and the monthly summary keep
+# counting archived activities; archived rows cannot be edited, only deleted
+# (with their customer or by /activities/bulk_delete).
+
+live = Activity.__table__
+archive = ArchivedActivity.__table__
+COLUMNS = [column.name for column in live.columns]
+
+# Activities moved (and committed) per round
+MOVE_BATCH_SIZE = 1000
+
+
+def newest():
+    """Timestamp of the newest archived activity, None while the archive is empty."""
+    return db.session.execute(select(func.max(ArchivedActivity.timestamp))).scalar()
+
+
+def reaches(start):
+    """Whether a range starting at ``start`` (None: unbounded) may include archived activities."""
+    boundary = newest()
+    return boundary is not None and (start is None or start <= boundary)
+
+
+def all_activities(*columns):
+    """Union of ``columns`` (names) from the activities and the archive tables, as a subquery."""
+    return union_all(
+        select(*(live.c[name] for name in columns)),
+        select(*(archive.c[name] for name in columns)),
+    ).subquery()
+
+
+def _start(filters):
+    start_date = filters.get("start_date")
+    return datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
+
+
+def activity_page(filters, limit, after=None, before=None):
+    """Rows for one /activities page (see :func:`queries.keyset_page`), archived ones included
+    only when the page reaches back past the newest archived activity."""
+    def page(model):
+        stmt = queries.filter_activities(queries.activity_rows(model), **filters, model=model)
+        return db.session.execute(queries.keyset_page(stmt, limit, after=after, before=before, model=model)).all()
+
+    rows = page(Activity)
+    boundary = newest()
+    if boundary is None:
+        return rows
+    start = _start(filters)
+    if start is not None and start > boundary:
+        return rows
+    if before:
+        # Rows newer than the cursor; the archive holds nothing newer than boundary
+        if before[0] > boundary:
+            return rows
+    elif len(rows) > limit and rows[-1].timestamp > boundary:
+        # A full page that ends above the archive
+        return rows
+    merged = sorted(rows + page(ArchivedActivity), key=lambda row: (row.timestamp, row.id), reverse=not before)
+    return merged[:limit + 1]
+
+
+def count(customer_id):
+    """Number of archived activities of one customer."""
+    return db.session.execute(
+        select(func.count()).select_from(archive).where(archive.c.customer_id == customer_id)
+    ).scalar()
+
+
+def export_rows(build, filters, order_by="id"):
+    """Execute ``build(model)`` for the live table, and for the archive when ``filters``
+    reach back that far; rows of both come out merged in ``order_by`` order."""
+    rows = db.session.execute(build(Activity))
+    if not reaches(_start(filters)):
+        return rows
+    archived = db.session.execute(build(ArchivedActivity))
+    return heapq.merge(archived, rows, key=lambda row: getattr(row, order_by))
+
+
+def move(cutoff, batch_size=MOVE_BATCH_SIZE):
+    """Move activities older than ``cutoff`` into the archive, committing each batch.
+
+    Returns the number of activities moved. Rollups, the monthly summary and
+    the change feed count archived activities too, so nothing else changes.
+    """
+    moved = 0
+    while True:
+        ids = db.session.execute(
+            select(live.c.id).where(live.c.timestamp < cutoff)
+            .order_by(live.c.timestamp, live.c.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        db.session.execute(insert(archive).from_select(
+            COLUMNS + ["archived_at"],
+            select(*(live.c[name] for name in COLUMNS), literal(datetime.utcnow())).where(live.c.id.in_(ids))
+        ))
+        db.session.execute(delete(live).where(live.c.id.in_(ids)))
+        db.session.commit()
+        moved += len(ids)
+    return moved
+
+
+def register_archive_commands(app):
+    # Not named archive: that is the table the commands query
+    @app.cli.group("archive")
+    def archive_group():
+        """Activity archive commands"""
+        pass
+
+    @archive_group.command("move")
+    @click.option("--before", "before", default=None, help="Move activities older than this date (YYYY-MM-DD)")
+    @click.option("--older-than-days", default=None, type=int, help="Move activities older than this many days")
+    @click.option("--batch-size", default=MOVE_BATCH_SIZE, help="Activities moved per transaction")
+    def move_command(before, older_than_days, batch_size):
+        """Move old activities into the archive table"""
+        if (before is None) == (older_than_days is None):
+            click.echo("Give either --before or --older-than-days.")
+            sys.exit(1)
+        if before:
+            try:
+                cutoff = datetime.strptime(before, "%Y-%m-%d")
+            except ValueError:
+                click.echo("--before must be YYYY-MM-DD.")
+                sys.exit(1)
+        else:
+            cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        moved = move(cutoff, batch_size)
+        click.echo(f"Moved {moved} activities older than {cutoff:%Y-%m-%d %H:%M} to the archive.")
+
+    @archive_group.command("status")
+    def status_command():
+        """Show how many activities are live and archived"""
+        live_count = db.session.execute(select(func.count()).select_from(live)).scalar()
+        archived_count = db.session.execute(select(func.count()).select_from(archive)).scalar()
+        boundary = newest()
+        click.echo(f"{live_count} live activities, {archived_count} archived.")
+        if boundary:
+            click.echo(f"Newest archived activity: {boundary:%Y-%m-%d %H:%M}.")
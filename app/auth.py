@@ -2,12 +2,26 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from .models import User, db
 from flask_login import login_user, logout_user, login_required
 from werkzeug.security import generate_password_hash, check_password_hash
+import math
+
+from . import throttle
 
 auth_bp = Blueprint("auth", __name__)
 
+
+def _throttled(template, wait):
+    # Answered before any lookup or hashing, so a flood costs next to no CPU
+    seconds = math.ceil(wait)
+    flash(f"Too many attempts. Try again in {seconds} seconds.")
+    return render_template(template), 429, {"Retry-After": str(seconds)}
+
+
 @auth_bp.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
+        wait = throttle.attempt()
+        if wait:
+            return _throttled("register.html", wait)
         username = request.form["username"]
         email = request.form["email"]
         password = request.form["password"]
@@ -29,8 +43,17 @@ def register():
 @auth_bp.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
-        user = User.query.filter_by(username=request.form["username"]).first()
+        username = request.form["username"]
+        wait = throttle.attempt(username)
+        if wait:
+            return _throttled("login.html", wait)
+        user = User.query.filter_by(username=username).first()
         if user and user.check_password(request.form["password"]):
+            throttle.succeeded(username)
+            if user.password_needs_rehash():
+                # PASSWORD_HASH_METHOD changed; move the account to the new cost
+                user.set_password(request.form["password"])
+                db.session.commit()
             login_user(user)
             return redirect(url_for("main.dashboard"))
         flash("Invalid credentials")
@@ -42,3 +65,11 @@ def login():
 def logout():
     logout_user()
     return redirect(url_for("auth.login"))
+
+
+def init_password_hashing(app):
+    method = app.config["PASSWORD_HASH_METHOD"]
+    if method:
+        # Store the method as werkzeug writes it into hashes ("scrypt" becomes
+        # "scrypt:32768:8:1"), so stored hashes compare equal; a bad value fails here
+        app.config["PASSWORD_HASH_METHOD"] = generate_password_hash("", method=method).split("$", 1)[0]
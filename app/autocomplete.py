@@ -0,0 +1,220 @@
+import heapq
+import threading
+import time
+from array import array
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import attributes
+
+from . import db, versions
+from .models import Customer
+
+VERSION_NAME = "customers"
+
+
+def _trigrams(value):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class CustomerIndex:
+    """Per-worker typeahead index over customer name, email, phone and address.
+
+    Built lazily from one query, then kept current by ``apply()`` after each
+    committed customer write in this worker. Writes made by other workers are
+    noticed through the ``customers`` data version, checked at most every
+    ``check_interval`` seconds, and trigger a rebuild.
+    """
+
+    def __init__(self, check_interval=2.0):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self._records = {}    # id -> (name, email, phone, address, haystack)
+        self._postings = {}   # trigram -> array of the ids whose haystack has it
+        self._ids = array("i")  # every indexed id
+        self.builds = 0
+
+    # -- maintenance ------------------------------------------------------
+
+    @staticmethod
+    def _add(records, postings, ids, row):
+        customer_id, name, email = row[0], row[1], row[2]
+        phone, address = row[3] or "", row[4] or ""
+        haystack = "\n".join((name, email, phone, address)).lower()
+        old = records.get(customer_id)
+        if old is None:
+            ids.append(customer_id)
+            old_grams = set()
+        else:
+            old_grams = _trigrams(old[4])
+        new_grams = _trigrams(haystack)
+        records[customer_id] = (name, email, phone, address, haystack)
+        CustomerIndex._remove_postings(postings, customer_id, old_grams - new_grams)
+        for gram in new_grams - old_grams:
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array("i")
+            posting.append(customer_id)
+
+    @staticmethod
+    def _remove_postings(postings, customer_id, grams):
+        # Replaced rather than edited in place: a concurrent search may be
+        # iterating over the old array
+        for gram in grams:
+            remaining = array("i", (other for other in postings[gram] if other != customer_id))
+            if remaining:
+                postings[gram] = remaining
+            else:
+                del postings[gram]
+
+    def _rebuild(self):
+        with self._lock:
+            version = versions.current(db.session.connection(), VERSION_NAME)
+            rows = db.session.execute(
+                select(Customer.id, Customer.name, Customer.email, Customer.phone, Customer.address)
+                .order_by(Customer.id)
+            ).all()
+            records, postings, ids = {}, {}, array("i")
+            for row in rows:
+                self._add(records, postings, ids, row)
+            # Swap everything at once so concurrent readers see a consistent index
+            self._records, self._postings, self._ids = records, postings, ids
+            self._version = version
+            self._checked_at = time.monotonic()
+            self.builds += 1
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        latest = versions.current(db.session.connection(), VERSION_NAME)
+        self._checked_at = now
+        if latest != self._version:
+            self._rebuild()
+
+    def apply(self, version, steps):
+        """Apply a committed transaction that moved the data version to ``version``.
+
+        ``steps`` are its ``(upserts, deletes)`` in flush order; None stands
+        for rows that are not known here, which leaves a resync to the next
+        lookup.
+        """
+        with self._lock:
+            if self._version is None or version <= self._version:
+                return
+            if version != self._version + 1 or None in steps:
+                # Another worker committed in between; resync on the next lookup
+                self._checked_at = 0.0
+                return
+            for upserts, deletes in steps:
+                for customer_id in deletes:
+                    record = self._records.pop(customer_id, None)
+                    if record is not None:
+                        self._remove_postings(self._postings, customer_id, _trigrams(record[4]))
+                        self._ids = array("i", (other for other in self._ids if other != customer_id))
+                for row in upserts:
+                    self._add(self._records, self._postings, self._ids, row)
+            self._version = version
+
+    # -- lookup -----------------------------------------------------------
+
+    def search(self, query, limit):
+        """Return up to ``limit`` ``(id, name, email, phone, address)`` rows
+        containing ``query``: names starting with it first, then names
+        containing it, then matches in the other fields, each by name."""
+        self._ensure_fresh()
+        query = query.lower()
+        records = self._records
+
+        if len(query) >= 3:
+            # Only customers in the rarest trigram's posting list can match
+            postings = [self._postings.get(gram) for gram in _trigrams(query)]
+            if any(posting is None for posting in postings):
+                return []
+            source = min(postings, key=len)
+        else:
+            source = self._ids
+
+        def rank(customer_id, name):
+            name = name.lower()
+            position = name.find(query)
+            return (0 if position == 0 else 1 if position > 0 else 2), name, customer_id
+
+        # Every candidate is ranked before the list is cut to ``limit``
+        def candidates():
+            for customer_id in source:
+                record = records.get(customer_id)
+                # A trigram match is not yet a substring match
+                if record is not None and query in record[4]:
+                    yield rank(customer_id, record[0]), customer_id, record
+
+        return [(customer_id,) + record[:4] for _, customer_id, record in heapq.nsmallest(limit, candidates())]
+
+
+def get_index():
+    return current_app.extensions["customer_index"]
+
+
+def _snapshot(customer):
+    return (customer.id, customer.name, customer.email, customer.phone, customer.address)
+
+
+def record_change(session, upserts=(), deletes=(), rows_known=True):
+    """Queue a customer change for the local index; the customers version is
+    bumped once, when the session's transaction commits.
+
+    With ``rows_known=False`` other workers and this one resync instead.
+    """
+    step = (list(upserts), list(deletes)) if rows_known else None
+    session.info.setdefault("customer_index", []).append(step)
+
+
+def _after_flush(session, flush_context):
+    upserts = [
+        _snapshot(obj) for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, Customer) and (
+            obj in session.new or any(
+                attributes.get_history(obj, field).has_changes()
+                for field in ("name", "email", "phone", "address")
+            )
+        )
+    ]
+    deletes = [obj.id for obj in session.deleted if isinstance(obj, Customer)]
+    if upserts or deletes:
+        record_change(session, upserts, deletes)
+
+
+def _before_commit(session):
+    # Bumped here rather than at the first flush: the version row lock then
+    # lasts only for the commit, not for a whole import chunk
+    session.flush()
+    if session.info.get("customer_index"):
+        session.info["customer_index_version"] = versions.bump(session.connection(), VERSION_NAME)
+
+
+def _after_commit(session):
+    steps = session.info.pop("customer_index", None)
+    version = session.info.pop("customer_index_version", None)
+    if not steps or version is None:
+        return
+    index = current_app.extensions.get("customer_index") if has_app_context() else None
+    if index is None:
+        return
+    index.apply(version, steps)
+
+
+def _after_rollback(session):
+    session.info.pop("customer_index", None)
+    session.info.pop("customer_index_version", None)
+
+
+def init_autocomplete(app):
+    app.extensions["customer_index"] = CustomerIndex(app.config["AUTOCOMPLETE_CHECK_INTERVAL"])
+
+
+event.listen(db.session, "after_flush", _after_flush)
+event.listen(db.session, "before_commit", _before_commit)
+event.listen(db.session, "after_commit", _after_commit)
+event.listen(db.session, "after_rollback", _after_rollback)
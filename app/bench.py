@@ -0,0 +1,465 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import click
+
+
+def register_bench_commands(app):
+    @app.cli.group()
+    def bench():
+        """Performance benchmarks"""
+        pass
+
+    @bench.command("import-customers")
+    @click.option("--rows", default=50000, help="Rows in the synthetic CSV")
+    @click.option("--existing", default=0.1, help="Share of rows whose email is already stored")
+    @click.option("--chunk-size", default=5000, help="Chunk size for the chunked importer")
+    @click.option("--database-url", default=None, help="Scratch database (default: temporary SQLite file)")
+    def import_customers_bench(rows, existing, chunk_size, database_url):
+        """Compare the chunked customer import with the per-row loop"""
+        csv_data, seeded = _customer_csv(rows, existing)
+
+        def legacy(scratch):
+            with scratch.test_request_context():
+                _legacy_import_customers(io.BytesIO(csv_data))
+
+        def chunked(scratch):
+            from .importers import import_customers, read_csv_chunks
+            with scratch.test_request_context():
+                import_customers(read_csv_chunks(io.BytesIO(csv_data), chunk_size))
+
+        for name, runner in (("per-row loop", legacy), ("chunked", chunked)):
+            with _scratch_app(database_url) as scratch:
+                _seed_customers(scratch, seeded)
+                started = time.perf_counter()
+                runner(scratch)
+                elapsed = time.perf_counter() - started
+            click.echo(f"{name:>14}: {rows} rows in {elapsed:.2f}s -> {rows / elapsed:,.0f} rows/s")
+
+    @bench.command("import-activities")
+    @click.option("--rows", default=50000, help="Rows in the synthetic CSV")
+    @click.option("--customers", default=2000, help="Customers to seed")
+    @click.option("--batch-size", default=1000, help="INSERT batch size for the vectorized importer")
+    @click.option("--database-url", default=None, help="Scratch database (default: temporary SQLite file)")
+    def import_activities_bench(rows, customers, batch_size, database_url):
+        """Compare the vectorized activity import with the per-row loop"""
+        csv_data = _activity_csv(rows, customers)
+
+        def legacy(scratch):
+            with scratch.test_request_context():
+                _legacy_import_activities(io.BytesIO(csv_data))
+
+        def vectorized(scratch):
+            from .importers import import_activities, read_csv_chunks
+            with scratch.test_request_context():
+                import_activities(read_csv_chunks(io.BytesIO(csv_data)), batch_size=batch_size)
+
+        for name, runner in (("per-row loop", legacy), ("vectorized", vectorized)):
+            with _scratch_app(database_url) as scratch:
+                _seed_customers(scratch, [f"customer{i}@example.com" for i in range(customers)])
+                _seed_users(scratch, ["alice", "bob", "carol"])
+                started = time.perf_counter()
+                runner(scratch)
+                elapsed = time.perf_counter() - started
+            click.echo(f"{name:>14}: {rows} rows in {elapsed:.2f}s -> {rows / elapsed:,.0f} rows/s")
+
+
+    @bench.command("seed")
+    @click.option("--users", default=5, help="Users to create")
+    @click.option("--customers", default=1000, help="Customers to create")
+    @click.option("--activities", default=20000, help="Activities to create")
+    @click.option("--days", default=730, help="Days of activity history")
+    @click.option("--seed", default=42, help="Random seed; the same seed gives the same data")
+    @click.option("--yes", is_flag=True, help="Do not ask for confirmation")
+    def seed_command(users, customers, activities, days, seed, yes):
+        """Add a reproducible synthetic dataset to the configured database"""
+        from . import db
+        from .loadbench import BENCH_PASSWORD, BENCH_USERNAME
+
+        url = db.engine.url.render_as_string(hide_password=True)
+        if not yes:
+            click.confirm(f"Add {customers} customers and {activities} activities to {url}?", abort=True)
+        started = time.perf_counter()
+        seed_dataset(users=users, customers=customers, activities=activities, seed=seed, days=days)
+        _ensure_bench_user(BENCH_USERNAME, BENCH_PASSWORD)
+        click.echo(f"Seeded {url} in {time.perf_counter() - started:.1f}s "
+                   f"(log in as {BENCH_USERNAME}/{BENCH_PASSWORD}).")
+
+    @bench.command("run")
+    @click.option("--scenario", "names", multiple=True, help="Scenario to run (repeatable; default: all)")
+    @click.option("--requests", default=50, help="Measured requests per scenario")
+    @click.option("--warmup", default=3, help="Unmeasured requests per scenario")
+    @click.option("--customers", default=5000, help="Customers in the scratch dataset")
+    @click.option("--activities", default=100000, help="Activities in the scratch dataset")
+    @click.option("--import-rows", default=1000, help="Rows per uploaded CSV in the import scenarios")
+    @click.option("--seed", default=42, help="Random seed for the dataset and the request mix")
+    @click.option("--database-url", default=None, help="Scratch database (default: temporary SQLite file)")
+    @click.option("--base-url", default=None,
+                  help="Benchmark a running server instead (uses the configured database, seeded with 'flask bench seed')")
+    @click.option("--username", default=None, help="Login for --base-url (default: the seeded bench user)")
+    @click.option("--password", default=None, help="Password for --base-url")
+    @click.option("--concurrency", default=1, help="Clients sending requests at the same time (needs --base-url)")
+    @click.option("--memory/--no-memory", default=True, help="Measure peak Python memory per scenario")
+    @click.option("--label", default=None, help="Name stored with the results")
+    @click.option("--output", type=click.Path(dir_okay=False), default=None, help="Write the results as JSON")
+    def run_command(names, requests, warmup, customers, activities, import_rows, seed,
+                    database_url, base_url, username, password, concurrency, memory, label, output):
+        """Drive the main routes and report latency, throughput, SQL counts and memory"""
+        from . import db, loadbench
+
+        if concurrency < 1:
+            raise click.UsageError("--concurrency must be at least 1")
+        if concurrency > 1 and not base_url:
+            raise click.UsageError("--concurrency needs a running server (--base-url)")
+
+        username = username or loadbench.BENCH_USERNAME
+        password = password or loadbench.BENCH_PASSWORD
+
+        def measure(target, ctx, counter, dialect):
+            available = loadbench.scenarios(ctx, username, password, import_rows)
+            unknown = set(names) - set(available)
+            if unknown:
+                raise click.UsageError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+            results = {
+                "label": label,
+                "target": target.name,
+                "concurrency": concurrency,
+                "database": dialect,
+                "dataset": {"customers": ctx["last_customer"] - ctx["first_customer"] + 1},
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "scenarios": {},
+            }
+            for name, (make_request, cap) in available.items():
+                if names and name not in names:
+                    continue
+                count = min(requests, cap) if cap else requests
+                click.echo(f"{name}: {count} requests...", err=True)
+                if concurrency > 1:
+                    results["scenarios"][name] = loadbench.run_concurrent(
+                        lambda: loadbench.HTTPTarget(base_url, username, password),
+                        make_request, count, min(warmup, count), seed, concurrency
+                    )
+                    continue
+                results["scenarios"][name] = loadbench.run_scenario(
+                    target, make_request, count, min(warmup, count), seed, counter,
+                    memory and counter is not None
+                )
+            results["max_rss_kib"] = loadbench.max_rss_kib() if counter else None
+            return results
+
+        if base_url:
+            ctx = loadbench.dataset_context()
+            target = loadbench.HTTPTarget(base_url, username, password)
+            results = measure(target, ctx, None, db.engine.dialect.name)
+        else:
+            with tempfile.TemporaryDirectory(prefix="kartoteka-bench-") as spool, \
+                    _scratch_app(database_url, {"IMPORT_SPOOL_DIR": spool}) as scratch, \
+                    scratch.app_context():
+                from .search import install_search
+
+                click.echo(f"Seeding {customers} customers and {activities} activities...", err=True)
+                seed_dataset(customers=customers, activities=activities, seed=seed)
+                _ensure_bench_user(username, password)
+                with db.engine.begin() as connection:
+                    install_search(connection)
+                db.session.execute(db.text("ANALYZE"))
+                db.session.commit()
+                ctx = loadbench.dataset_context()
+                counter = loadbench.QueryCounter(db.engine)
+                try:
+                    results = measure(loadbench.ClientTarget(scratch, username, password),
+                                      ctx, counter, db.engine.dialect.name)
+                finally:
+                    counter.close()
+                    db.session.remove()
+
+        click.echo(loadbench.format_results(results))
+        if results["max_rss_kib"]:
+            click.echo(f"max RSS: {results['max_rss_kib'] / 1024:.0f} MiB")
+        if output:
+            with open(output, "w") as handle:
+                json.dump(results, handle, indent=2)
+            click.echo(f"Results written to {output}")
+
+    @bench.command("compare")
+    @click.argument("baseline", type=click.Path(exists=True, dir_okay=False))
+    @click.argument("candidate", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--fail-over", default=None, type=float,
+                  help="Exit with status 1 if any p95 latency grows by more than this many percent")
+    def compare_command(baseline, candidate, fail_over):
+        """Compare two 'flask bench run --output' files"""
+        from . import loadbench
+
+        rows = loadbench.compare(loadbench.load(baseline), loadbench.load(candidate))
+        regressions = []
+        for name, metric, before, after, change in rows:
+            shown = "" if change is None else f"{change:+.1f}%"
+            click.echo(f"{name:<20}{metric:<22}{str(before):>12} -> {str(after):<12}{shown:>9}")
+            if fail_over is not None and metric == "p95_ms" and change is not None and change > fail_over:
+                regressions.append(name)
+        if regressions:
+            click.echo(f"p95 regressed by more than {fail_over}% in: {', '.join(regressions)}")
+            sys.exit(1)
+
+    @bench.command("startup")
+    @click.option("--workers", default=2, help="gunicorn workers to start")
+    @click.option("--requests", default=20, help="Pages requested before memory is measured")
+    @click.option("--mode", type=click.Choice(["both", "preload", "no-preload"]), default="both",
+                  help="Start gunicorn with the app preloaded, without, or both")
+    @click.option("--no-serve", is_flag=True, help="Only profile the import, do not start gunicorn")
+    @click.option("--output", default=None, type=click.Path(dir_okay=False), help="Write the results as JSON")
+    def startup_command(workers, requests, mode, no_serve, output):
+        """Measure import time and per-worker memory of a fresh start
+
+        Exits with status 1 when importing the app loads pandas, numpy or pyarrow.
+        """
+        from . import startup
+
+        profile = startup.import_profile()
+        results = {"import": profile, "serve": []}
+        click.echo(f"import wsgi: {profile['import_ms']} ms, peak RSS {profile['max_rss_mib']} MiB")
+        for name, ms in profile["packages_ms"].items():
+            click.echo(f"  {name:<24}{ms:>8} ms")
+        if not no_serve:
+            for preload in {"both": (True, False), "preload": (True,), "no-preload": (False,)}[mode]:
+                result = startup.serve_profile(workers, preload, requests)
+                results["serve"].append(result)
+                click.echo(
+                    f"gunicorn {'preload' if preload else 'no preload':<11} first page {result['first_response_s']}s, "
+                    f"warm {result['warm_s']}s"
+                )
+                if "worker_rss_mib" in result:
+                    click.echo(
+                        f"  master RSS {result['master_rss_mib']} MiB; per worker RSS {result['worker_rss_mib']}, "
+                        f"PSS {result['worker_pss_mib']}, private {result['worker_private_mib']} MiB; "
+                        f"total PSS {result['total_pss_mib']} MiB"
+                    )
+        if output:
+            with open(output, "w") as handle:
+                json.dump(results, handle, indent=2)
+            click.echo(f"Results written to {output}")
+        if profile["heavy_modules"]:
+            click.echo(f"Importing the app loaded {', '.join(profile['heavy_modules'])}; import them where they are used.")
+            sys.exit(1)
+
+
+def _ensure_bench_user(username, password):
+    from . import db
+    from .models import User
+
+    if not User.query.filter_by(username=username).first():
+        user = User(username=username, email=f"{username}@example.com")
+        user.set_password(password)
+        db.session.add(user)
+        db.session.commit()
+
+
+class _scratch_app:
+    # Fresh app + schema on a throwaway database so benchmarks never touch real data
+    def __init__(self, database_url=None, config=None):
+        self.database_url = database_url
+        self.config = config or {}
+        self.path = None
+
+    def __enter__(self):
+        from . import create_app, db
+
+        url = self.database_url
+        if not url:
+            handle, self.path = tempfile.mkstemp(suffix=".db", prefix="kartoteka-bench-")
+            os.close(handle)
+            url = f"sqlite:///{self.path}"
+        # The login scenario measures password hashing, not the throttle's 429s
+        self.app = create_app({
+            "LOGIN_THROTTLE": False, "THROTTLE_BACKEND": "memory",
+            **self.config, "SQLALCHEMY_DATABASE_URI": url,
+        })
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+        return self.app
+
+    def __exit__(self, *exc):
+        from . import db
+
+        with self.app.app_context():
+            db.session.remove()
+            if self.database_url:
+                db.drop_all()
+            db.engine.dispose()
+        if self.path:
+            os.remove(self.path)
+
+
+def seed_dataset(users=5, customers=1000, activities=20000, seed=42, days=730, batch_size=10000):
+    """Insert a reproducible synthetic dataset into the current app's database.
+
+    Activities favour recent dates, working days and office hours; prices are
+    log-normal; a few customers account for most of the activity.
+    """
+    import numpy as np
+
+    from . import analytics, autocomplete, changes, db, rollups, versions
+    from .models import Activity, Customer, User
+
+    rng = np.random.default_rng(seed)
+    first_user = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    first_customer = (db.session.query(db.func.max(Customer.id)).scalar() or 0) + 1
+
+    db.session.execute(User.__table__.insert(), [
+        {"id": first_user + i, "username": f"bench_user_{seed}_{first_user + i}",
+         "email": f"bench_user_{seed}_{first_user + i}@example.com", "password_hash": "-"}
+        for i in range(users)
+    ])
+    # Every commit below ends a transaction; each takes its own sequence number
+    change_seq = changes.next_seq(db.session)
+    for start in range(0, customers, batch_size):
+        ids = np.arange(first_customer + start, first_customer + min(start + batch_size, customers))
+        db.session.execute(Customer.__table__.insert(), [
+            {"id": int(i), "name": f"Customer {i}", "email": f"customer{i}.{seed}@example.com",
+             "phone": f"09{n:08d}", "address": f"Street {n % 5000}", "change_seq": change_seq}
+            for i, n in zip(ids, rng.integers(0, 10**8, len(ids)))
+        ])
+
+    now = np.datetime64("now", "s")
+    for start in range(0, activities, batch_size):
+        count = min(batch_size, activities - start)
+        # Zipf-like customer popularity, recency-weighted days, office hours
+        customer_ids = first_customer + (rng.zipf(1.3, count) - 1) % customers
+        creator_ids = rng.integers(first_user, first_user + users, count)
+        day = np.minimum(rng.exponential(days / 3, count), days - 1).astype("int64")
+        stamps = now - day.astype("timedelta64[D]")
+        stamps = stamps.astype("datetime64[D]") + rng.normal(13 * 3600, 2.5 * 3600, count).clip(0, 86399).astype("timedelta64[s]")
+        weekend = ((stamps.astype("datetime64[D]").astype("int64") + 3) % 7) >= 5  # 1970-01-01 was a Thursday
+        stamps[weekend] -= np.timedelta64(2, "D")
+        prices = rng.lognormal(3.5, 1.0, count).round(2)
+        change_seq = changes.next_seq(db.session)
+        db.session.execute(Activity.__table__.insert(), [
+            {"customer_id": int(c), "creator_id": int(u), "text": f"Activity {start + i}",
+             "price": float(p), "timestamp": t.astype("datetime64[us]").item(), "change_seq": change_seq}
+            for i, (c, u, p, t) in enumerate(zip(customer_ids, creator_ids, prices, stamps))
+        ])
+        db.session.commit()
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        # Explicit ids leave the serial sequences behind
+        for table in (User.__table__.name, Customer.__table__.name):
+            db.session.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+            ))
+    # Core inserts skip the session hooks; refresh what they would have maintained
+    rollups.rebuild(db.session.connection())
+    analytics.rebuild(db.session.connection())
+    versions.bump(db.session.connection(), autocomplete.VERSION_NAME)
+    db.session.commit()
+
+
+def _customer_csv(rows, existing_share):
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(42)
+    ids = np.arange(rows)
+    frame = pd.DataFrame({
+        "Name": [f"Customer {i}" for i in ids],
+        "Email": [f"customer{i}@example.com" for i in ids],
+        "Phone": [f"09{n:08d}" for n in rng.integers(0, 10**8, rows)],
+        "Address": [f"Street {n}" for n in rng.integers(1, 5000, rows)],
+    })
+    # A few blanks to exercise the placeholder generation
+    for column in ("Email", "Phone", "Address"):
+        frame.loc[rng.random(rows) < 0.02, column] = ""
+    seeded = frame.loc[(rng.random(rows) < existing_share) & (frame["Email"] != ""), "Email"].tolist()
+    return frame.to_csv(index=False).encode(), seeded
+
+
+def _seed_customers(app, emails):
+    from . import db
+    from .models import Customer
+
+    with app.app_context():
+        db.session.execute(
+            Customer.__table__.insert(),
+            [{"name": "Seeded", "email": email} for email in emails]
+        )
+        db.session.commit()
+
+
+def _activity_csv(rows, customers):
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(42)
+    start = np.datetime64("2023-01-01T00:00:00")
+    frame = pd.DataFrame({
+        "CustomerID": rng.integers(1, customers + 1, rows),
+        "Text": [f"Activity {i}" for i in range(rows)],
+        "Price": rng.lognormal(3, 1, rows).round(2),
+        "Creator": rng.choice(["alice", "bob", "carol"], rows),
+        "Timestamp": start + rng.integers(0, 365 * 24 * 3600, rows).astype("timedelta64[s]"),
+    })
+    return frame.to_csv(index=False).encode()
+
+
+def _seed_users(app, usernames):
+    from . import db
+    from .models import User
+
+    with app.app_context():
+        db.session.execute(
+            User.__table__.insert(),
+            [{"username": name, "email": f"{name}@example.com", "password_hash": "-"} for name in usernames]
+        )
+        db.session.commit()
+
+
+def _legacy_import_customers(source):
+    import pandas as pd
+
+    # The original per-row import loop, kept as the benchmark baseline
+    from . import db
+    from .models import Customer
+
+    df = pd.read_csv(source, dtype=str).fillna("")
+    for _, row in df.iterrows():
+        name = row.get("Name", "").strip() or "Unnamed Customer"
+        email = row.get("Email", "").strip()
+        phone = row.get("Phone", "").strip()
+        address = row.get("Address", "").strip()
+        if not email:
+            email = f"email_{uuid.uuid4().hex[:8]}@email.com"
+        if not phone:
+            phone = f"09XX-{uuid.uuid4().hex[:4]}"
+        if not address:
+            address = f"Unknown Address {uuid.uuid4().hex[:4]}"
+        if Customer.query.filter_by(email=email).first():
+            continue
+        db.session.add(Customer(name=name, email=email, phone=phone, address=address))
+    db.session.commit()
+
+
+def _legacy_import_activities(source):
+    import pandas as pd
+
+    # The original per-row import loop, kept as the benchmark baseline
+    from . import db
+    from .models import Activity, Customer, User
+
+    df = pd.read_csv(source)
+    for _, row in df.iterrows():
+        customer = db.session.get(Customer, int(row["CustomerID"]))
+        creator = User.query.filter_by(username=row["Creator"]).first()
+        if customer and creator:
+            db.session.add(Activity(
+                customer_id=customer.id,
+                text=row["Text"],
+                price=float(row.get("Price", 0.0)),
+                creator_id=creator.id,
+                timestamp=pd.to_datetime(row["Timestamp"])
+            ))
+    db.session.commit()
@@ -0,0 +1,232 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+# Seconds a SQLite entry's last use may lag behind; eviction order is that coarse
+TOUCH_INTERVAL = 30.0
+
+
+class MemoryBackend:
+    """In-process LRU store. Only sees invalidations made by this process."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires, value)
+        self._generation = 0
+
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl, generation):
+        with self._lock:
+            # An invalidation ran while the value was built; it may be stale
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def delete(self, key):
+        with self._lock:
+            # Also turns away a value for this key built before the delete
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """LRU store in a local SQLite file, shared by every worker on the host.
+
+    Entries are pickled and grouped by ``namespace``, so several caches can
+    share one file while being invalidated independently.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value BLOB NOT NULL,
+            expires REAL NOT NULL,
+            used REAL NOT NULL,
+            PRIMARY KEY (namespace, key)
+        );
+        CREATE INDEX IF NOT EXISTS ix_cache_entries_used ON cache_entries (namespace, used);
+        CREATE TABLE IF NOT EXISTS cache_generations (
+            namespace TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, path, namespace, max_entries):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread and per process (workers fork after import)
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(self.SCHEMA)
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    def generation(self):
+        row = self._connection().execute(
+            "SELECT generation FROM cache_generations WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get(self, key):
+        connection = self._connection()
+        now = time.time()
+        row = connection.execute(
+            "SELECT value, expires, used FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, repr(key))
+        ).fetchone()
+        if row is None or row[1] <= now:
+            return MISSING
+        if now - row[2] >= TOUCH_INTERVAL:
+            # A write per hit would make every cached read a write
+            connection.execute(
+                "UPDATE cache_entries SET used = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, repr(key))
+            )
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl, generation):
+        connection = self._connection()
+        now = time.time()
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if generation != self.generation():
+                return
+            connection.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires, used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, repr(key), payload, now + ttl, now)
+            )
+            connection.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache_entries WHERE namespace = ? "
+                "ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_entries)
+            )
+        finally:
+            connection.execute("COMMIT")
+
+    def invalidate(self):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT INTO cache_generations (namespace, generation) VALUES (?, 1) "
+                "ON CONFLICT (namespace) DO UPDATE SET generation = generation + 1",
+                (self.namespace,)
+            )
+            connection.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+        finally:
+            connection.execute("COMMIT")
+
+    def delete(self, key):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT INTO cache_generations (namespace, generation) VALUES (?, 1) "
+                "ON CONFLICT (namespace) DO UPDATE SET generation = generation + 1",
+                (self.namespace,)
+            )
+            connection.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, repr(key))
+            )
+        finally:
+            connection.execute("COMMIT")
+
+    def __len__(self):
+        return self._connection().execute(
+            "SELECT count(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+
+class Cache:
+    """Read-through cache over a backend, with a TTL ceiling and hit/miss counters."""
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_set(self, key, build):
+        if self.ttl <= 0:
+            return build()
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        # Read before building, so an invalidation during the build wins
+        generation = self.backend.generation()
+        value = build()
+        self.backend.set(key, value, self.ttl, generation)
+        return value
+
+    def invalidate(self):
+        self.backend.invalidate()
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "ttl": self.ttl,
+        }
+
+
+def make_cache(app, namespace, max_entries, ttl):
+    """Build a cache on the backend selected by ``CACHE_BACKEND`` (``memory`` or ``sqlite``)."""
+    kind = app.config["CACHE_BACKEND"]
+    if kind == "memory":
+        backend = MemoryBackend(max_entries)
+    elif kind == "sqlite":
+        path = app.config["CACHE_PATH"] or os.path.join(app.instance_path, "cache.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        backend = SQLiteBackend(path, namespace, max_entries)
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND: {kind!r}")
+    return Cache(backend, ttl)
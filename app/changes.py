@@ -0,0 +1,174 @@
+import heapq
+import secrets
+import sys
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import delete, event, insert, literal, select, union_all, update
+
+from . import db, versions
+from .models import Activity, ArchivedActivity, Customer, Tombstone
+
+# Change tracking for the delta exports. Every transaction that writes
+# customers or activities gets a sequence number from the "changes" counter,
+# stamped on the rows it writes (change_seq) and on tombstones for the rows
+# it deletes. Until commit those rows carry a provisional marker unique to
+# the transaction (a negative number, below every watermark); just before
+# commit the counter is bumped and the marker replaced by the new number.
+# The counter row is locked only from there to the commit, so writers no
+# longer queue behind each other's whole transaction, and sequence numbers
+# still become visible in order: once the counter reads N, every change up
+# to N is committed and a consumer that has synced up to N never misses one.
+
+COUNTER = "changes"
+TRACKED = (Customer, Activity)
+# Archived activities keep their id and change_seq and are part of the feed
+ARCHIVES = {Activity: ArchivedActivity.__table__}
+tombstones = Tombstone.__table__
+# Tables whose provisional markers are replaced at commit
+STAMPED = [model.__table__ for model in TRACKED] + [tombstones]
+
+
+def next_seq(session):
+    """Change sequence marker for the writes of ``session``'s transaction.
+
+    Rows written with it get the transaction's sequence number at commit.
+    """
+    marker = session.info.get("change_seq")
+    if marker is None:
+        marker = session.info["change_seq"] = -(secrets.randbits(62) + 1)
+    return marker
+
+
+def record_deletes(session, table, where, table_name=None):
+    """Write tombstones for the rows of ``table`` matching ``where``, before deleting them."""
+    seq = next_seq(session)
+    session.execute(insert(tombstones).from_select(
+        ["table_name", "row_id", "change_seq", "deleted_at"],
+        select(literal(table_name or table.name), table.c.id, literal(seq), literal(datetime.utcnow())).where(where)
+    ))
+
+
+def _before_flush(session, flush_context, instances):
+    touched = [
+        obj for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, TRACKED) and (obj in session.new or session.is_modified(obj, include_collections=False))
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, TRACKED)]
+    if not touched and not deleted:
+        return
+
+    seq = next_seq(session)
+    for obj in touched:
+        obj.change_seq = seq
+    for obj in deleted:
+        if isinstance(obj, Customer):
+            # The database cascade removes the activities without the ORM seeing them
+            for table in (Activity.__table__, ARCHIVES[Activity]):
+                record_deletes(session, table, table.c.customer_id == obj.id, Activity.__tablename__)
+    if deleted:
+        session.execute(insert(tombstones), [
+            {"table_name": obj.__tablename__, "row_id": obj.id, "change_seq": seq, "deleted_at": datetime.utcnow()}
+            for obj in deleted
+        ])
+
+
+def _before_commit(session):
+    # Flush first: the commit's own flush runs after this hook
+    session.flush()
+    marker = session.info.get("change_seq")
+    if marker is None:
+        return
+    connection = session.connection()
+    seq = versions.bump(connection, COUNTER)
+    for table in STAMPED:
+        where = [table.c.change_seq == marker]
+        if table is tombstones:
+            # Through ix_tombstones_table_change_seq
+            where.append(tombstones.c.table_name.in_([model.__tablename__ for model in TRACKED]))
+        connection.execute(update(table).where(*where).values(change_seq=seq))
+
+
+def _end_transaction(session, *args):
+    session.info.pop("change_seq", None)
+
+
+event.listen(db.session, "before_flush", _before_flush)
+event.listen(db.session, "before_commit", _before_commit)
+event.listen(db.session, "after_commit", _end_transaction)
+event.listen(db.session, "after_soft_rollback", _end_transaction)
+
+
+def _sources(model):
+    table = model.__table__
+    return [table, ARCHIVES[model]] if model in ARCHIVES else [table]
+
+
+def change_window(model, since, limit):
+    """Return ``(upto, more)``: the page covers sequence numbers ``(since, upto]``.
+
+    ``upto`` is the sequence number of roughly the ``limit``-th change after
+    ``since`` (never splitting one sequence number), capped at the committed
+    counter value. ``more`` tells whether changes beyond ``upto`` exist.
+    """
+    latest = versions.current(db.session.connection(), COUNTER)
+    table = model.__table__
+    seqs = union_all(
+        *(select(source.c.change_seq.label("seq")).where(source.c.change_seq > since) for source in _sources(model)),
+        select(tombstones.c.change_seq).where(tombstones.c.table_name == table.name, tombstones.c.change_seq > since),
+    ).subquery()
+    cut = db.session.execute(
+        select(seqs.c.seq).order_by(seqs.c.seq).offset(limit - 1).limit(1)
+    ).scalar()
+    if cut is None or cut >= latest:
+        return latest, False
+    return cut, True
+
+
+def iter_changes(model, columns, since, upto, batch_size):
+    """Yield ``(op, seq, id, *columns)`` for changes in ``(since, upto]``, in sequence order.
+
+    Rows written by the same transaction share one sequence number; within it
+    upserts come before deletes.
+    """
+    table = model.__table__
+    upserts = [
+        db.session.execute(
+            select(literal("upsert"), source.c.change_seq, source.c.id, *(source.c[name] for name in columns))
+            .where(source.c.change_seq > since, source.c.change_seq <= upto)
+            .order_by(source.c.change_seq, source.c.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for source in _sources(model)
+    ]
+    padding = [literal(None)] * len(columns)
+    deletes = db.session.execute(
+        select(literal("delete"), tombstones.c.change_seq, tombstones.c.row_id, *padding)
+        .where(
+            tombstones.c.table_name == table.name,
+            tombstones.c.change_seq > since,
+            tombstones.c.change_seq <= upto,
+        )
+        .order_by(tombstones.c.change_seq, tombstones.c.id)
+        .execution_options(yield_per=batch_size)
+    )
+    return heapq.merge(*upserts, deletes, key=lambda row: row[1])
+
+
+def register_change_commands(app):
+    @app.cli.group()
+    def changes():
+        """Change feed commands"""
+        pass
+
+    @changes.command()
+    @click.option("--days", default=90, help="Keep tombstones this many days")
+    def prune(days):
+        """Delete old tombstones (consumers further behind must resync in full)"""
+        if days < 1:
+            click.echo("--days must be at least 1.")
+            sys.exit(1)
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        with db.engine.begin() as connection:
+            removed = connection.execute(delete(tombstones).where(tombstones.c.deleted_at < cutoff)).rowcount
+        click.echo(f"Removed {removed} tombstones older than {days} days.")
@@ -0,0 +1,56 @@
+from flask import current_app
+
+from . import changes, db, queries, versions
+from .cache import make_cache
+
+NAMESPACE = "dashboard"
+
+
+def _snapshot(customer_limit, recent_limit):
+    # Plain dicts, so entries can be pickled into a shared backend; the
+    # template reads them with the same attribute syntax as the models.
+    customers = db.session.execute(queries.recent_customers(customer_limit)).scalars().all()
+    activities = db.session.execute(queries.recent_activities(recent_limit)).scalars().all()
+    return {
+        "customers": [
+            {
+                "id": c.id, "name": c.name, "email": c.email, "phone": c.phone, "address": c.address,
+                "change_seq": c.change_seq,
+            }
+            for c in customers
+        ],
+        "activities": [
+            {
+                "id": a.id,
+                "text": a.text,
+                "price": a.price,
+                "timestamp": a.timestamp,
+                "customer": {"id": a.customer.id, "name": a.customer.name},
+                "creator": {"username": a.creator.username},
+            }
+            for a in activities
+        ],
+    }
+
+
+def get_cache():
+    return current_app.extensions["dashboard_cache"]
+
+
+def get_dashboard(customer_limit, recent_limit):
+    """Recent customers and activities for the dashboard, served from the cache.
+
+    Entries are keyed on the change feed counter, which every customer or
+    activity write moves, so a write made by any process (another worker,
+    ``flask jobs worker``) is seen on the next request whatever the backend.
+    """
+    version = versions.current(db.session.connection(), changes.COUNTER)
+    return get_cache().get_or_set(
+        (version, customer_limit, recent_limit), lambda: _snapshot(customer_limit, recent_limit)
+    )
+
+
+def init_dashboard_cache(app):
+    app.extensions["dashboard_cache"] = make_cache(
+        app, NAMESPACE, app.config["DASHBOARD_CACHE_SIZE"], app.config["DASHBOARD_CACHE_TTL"]
+    )
@@ -0,0 +1,46 @@
+from sqlalchemy.engine import make_url
+
+# Connection pool settings for the primary and the replicas, from the DB_*
+# config keys. Every gunicorn worker process has its own pool; a gthread or
+# gevent worker needs DB_POOL_SIZE + DB_MAX_OVERFLOW at least as large as
+# the requests it serves at once, or requests queue for up to
+# DB_POOL_TIMEOUT seconds waiting for a connection.
+
+
+def engine_options(url, config):
+    """Engine options (SQLALCHEMY_ENGINE_OPTIONS) for the database at ``url``."""
+    options = {
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+    }
+    if not url:
+        return options
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "sqlite" and url.database in (None, "", ":memory:"):
+        # One shared connection (StaticPool); no pool to size
+        return options
+    options.update(
+        pool_size=config["DB_POOL_SIZE"],
+        max_overflow=config["DB_MAX_OVERFLOW"],
+        pool_timeout=config["DB_POOL_TIMEOUT"],
+    )
+    if backend == "postgresql" and config["DB_STATEMENT_TIMEOUT_MS"]:
+        options["connect_args"] = {"options": f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+
+def dispose_after_fork(app):
+    """Forget connections inherited from the parent process.
+
+    Called in each gunicorn worker when the app was loaded before forking
+    (preload_app); the parent's connections stay open for the parent.
+    """
+    from . import db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    replicas = app.extensions.get("replicas")
+    if replicas is not None:
+        replicas.dispose(close=False)
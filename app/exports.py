@@ -0,0 +1,129 @@
+import csv
+import io
+import zlib
+
+# Rows are pulled from the database in batches of this size and flushed to the
+# client as one chunk, so memory per worker stays flat whatever the table size.
+EXPORT_BATCH_SIZE = 1000
+
+
+class _LineBuffer:
+    # csv.writer only needs a file-like object with write(); hand the
+    # formatted line straight back instead of accumulating it.
+    def write(self, value):
+        return value
+
+
+def iter_csv(header, rows, batch_size=EXPORT_BATCH_SIZE):
+    """Yield CSV text for ``header`` and ``rows`` in chunks of ``batch_size`` rows."""
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow(header)
+    chunk = []
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= batch_size:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+def iter_gzip(chunks, encoding="utf-8"):
+    """Gzip-compress a stream of text chunks on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode(encoding))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# -- columnar formats ---------------------------------------------------------
+# Parquet and Arrow IPC need pyarrow, which is imported only when one of these
+# formats is asked for.
+
+# Rows per Parquet row group / Arrow record batch
+COLUMNAR_BATCH_SIZE = 65536
+
+COLUMNAR_FORMATS = {
+    # format -> (file extension, mimetype)
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+}
+
+
+def columnar_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _arrow_type(kind):
+    import pyarrow as pa
+
+    return {"int": pa.int64(), "float": pa.float64(), "str": pa.string(), "datetime": pa.timestamp("us")}[kind]
+
+
+class _ChunkSink(io.RawIOBase):
+    # Collects what the writer produces so it can be handed on after every
+    # batch; tell() keeps counting so the file footer gets the right offsets.
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_columnar(fmt, columns, rows, batch_size=COLUMNAR_BATCH_SIZE):
+    """Yield a Parquet or Arrow IPC file for ``rows`` in chunks, one per batch of ``batch_size`` rows.
+
+    ``columns`` is a list of ``(name, kind)`` pairs, kind being one of
+    ``int``, ``float``, ``str`` and ``datetime``.
+    """
+    import pyarrow as pa
+
+    schema = pa.schema([(name, _arrow_type(kind)) for name, kind in columns])
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        write = writer.write_table
+    else:
+        writer = pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+        write = writer.write_batch
+
+    def flush(batch):
+        values = list(zip(*batch))
+        record_batch = pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(values, schema)], schema=schema
+        )
+        write(pa.Table.from_batches([record_batch]) if fmt == "parquet" else record_batch)
+        return sink.drain()
+
+    batch = []
+    for row in rows:
+        batch.append(tuple(row))
+        if len(batch) >= batch_size:
+            yield flush(batch)
+            batch = []
+    if batch:
+        yield flush(batch)
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,93 @@
+import os
+
+import click
+from flask import current_app, has_request_context
+from flask_babel import get_locale
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from jinja2.runtime import Undefined
+from markupsafe import Markup, escape
+
+from .cache import Cache, MemoryBackend
+
+# Rendered template fragments, reused until the data they show changes.
+#
+#     {% cache "customer_row", customer.id, customer.change_seq %}...{% endcache %}
+#
+# renders the body once per distinct key and locale and serves the stored
+# HTML afterwards. The key carries the version of what the fragment shows
+# (a row's change_seq, a data version counter), so a write simply makes new
+# keys and old entries age out: there is nothing to invalidate, and every
+# worker keeps its own cache in memory, where a lookup costs less than
+# rendering even a small row. FRAGMENT_CACHE_TTL=0 renders every time.
+
+
+class FragmentCacheExtension(Extension):
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render", [nodes.List(parts)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, parts, caller):
+        cache = current_app.extensions.get("fragment_cache")
+        if cache is None or any(isinstance(part, Undefined) for part in parts):
+            # No version to key on (e.g. a cached dashboard from before a deploy)
+            return caller()
+        locale = str(get_locale()) if has_request_context() else None
+        return Markup(cache.get_or_set((locale, *parts), lambda: str(caller())))
+
+
+def select_option(options, value):
+    """Mark the ``<option>`` with ``value`` as selected in cached options markup."""
+    if value is None:
+        return options
+    tag = f'<option value="{escape(value)}"'
+    return Markup(str(options).replace(tag + ">", tag + " selected>", 1))
+
+
+def get_cache():
+    return current_app.extensions["fragment_cache"]
+
+
+def init_fragments(app):
+    app.extensions["fragment_cache"] = Cache(
+        MemoryBackend(app.config["FRAGMENT_CACHE_SIZE"]), app.config["FRAGMENT_CACHE_TTL"]
+    )
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.filters["select_option"] = select_option
+    if app.config["JINJA_BYTECODE_CACHE"]:
+        # Compiled templates survive restarts, so fresh workers skip Jinja's compiler
+        directory = app.config["JINJA_BYTECODE_CACHE_DIR"] or os.path.join(app.instance_path, "jinja")
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def compile_templates(app):
+    """Load every template, compiling it (or reading it from the bytecode cache)."""
+    names = app.jinja_env.list_templates(extensions=["html"])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+
+def register_template_commands(app):
+    @app.cli.group()
+    def templates():
+        """Template commands"""
+        pass
+
+    @templates.command()
+    def compile():
+        """Compile every template into the bytecode cache"""
+        names = compile_templates(app)
+        if app.jinja_env.bytecode_cache is None:
+            click.echo(f"Compiled {len(names)} templates (JINJA_BYTECODE_CACHE is off, nothing stored).")
+        else:
+            click.echo(f"Compiled {len(names)} templates into the bytecode cache.")
@@ -0,0 +1,343 @@
+import os
+
+import numpy as np
+import pandas as pd
+from flask_babel import gettext
+from sqlalchemy import select, insert
+
+from . import analytics, autocomplete, changes, db, rollups
+from .models import Customer, Activity, User
+
+# Rows read from the upload and written to the database per round
+IMPORT_CHUNK_SIZE = 5000
+# Rows per INSERT statement inside a chunk
+IMPORT_BATCH_SIZE = 1000
+# Only the first rejections are kept with line numbers; the rest are counted
+MAX_REPORTED_REJECTIONS = 1000
+# Keeps IN (...) lookups below SQLite's bound-parameter limit
+LOOKUP_BATCH_SIZE = 900
+
+CUSTOMER_COLUMNS = {"Name": "name", "Email": "email", "Phone": "phone", "Address": "address"}
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.added = 0
+        self.skipped = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.rejections = []
+
+    def reject(self, lines, reasons):
+        self.rejected += len(lines)
+        room = MAX_REPORTED_REJECTIONS - len(self.rejections)
+        if room > 0:
+            self.rejections.extend(
+                {"line": int(line), "reason": reason} for line, reason in zip(lines[:room], reasons[:room])
+            )
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def read_csv_chunks(source, chunk_size=IMPORT_CHUNK_SIZE):
+    # Everything is read as text; cleaning and type conversion happen per chunk.
+    # Chunks are indexed by line number (line 1 is the header).
+    for chunk in pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunk_size):
+        chunk.index += 2
+        yield chunk
+
+
+def _arrow_chunks(batches, chunk_size):
+    # Chunks are indexed by row number, counting from 1
+    import pyarrow as pa
+
+    first = 1
+    for batch in batches:
+        for piece in pa.Table.from_batches([batch]).to_batches(max_chunksize=chunk_size):
+            chunk = piece.to_pandas()
+            chunk.index += first
+            first += len(chunk)
+            yield chunk
+
+
+def read_parquet_chunks(source, chunk_size=IMPORT_CHUNK_SIZE):
+    # Columns keep their Parquet types; only row groups being read are in memory
+    import pyarrow.parquet as pq
+
+    return _arrow_chunks(pq.ParquetFile(source).iter_batches(batch_size=chunk_size), chunk_size)
+
+
+def read_arrow_chunks(source, chunk_size=IMPORT_CHUNK_SIZE):
+    # Arrow IPC file format (also written as .feather)
+    import pyarrow as pa
+
+    reader = pa.ipc.open_file(pa.memory_map(source) if isinstance(source, str) else source)
+    return _arrow_chunks((reader.get_batch(i) for i in range(reader.num_record_batches)), chunk_size)
+
+
+# Upload file extension -> chunk reader; all but CSV need pyarrow
+READERS = {
+    "csv": read_csv_chunks,
+    "parquet": read_parquet_chunks,
+    "arrow": read_arrow_chunks,
+    "feather": read_arrow_chunks,
+}
+
+
+def read_chunks(path, chunk_size=IMPORT_CHUNK_SIZE):
+    """DataFrame chunks of the upload at ``path``, read according to its extension."""
+    return READERS[path.rsplit(".", 1)[-1].lower()](path, chunk_size)
+
+
+def _random_hex(count, width):
+    # One urandom call per chunk instead of a uuid4() per placeholder
+    words = np.frombuffer(os.urandom(count * 4), dtype=">u4")
+    return np.char.mod("%08x", words).astype(f"U{width}")
+
+
+def _text_column(chunk, column):
+    if column not in chunk:
+        return pd.Series("", index=chunk.index, dtype=object)
+    return chunk[column].fillna("").astype(str).str.strip()
+
+
+def _numeric_column(chunk, column):
+    # Typed (Parquet/Arrow) columns are used as they are; text is parsed
+    if column in chunk and pd.api.types.is_numeric_dtype(chunk[column]):
+        return chunk[column].astype(float)
+    return pd.to_numeric(_text_column(chunk, column), errors="coerce")
+
+
+def clean_customers(chunk, placeholder_name):
+    """Strip the customer columns of ``chunk`` and fill blanks with unique placeholders."""
+    frame = pd.DataFrame({
+        field: _text_column(chunk, column) for column, field in CUSTOMER_COLUMNS.items()
+    })
+
+    frame.loc[frame["name"] == "", "name"] = placeholder_name
+    placeholders = {
+        "email": ("email_{}@email.com", 8),
+        "phone": ("09XX-{}", 4),
+        "address": ("Unknown Address {}", 4),
+    }
+    for field, (pattern, width) in placeholders.items():
+        blank = (frame[field] == "").to_numpy()
+        count = int(blank.sum())
+        if count:
+            prefix, suffix = pattern.split("{}")
+            values = np.char.add(np.char.add(prefix, _random_hex(count, width)), suffix)
+            frame.loc[blank, field] = values.astype(object)
+    return frame
+
+
+def existing_values(column, values):
+    """Return the subset of ``values`` already stored in ``column``."""
+    found = set()
+    values = list(values)
+    for start in range(0, len(values), LOOKUP_BATCH_SIZE):
+        batch = values[start:start + LOOKUP_BATCH_SIZE]
+        found.update(db.session.execute(select(column).where(column.in_(batch))).scalars())
+    return found
+
+
+def insert_ignoring_conflicts(table, records, conflict_columns, returning=None):
+    """Bulk-insert ``records`` and return ``(inserted_count, inserted_rows)``.
+
+    On PostgreSQL and SQLite rows that hit a unique constraint on
+    ``conflict_columns`` are skipped by the database (ON CONFLICT DO NOTHING);
+    other backends get a plain multi-row insert. ``inserted_rows`` holds the
+    ``returning`` columns (default: id) when the backend can return them from
+    an executemany, otherwise None.
+    """
+    dialect = db.session.get_bind().dialect
+    if dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        db.session.execute(insert(table), records)
+        return len(records), None
+
+    stmt = dialect_insert(table).on_conflict_do_nothing(index_elements=conflict_columns)
+    if dialect.insert_executemany_returning:
+        rows = db.session.execute(stmt.returning(*(returning or [table.c.id])), records).all()
+        return len(rows), rows
+    result = db.session.execute(stmt, records)
+    return (result.rowcount if result.rowcount >= 0 else len(records)), None
+
+
+def import_customers(chunks, result=None, on_commit=None):
+    """Import customer DataFrame ``chunks`` (CSV column names), committing per chunk.
+
+    Emails repeated inside the upload are counted as duplicates, emails that
+    already exist in the database as skipped. ``result`` continues the counts
+    of an earlier run; ``on_commit(result)`` is called before each chunk's
+    commit, inside its transaction.
+    """
+    result = result or ImportResult()
+    placeholder_name = gettext("Unnamed Customer")
+    seen = set()
+
+    for chunk in chunks:
+        frame = clean_customers(chunk, placeholder_name)
+        result.rows += len(frame)
+
+        emails = frame["email"]
+        repeated = emails.duplicated().to_numpy() | np.fromiter(
+            (email in seen for email in emails), dtype=bool, count=len(emails)
+        )
+        result.duplicates += int(repeated.sum())
+        frame = frame[~repeated]
+        seen.update(frame["email"])
+
+        existing = existing_values(Customer.email, frame["email"])
+        if existing:
+            known = frame["email"].isin(existing).to_numpy()
+            result.skipped += int(known.sum())
+            frame = frame[~known]
+
+        if len(frame):
+            records = frame.assign(change_seq=changes.next_seq(db.session)).to_dict("records")
+            inserted, rows = insert_ignoring_conflicts(
+                Customer.__table__, records, ["email"],
+                returning=[Customer.id, Customer.name, Customer.email, Customer.phone, Customer.address]
+            )
+            result.added += inserted
+            # Without RETURNING there is nothing to apply locally; workers resync
+            autocomplete.record_change(db.session, upserts=rows or (), rows_known=rows is not None)
+            # Lost a race with a concurrent writer for the same email
+            result.skipped += len(records) - inserted
+
+        if on_commit:
+            on_commit(result)
+        db.session.commit()
+
+    return result
+
+
+def _timestamp_column(chunk, column):
+    if column in chunk and pd.api.types.is_datetime64_any_dtype(chunk[column]):
+        values = chunk[column]
+        if values.dt.tz is not None:
+            values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+        return values.astype("datetime64[ns]")
+    return _parse_timestamps(_text_column(chunk, column))
+
+
+def _parse_timestamps(values):
+    parsed = pd.to_datetime(values, errors="coerce")
+    # The fast path infers one format for the whole column; give rows written in
+    # another format a second, per-element chance before rejecting them.
+    retry = parsed.isna() & (values != "")
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry], errors="coerce", format="mixed")
+    return parsed
+
+
+def import_activities(chunks, batch_size=IMPORT_BATCH_SIZE, result=None, on_commit=None):
+    """Import activity DataFrame ``chunks`` (CSV column names), committing per chunk.
+
+    Columns are parsed and validated as whole arrays (typed Parquet/Arrow
+    columns are taken as they are); customers and creators are resolved
+    through lookup maps instead of a query per row. Rows that fail validation
+    are reported with their chunk index, i.e. CSV line or file row number.
+    ``result`` and ``on_commit`` work as in :func:`import_customers`.
+    """
+    result = result or ImportResult()
+    creators = dict(db.session.execute(select(User.username, User.id)).all())
+    known_customers = set()
+    checked_customers = set()
+
+    for chunk in chunks:
+        result.rows += len(chunk)
+        lines = chunk.index.to_numpy()
+
+        text = _text_column(chunk, "Text")
+        customer_id = _numeric_column(chunk, "CustomerID")
+        creator_id = _text_column(chunk, "Creator").map(creators)
+        timestamp = _timestamp_column(chunk, "Timestamp")
+        if "Price" in chunk and pd.api.types.is_numeric_dtype(chunk["Price"]):
+            price = chunk["Price"].astype(float).fillna(0.0)
+        else:
+            price_raw = _text_column(chunk, "Price")
+            price = pd.to_numeric(price_raw, errors="coerce").where(price_raw != "", 0.0)
+
+        # One query per chunk for customer IDs not seen in earlier chunks
+        candidates = customer_id[customer_id.notna() & (customer_id % 1 == 0)].astype("int64")
+        unchecked = set(candidates.unique().tolist()) - checked_customers
+        if unchecked:
+            known_customers |= existing_values(Customer.id, unchecked)
+            checked_customers |= unchecked
+
+        conditions = [
+            (text == "").to_numpy(),
+            customer_id.isna().to_numpy(),
+            ~customer_id.isin(known_customers).to_numpy(),
+            creator_id.isna().to_numpy(),
+            timestamp.isna().to_numpy(),
+            price.isna().to_numpy(),
+        ]
+        reasons = np.select(conditions, [
+            gettext("Missing activity text"),
+            gettext("Invalid customer ID"),
+            gettext("Unknown customer"),
+            gettext("Unknown creator"),
+            gettext("Invalid timestamp"),
+            gettext("Invalid price"),
+        ], default="")
+        invalid = reasons != ""
+        if invalid.any():
+            result.reject(lines[invalid], reasons[invalid])
+
+        valid = ~invalid
+        frame = pd.DataFrame({
+            "customer_id": customer_id[valid].astype("int64"),
+            "creator_id": creator_id[valid].astype("int64"),
+            "text": text[valid],
+            "price": price[valid].astype(float),
+            "timestamp": pd.Series(
+                np.asarray(timestamp[valid].dt.to_pydatetime(), dtype=object), index=chunk.index[valid], dtype=object
+            ),
+        })
+        if len(frame):
+            frame["change_seq"] = changes.next_seq(db.session)
+        records = frame.to_dict("records")
+        for start in range(0, len(records), batch_size):
+            db.session.execute(insert(Activity), records[start:start + batch_size])
+        result.added += len(records)
+
+        # Bulk inserts skip the flush hooks, so the rollups get one delta per
+        # customer and the monthly summary one per month, customer and creator
+        if records:
+            added = pd.DataFrame({
+                "customer_id": frame["customer_id"],
+                "creator_id": frame["creator_id"],
+                "price": frame["price"],
+                "timestamp": timestamp[valid],
+            })
+            totals = added.groupby("customer_id").agg(
+                count=("price", "size"), revenue=("price", "sum"), newest=("timestamp", "max")
+            )
+            rollups.add_totals(db.session.connection(), zip(
+                totals.index.tolist(),
+                totals["count"].tolist(),
+                totals["revenue"].tolist(),
+                totals["newest"].dt.to_pydatetime().tolist(),
+            ))
+            added["month"] = added["timestamp"].dt.to_period("M").dt.start_time.dt.date
+            monthly = added.groupby(["month", "customer_id", "creator_id"])["price"].agg(["size", "sum"])
+            analytics.add_totals(db.session.connection(), zip(
+                monthly.index.get_level_values("month"),
+                monthly.index.get_level_values("customer_id").tolist(),
+                monthly.index.get_level_values("creator_id").tolist(),
+                monthly["size"].tolist(),
+                monthly["sum"].tolist(),
+            ))
+
+        if on_commit:
+            on_commit(result)
+        db.session.commit()
+
+    return result
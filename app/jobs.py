@@ -0,0 +1,307 @@
+import itertools
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.exc import OperationalError
+
+from . import db
+from .models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+# Background CSV imports. Routes spool the upload and queue an ImportJob row;
+# `flask jobs worker` claims queued jobs and runs them chunk by chunk. Each
+# chunk's rows and the job's progress commit together, so a failed or
+# abandoned job resumes after its last committed chunk. A running job is
+# leased to its worker: a heartbeat thread renews the lease however long a
+# chunk takes, and every write to the job, progress included, only applies
+# while the job is still this worker's. A worker that finds its job taken
+# over rolls its chunk back and leaves the job alone.
+
+KINDS = ("customers", "activities")
+# Upload extensions the worker reads (the keys of importers.READERS); anything
+# else is read as CSV. Listed here so queueing an upload does not load pandas.
+EXTENSIONS = ("csv", "parquet", "arrow", "feather")
+
+
+def spool_dir():
+    path = current_app.config["IMPORT_SPOOL_DIR"] or os.path.join(current_app.instance_path, "imports")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def enqueue(kind, upload, user_id):
+    """Save ``upload`` to the spool directory and queue an import job for it."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown import kind: {kind!r}")
+    # The extension tells the worker how to read the file
+    extension = (upload.filename or "").rsplit(".", 1)[-1].lower()
+    if extension not in EXTENSIONS:
+        extension = "csv"
+    path = os.path.join(spool_dir(), f"{uuid.uuid4().hex}.{extension}")
+    upload.save(path)
+    job = ImportJob(
+        kind=kind,
+        filename=upload.filename or os.path.basename(path),
+        path=path,
+        created_by=user_id,
+        chunk_size=current_app.config["IMPORT_CHUNK_SIZE"],
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def status(job):
+    """Progress of ``job`` as a JSON-serialisable dict."""
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "filename": job.filename,
+        "rows": job.rows,
+        "added": job.added,
+        "skipped": job.skipped,
+        "duplicates": job.duplicates,
+        "rejected": job.rejected,
+        "chunks_done": job.chunks_done,
+        "rows_per_second": round(job.rows / job.elapsed, 1) if job.elapsed else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def resume(job):
+    """Queue a failed job again; it continues after its last committed chunk."""
+    if job.status != "failed":
+        return False
+    job.status = "queued"
+    job.error = None
+    db.session.commit()
+    return True
+
+
+def claim(worker_name):
+    """Mark the oldest runnable job as running by ``worker_name`` and return it.
+
+    Runnable means queued, or running without a heartbeat for
+    ``IMPORT_JOB_STALE_AFTER`` seconds (its worker died). The conditional
+    UPDATE makes sure two workers never claim the same job.
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=current_app.config["IMPORT_JOB_STALE_AFTER"])
+    runnable = or_(
+        ImportJob.status == "queued",
+        and_(ImportJob.status == "running", ImportJob.heartbeat_at < stale),
+    )
+    candidates = db.session.execute(
+        select(ImportJob.id).where(runnable).order_by(ImportJob.id).limit(5)
+    ).scalars().all()
+    for job_id in candidates:
+        claimed = db.session.execute(
+            update(ImportJob)
+            .where(ImportJob.id == job_id, runnable)
+            .values(
+                status="running",
+                worker=worker_name,
+                heartbeat_at=now,
+                started_at=func.coalesce(ImportJob.started_at, now),
+            )
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(ImportJob, job_id)
+    db.session.rollback()
+    return None
+
+
+class JobLost(Exception):
+    """The job was taken over by another worker while this one ran it."""
+
+
+def _owned(stmt, job_id, worker_name):
+    # Restrict an UPDATE of the job to while ``worker_name`` still holds it
+    return stmt.where(ImportJob.id == job_id, ImportJob.worker == worker_name, ImportJob.status == "running")
+
+
+class _Heartbeat(threading.Thread):
+    """Renews a running job's heartbeat every ``interval`` seconds on its own connection."""
+
+    def __init__(self, engine, job_id, worker_name, interval):
+        super().__init__(name=f"import-job-{job_id}-heartbeat", daemon=True)
+        self.engine = engine
+        self.job_id = job_id
+        self.worker_name = worker_name
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                with self.engine.begin() as connection:
+                    renewed = connection.execute(
+                        _owned(update(ImportJob), self.job_id, self.worker_name)
+                        .values(heartbeat_at=datetime.utcnow())
+                    ).rowcount
+            except OperationalError as error:
+                # SQLite has one writer: the chunk being written may hold the lock
+                logger.warning("Import job %s: heartbeat failed: %s", self.job_id, error)
+                continue
+            if not renewed:
+                # Taken over; the next chunk commit finds out and stops
+                return
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def _result_from(job):
+    from . import importers
+
+    result = importers.ImportResult()
+    for field in ("rows", "added", "skipped", "duplicates", "rejected"):
+        setattr(result, field, getattr(job, field))
+    result.rejections = list(job.rejections or [])
+    return result
+
+
+def run(job):
+    """Run a claimed job to completion (or failure), skipping committed chunks.
+
+    Returns the job as stored afterwards; when another worker took it over
+    meanwhile, this worker's last chunk is rolled back and the job is left
+    to the new worker.
+    """
+    from . import importers
+
+    job_id, worker_name = job.id, job.worker
+    chunks = itertools.islice(importers.read_chunks(job.path, job.chunk_size), job.chunks_done, None)
+    started = time.monotonic()
+
+    def on_commit(result):
+        # Runs in the chunk's transaction, so rows and progress commit together
+        nonlocal started
+        now = time.monotonic()
+        progress = {field: getattr(result, field) for field in ("rows", "added", "skipped", "duplicates", "rejected")}
+        owned = db.session.execute(
+            _owned(update(ImportJob), job_id, worker_name).values(
+                chunks_done=ImportJob.chunks_done + 1,
+                elapsed=ImportJob.elapsed + (now - started),
+                heartbeat_at=datetime.utcnow(),
+                rejections=list(result.rejections),
+                **progress,
+            )
+        ).rowcount
+        if not owned:
+            raise JobLost(job_id)
+        started = now
+
+    heartbeat = _Heartbeat(
+        db.engine, job_id, worker_name, max(1.0, current_app.config["IMPORT_JOB_STALE_AFTER"] / 4)
+    )
+    heartbeat.start()
+    try:
+        if job.kind == "customers":
+            importers.import_customers(chunks, result=_result_from(job), on_commit=on_commit)
+        else:
+            importers.import_activities(
+                chunks, batch_size=current_app.config["IMPORT_BATCH_SIZE"],
+                result=_result_from(job), on_commit=on_commit
+            )
+    except JobLost:
+        db.session.rollback()
+        return db.session.get(ImportJob, job_id)
+    except Exception:
+        db.session.rollback()
+        db.session.execute(
+            _owned(update(ImportJob), job_id, worker_name)
+            .values(status="failed", error=traceback.format_exc(limit=5))
+        )
+        db.session.commit()
+        return db.session.get(ImportJob, job_id)
+    finally:
+        heartbeat.stop()
+
+    finished = db.session.execute(
+        _owned(update(ImportJob), job_id, worker_name).values(status="done", finished_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    job = db.session.get(ImportJob, job_id)
+    if finished:
+        try:
+            os.remove(job.path)
+        except OSError:
+            pass
+    return job
+
+
+def register_job_commands(app):
+    @app.cli.group()
+    def jobs():
+        """Background import job commands"""
+        pass
+
+    @jobs.command()
+    @click.option("--once", is_flag=True, help="Exit when the queue is empty")
+    @click.option("--poll", default=1.0, help="Seconds between queue checks when idle")
+    def worker(once, poll):
+        """Run queued import jobs"""
+        name = f"{socket.gethostname()}:{os.getpid()}"
+        click.echo(f"Import worker {name} started.")
+        while True:
+            job = claim(name)
+            if job is None:
+                if once:
+                    break
+                time.sleep(poll)
+                continue
+            click.echo(f"Job {job.id}: importing {job.kind} from {job.filename} (after chunk {job.chunks_done})")
+            job = run(job)
+            if job.worker != name:
+                click.echo(f"Job {job.id}: taken over by {job.worker}, its last chunk rolled back.")
+                db.session.remove()
+                continue
+            info = status(job)
+            click.echo(
+                f"Job {job.id}: {job.status}, {info['rows']} rows, {info['added']} added, "
+                f"{info['rejected']} rejected, {info['rows_per_second']} rows/s"
+            )
+            if job.error:
+                click.echo(job.error, err=True)
+            db.session.remove()
+
+    @jobs.command("list")
+    @click.option("--limit", default=20, help="Jobs to show")
+    def list_jobs(limit):
+        """Show the most recent import jobs"""
+        for job in db.session.execute(select(ImportJob).order_by(ImportJob.id.desc()).limit(limit)).scalars():
+            click.echo(
+                f"{job.id:>6}  {job.kind:<10}  {job.status:<8}  {job.rows:>9} rows  "
+                f"{job.chunks_done:>5} chunks  {job.filename}"
+            )
+
+    @jobs.command("resume")
+    @click.argument("job_id", type=int)
+    def resume_command(job_id):
+        """Queue a failed job again from its last committed chunk"""
+        job = db.session.get(ImportJob, job_id)
+        if job is None:
+            click.echo(f"No job {job_id}.")
+            sys.exit(1)
+        if not resume(job):
+            click.echo(f"Job {job_id} is {job.status}; only failed jobs can be resumed.")
+            sys.exit(1)
+        click.echo(f"Job {job_id} queued; it continues after chunk {job.chunks_done}.")
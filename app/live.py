@@ -0,0 +1,162 @@
+import json
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+
+from . import changes, db, versions
+from .models import Activity, Customer, User
+
+# Live activity feed for the dashboard and /activities, sent as Server-Sent
+# Events. The change feed's sequence numbers and tombstones are the event
+# log: a stream sends the activities written or deleted after the client's
+# last event id, then waits for the change counter to move. Commits in this
+# process wake the streams at once, writes from other processes are noticed
+# within LIVE_POLL_INTERVAL seconds, and the counter is read at most once per
+# interval per process however many streams are open. Streams end after
+# LIVE_MAX_SECONDS and the browser reconnects with its last event id, so a
+# connection never holds a worker thread for long and nothing is missed.
+
+# Milliseconds the browser waits before reconnecting
+RETRY_MS = 2000
+# Comment line sent when nothing happened for this many seconds, so proxies keep the connection
+HEARTBEAT_SECONDS = 15
+tombstones = changes.tombstones
+
+
+class Notifier:
+    """Per-process change counter and wake-up for the open streams."""
+
+    def __init__(self, poll_interval, max_streams):
+        self.poll_interval = poll_interval
+        self.slots = threading.BoundedSemaphore(max_streams)
+        self._condition = threading.Condition()
+        self._latest = None
+        self._checked_at = 0.0
+
+    def latest(self):
+        """The committed change counter, read at most once per poll interval."""
+        now = time.monotonic()
+        if self._latest is None or now - self._checked_at >= self.poll_interval:
+            self._latest = watermark()
+            self._checked_at = now
+        return self._latest
+
+    def wait(self, timeout):
+        with self._condition:
+            self._condition.wait(timeout)
+
+    def notify(self):
+        self._checked_at = 0.0
+        with self._condition:
+            self._condition.notify_all()
+
+
+def get_notifier():
+    return current_app.extensions["live"]
+
+
+def watermark():
+    """Current change counter; a page rendered now shows every change up to it."""
+    return versions.current(db.session.connection(), changes.COUNTER)
+
+
+def _message(name, data, event_id=None):
+    lines = [f"event: {name}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + json.dumps(data))
+    return "\n".join(lines) + "\n\n"
+
+
+def _events(since, upto, limit):
+    # (seq, data) of changed and deleted activities in (since, upto], upserts first within a sequence number
+    upserts = db.session.execute(
+        select(
+            Activity.change_seq, Activity.id, Activity.customer_id, Customer.name,
+            Activity.text, Activity.price, User.username, Activity.timestamp,
+        )
+        .join(Customer, Activity.customer_id == Customer.id)
+        .join(User, Activity.creator_id == User.id)
+        .where(Activity.change_seq > since, Activity.change_seq <= upto)
+        .order_by(Activity.change_seq, Activity.id)
+        .limit(limit)
+    ).all()
+    deletes = db.session.execute(
+        select(tombstones.c.change_seq, tombstones.c.row_id)
+        .where(
+            tombstones.c.table_name == Activity.__tablename__,
+            tombstones.c.change_seq > since,
+            tombstones.c.change_seq <= upto,
+        )
+        .order_by(tombstones.c.change_seq, tombstones.c.id)
+        .limit(limit)
+    ).all()
+    events = [
+        (seq, {
+            "op": "upsert", "id": id, "customer_id": customer_id, "customer_name": customer_name,
+            "text": text, "price": price, "creator": creator,
+            "timestamp": timestamp.strftime("%Y-%m-%d %H:%M"),
+        })
+        for seq, id, customer_id, customer_name, text, price, creator, timestamp in upserts
+    ] + [(seq, {"op": "delete", "id": row_id}) for seq, row_id in deletes]
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def _changes(since, max_events):
+    """Return ``(text, upto)``: the events after ``since`` and the new position."""
+    upto, more = changes.change_window(Activity, since, max_events)
+    events = _events(since, upto, max_events + 1)
+    if more or len(events) > max_events:
+        # Too many to patch in; the page reloads instead
+        latest = watermark()
+        return _message("resync", {}, latest), latest
+    parts = []
+    for i, (seq, data) in enumerate(events):
+        # The id goes on the last event of each sequence number, so a client
+        # resuming after it never skips the rest of a transaction
+        last = i + 1 == len(events) or events[i + 1][0] != seq
+        parts.append(_message("activity", data, seq if last else None))
+    return "".join(parts), upto
+
+
+def stream(since):
+    """Yield the Server-Sent Events text for changes after ``since``, until LIVE_MAX_SECONDS pass."""
+    notifier = get_notifier()
+    config = current_app.config
+    deadline = time.monotonic() + config["LIVE_MAX_SECONDS"]
+    quiet_until = time.monotonic() + HEARTBEAT_SECONDS
+    yield f"retry: {RETRY_MS}\n\n"
+    while True:
+        if notifier.latest() > since:
+            text, since = _changes(since, config["LIVE_MAX_EVENTS"])
+            if text:
+                yield text
+                quiet_until = time.monotonic() + HEARTBEAT_SECONDS
+        # Hand the connection back to the pool while waiting
+        db.session.close()
+        now = time.monotonic()
+        if now >= deadline:
+            return
+        if now >= quiet_until:
+            yield ": keepalive\n\n"
+            quiet_until = now + HEARTBEAT_SECONDS
+        notifier.wait(min(notifier.poll_interval, deadline - now))
+
+
+def _after_commit(session):
+    # Any change_seq taken means customers or activities were written
+    if session.info.get("change_seq") is not None and has_app_context():
+        notifier = current_app.extensions.get("live")
+        if notifier is not None:
+            notifier.notify()
+
+
+def init_live(app):
+    app.extensions["live"] = Notifier(app.config["LIVE_POLL_INTERVAL"], app.config["LIVE_MAX_STREAMS"])
+
+
+# Ahead of the change feed's own hook, which forgets the sequence number
+event.listen(db.session, "after_commit", _after_commit, insert=True)
@@ -0,0 +1,321 @@
+import http.cookiejar
+import io
+import json
+import resource
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import timedelta
+
+import numpy as np
+from sqlalchemy import event, func, select
+
+from . import db, jobs
+from .models import Activity, Customer
+
+# End-to-end route benchmark driven by `flask bench run`: every scenario issues
+# the same seeded sequence of requests, through the Flask test client or
+# against a running server, and reports latency percentiles, throughput, SQL
+# statements per request and peak Python memory.
+
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench"
+
+
+class ClientTarget:
+    """Requests through the Flask test client, in this process."""
+
+    name = "test client"
+
+    def __init__(self, app, username, password):
+        self.app = app
+        self.client = app.test_client()
+        status, _ = self.request("POST", "/auth/login", {"username": username, "password": password})
+        if status != 302:
+            raise RuntimeError(f"Login as {username!r} failed ({status})")
+
+    def request(self, method, path, data=None, upload=None):
+        kwargs = {}
+        if upload:
+            filename, payload = upload
+            data = {**(data or {}), "file": (io.BytesIO(payload), filename)}
+            kwargs["content_type"] = "multipart/form-data"
+        response = self.client.open(path, method=method, data=data, **kwargs)
+        body = response.get_data()  # drains streamed responses
+        if upload:
+            # Imports run as background jobs; run them here so they are measured
+            while True:
+                job = jobs.claim("bench")
+                if job is None:
+                    break
+                jobs.run(job)
+        return response.status_code, body
+
+
+class HTTPTarget:
+    """Requests over HTTP to a running server (its SQL and memory are not visible)."""
+
+    name = "http"
+
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url.rstrip("/")
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            _NoRedirect()
+        )
+        status, _ = self.request("POST", "/auth/login", {"username": username, "password": password})
+        if status != 302:
+            raise RuntimeError(f"Login as {username!r} failed ({status})")
+
+    def request(self, method, path, data=None, upload=None):
+        headers = {}
+        body = None
+        if upload:
+            boundary = uuid.uuid4().hex
+            body = _multipart(boundary, data or {}, upload)
+            headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Measure the route itself, not the page it redirects to
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _multipart(boundary, fields, upload):
+    filename, payload = upload
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: text/csv\r\n\r\n".encode() + payload + b"\r\n"
+    )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts)
+
+
+class QueryCounter:
+    """Counts SQL statements executed on ``engine``."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+    def close(self):
+        event.remove(self.engine, "before_cursor_execute", self._count)
+
+
+def dataset_context():
+    """Id ranges and dates the scenarios draw their parameters from."""
+    first, last = db.session.execute(select(func.min(Customer.id), func.max(Customer.id))).one()
+    newest = db.session.execute(select(func.max(Activity.timestamp))).scalar()
+    busiest = db.session.execute(
+        select(Activity.customer_id).group_by(Activity.customer_id).order_by(func.count().desc()).limit(1)
+    ).scalar()
+    db.session.rollback()
+    if first is None or newest is None:
+        raise RuntimeError("The database has no customers or activities; seed it first (flask bench seed)")
+    return {
+        "first_customer": first,
+        "last_customer": last,
+        "busiest_customer": busiest,
+        "month_ago": (newest - timedelta(days=30)).strftime("%Y-%m-%d"),
+    }
+
+
+def _customer_upload(rng, rows):
+    token = uuid.uuid4().hex[:8]
+    lines = ["Name,Email,Phone,Address"] + [
+        f"Bench {token} {i},bench.{token}.{i}@example.com,09{n:08d},Street {n % 5000}"
+        for i, n in enumerate(rng.integers(0, 10**8, rows))
+    ]
+    return "customers.csv", "\n".join(lines).encode()
+
+
+def _activity_upload(rng, rows, ctx, username):
+    customer_ids = rng.integers(ctx["first_customer"], ctx["last_customer"] + 1, rows)
+    prices = rng.lognormal(3.5, 1.0, rows).round(2)
+    lines = ["CustomerID,Text,Price,Creator,Timestamp"] + [
+        f"{c},Imported {i},{p},{username},2024-0{1 + i % 9}-1{i % 10} 10:00:00"
+        for i, (c, p) in enumerate(zip(customer_ids, prices))
+    ]
+    return "activities.csv", "\n".join(lines).encode()
+
+
+def scenarios(ctx, username, password, import_rows):
+    """``{name: (make_request(rng), max_requests)}``; ``make_request`` returns
+    ``(method, path, form_data, upload)``."""
+    def random_customer(rng):
+        return int(rng.integers(ctx["first_customer"], ctx["last_customer"] + 1))
+
+    def get(path_for):
+        return lambda rng: ("GET", path_for(rng), None, None)
+
+    return {
+        "login": (lambda rng: ("POST", "/auth/login", {"username": username, "password": password}, None), None),
+        "dashboard": (get(lambda rng: "/dashboard?customer_limit=30&recent_limit=30"), None),
+        "activities": (get(lambda rng: "/activities"), None),
+        "activities_filtered": (get(lambda rng: (
+            f"/activities?customer_id={ctx['busiest_customer']}&start_date={ctx['month_ago']}"
+        )), None),
+        "activities_text": (get(lambda rng: f"/activities?text=Activity+{int(rng.integers(100, 1000))}"), None),
+        "search_customers": (get(lambda rng: f"/search_customers?q=Customer+{random_customer(rng) // 10}"), None),
+        "customers_search": (get(lambda rng: f"/customers?q=Street+{int(rng.integers(100, 1000))}"), None),
+        "view_customer": (get(lambda rng: f"/customer/{random_customer(rng)}"), None),
+        "analytics": (get(lambda rng: "/analytics?granularity=month&group_by=customer"), None),
+        "export_customers": (get(lambda rng: "/export/customers"), 10),
+        "export_activities": (get(lambda rng: f"/export/activities?start_date={ctx['month_ago']}"), 10),
+        "export_parquet": (get(lambda rng: (
+            f"/export/activities?start_date={ctx['month_ago']}&format=parquet"
+        )), 10),
+        "import_customers": (lambda rng: (
+            "POST", "/import/customers", None, _customer_upload(rng, import_rows)
+        ), 5),
+        "import_activities": (lambda rng: (
+            "POST", "/import/activities", None, _activity_upload(rng, import_rows, ctx, username)
+        ), 5),
+    }
+
+
+def _percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 2)
+
+
+def run_scenario(target, make_request, requests, warmup, seed, counter=None, memory=True):
+    """Issue ``requests`` requests (after ``warmup``) and summarise them."""
+    rng = np.random.default_rng(seed)
+    for _ in range(warmup):
+        target.request(*make_request(rng))
+
+    queries_before = counter.count if counter else None
+    started = time.perf_counter()
+    latencies, errors = _issue(target, make_request, rng, requests)
+    total = time.perf_counter() - started
+
+    peak = None
+    if memory:
+        # A separate, short pass: tracing allocations slows every request down
+        tracemalloc.start()
+        for _ in range(min(3, requests)):
+            target.request(*make_request(rng))
+        peak = round(tracemalloc.get_traced_memory()[1] / 1024)
+        tracemalloc.stop()
+
+    return {
+        **_summary(latencies, errors, total),
+        "queries_per_request": (
+            round((counter.count - queries_before) / requests, 1) if counter else None
+        ),
+        "peak_kib": peak,
+    }
+
+
+def run_concurrent(make_target, make_request, requests, warmup, seed, concurrency):
+    """Issue ``requests`` requests from ``concurrency`` clients at once, each
+    with its own login and request sequence, and summarise them."""
+    targets = [make_target() for _ in range(concurrency)]
+    shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    outcomes = [None] * concurrency
+    ready = threading.Barrier(concurrency + 1)
+
+    def client(index):
+        rng = np.random.default_rng(seed + index)
+        for _ in range(warmup):
+            targets[index].request(*make_request(rng))
+        ready.wait()
+        outcomes[index] = _issue(targets[index], make_request, rng, shares[index])
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    total = time.perf_counter() - started
+    latencies = [latency for outcome in outcomes for latency in outcome[0]]
+    errors = sum(outcome[1] for outcome in outcomes)
+    return {**_summary(latencies, errors, total), "queries_per_request": None, "peak_kib": None}
+
+
+def _issue(target, make_request, rng, requests):
+    latencies = []
+    errors = 0
+    for _ in range(requests):
+        call = make_request(rng)
+        began = time.perf_counter()
+        status, _ = target.request(*call)
+        latencies.append(time.perf_counter() - began)
+        if status >= 400:
+            errors += 1
+    return latencies, errors
+
+
+def _summary(latencies, errors, total):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "p99_ms": _percentile(latencies, 99),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+        "throughput_rps": round(len(latencies) / total, 1),
+    }
+
+
+def max_rss_kib():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+COLUMNS = [
+    ("p50_ms", "p50 ms"), ("p95_ms", "p95 ms"), ("p99_ms", "p99 ms"),
+    ("throughput_rps", "req/s"), ("queries_per_request", "SQL/req"), ("peak_kib", "peak KiB"),
+]
+
+
+def format_results(results):
+    header = f"{'scenario':<20}" + "".join(f"{title:>11}" for _, title in COLUMNS) + f"{'errors':>8}"
+    lines = [header, "-" * len(header)]
+    for name, row in results["scenarios"].items():
+        cells = "".join(f"{'-' if row[key] is None else row[key]:>11}" for key, _ in COLUMNS)
+        lines.append(f"{name:<20}{cells}{row['errors']:>8}")
+    return "\n".join(lines)
+
+
+def compare(baseline, candidate):
+    """Rows of ``(scenario, metric, before, after, change %)`` for scenarios in both runs."""
+    rows = []
+    for name, before in baseline["scenarios"].items():
+        after = candidate["scenarios"].get(name)
+        if after is None:
+            continue
+        for key, _ in COLUMNS:
+            old, new = before.get(key), after.get(key)
+            change = round((new - old) / old * 100, 1) if old and new is not None else None
+            rows.append((name, key, old, new, change))
+    return rows
+
+
+def load(path):
+    with open(path) as handle:
+        return json.load(handle)
@@ -1,16 +1,13 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, Response
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, current_app, stream_with_context
 from flask_login import login_required, current_user
-from .models import Customer, Activity, User
+from .models import Customer, Activity, ArchivedActivity, User, ImportJob
 from . import db
-from sqlalchemy import or_, and_
-from datetime import datetime
-import io
-import csv
-import pandas as pd
-from werkzeug.utils import secure_filename
-import os
-from flask_babel import gettext, _
-import uuid
+from .exports import iter_csv, iter_gzip, iter_columnar, columnar_available, COLUMNAR_FORMATS, EXPORT_BATCH_SIZE
+from . import analytics, archive, autocomplete, changes, dashboard_cache, fragments, jobs, live, queries, rollups, search, user_cache, versions
+from .replicas import replica_reads
+from sqlalchemy import and_, delete, func, select
+from datetime import date, datetime
+from flask_babel import gettext
 
 main_bp = Blueprint("main", __name__)
 
@@ -36,6 +33,7 @@ def index():
 
 @main_bp.route("/dashboard")
 @login_required
+@replica_reads
 def dashboard():
     # Define allowed limits
     allowed_limits = [5, 10, 15, 20, 30]
@@ -56,25 +54,56 @@ def dashboard():
     if recent_limit not in allowed_limits:
         recent_limit = 5
 
-    # Fetch recent customers and activities with separate limits
-    customers = Customer.query.order_by(Customer.id.desc()).limit(customer_limit).all()
-    activities = (
-        Activity.query.join(Customer)
-        .join(User)
-        .order_by(Activity.timestamp.desc())
-        .limit(recent_limit)
-        .all()
-    )
+    # Recent customers and activities, cached per limit pair until the next write
+    data = dashboard_cache.get_dashboard(customer_limit, recent_limit)
 
     return render_template(
         "dashboard.html",
-        customers=customers,
-        activities=activities,
+        customers=data["customers"],
+        activities=data["activities"],
         customer_limit=customer_limit,
         recent_limit=recent_limit,
-        allowed_limits=allowed_limits
+        allowed_limits=allowed_limits,
+        live_since=live.watermark()
     )
 
+@main_bp.route("/analytics")
+@login_required
+@replica_reads
+def activity_analytics():
+    # ?granularity=day|week|month&group_by=customer|creator&start_date=&end_date=
+    # (inclusive); defaults to the last twelve months by month
+    end = datetime.utcnow().date()
+    start = date(end.year, 1, 1) if end.month == 12 else date(end.year - 1, end.month + 1, 1)
+    try:
+        if request.args.get("end_date"):
+            end = datetime.strptime(request.args["end_date"], "%Y-%m-%d").date()
+        if request.args.get("start_date"):
+            start = datetime.strptime(request.args["start_date"], "%Y-%m-%d").date()
+    except ValueError:
+        return jsonify({"error": gettext("Dates must be YYYY-MM-DD.")}), 400
+    granularity = request.args.get("granularity", "month")
+    group_by = request.args.get("group_by") or None
+    top = max(1, min(request.args.get("top", 10, type=int), 50))
+    if granularity not in analytics.GRANULARITIES or (group_by and group_by not in analytics.GROUPINGS):
+        return jsonify({"error": gettext("Unknown granularity or grouping.")}), 400
+    if start > end:
+        return jsonify({"error": gettext("Invalid date range.")}), 400
+    try:
+        return jsonify(analytics.summarize(start, end, granularity, group_by, top))
+    except ValueError:
+        return jsonify({"error": gettext("Too many buckets; choose a coarser granularity or a shorter range.")}), 400
+
+@main_bp.route("/cache/stats")
+@login_required
+def cache_stats():
+    # Counters are per worker; entries are shared with the sqlite backend
+    return jsonify({
+        "dashboard": dashboard_cache.get_cache().stats(),
+        "users": user_cache.get_cache().stats(),
+        "fragments": fragments.get_cache().stats(),
+    })
+
 # -----------------------------
 # Activities routes
 # -----------------------------
@@ -142,7 +171,6 @@ def add_activity_from_activities():
 @login_required
 def edit_activity(activity_id):
     activity = Activity.query.get_or_404(activity_id)
-    customers = Customer.query.all()
 
     if request.method == "POST":
         text = request.form.get("text")
@@ -166,7 +194,7 @@ def edit_activity(activity_id):
         flash(gettext("Activity updated successfully."), "success")
         return redirect(url_for("main.activities"))
 
-    return render_template("edit_activity.html", activity=activity, customers=customers)
+    return render_template("edit_activity.html", activity=activity, **_customer_choices())
 
 @main_bp.route("/edit_activity_ajax/<int:activity_id>", methods=["POST"])
 @login_required
@@ -207,72 +235,237 @@ def delete_activity(activity_id):
     flash(gettext("Activity deleted successfully."), "success")
     return redirect(url_for("main.activities"))
 
+# Upper bound for an explicit id list, well inside every backend's parameter limit
+MAX_BULK_DELETE_IDS = 10000
+
+def _delete_rows(model, criteria):
+    # One DELETE for all matching rows of the activities or the archive table;
+    # RETURNING hands back what the rollups and the monthly summary need to
+    # subtract. Without it the totals are aggregated first.
+    changes.record_deletes(db.session, model.__table__, and_(*criteria), Activity.__tablename__)
+    stmt = delete(model).where(*criteria).execution_options(synchronize_session=False)
+    if db.session.get_bind().dialect.delete_returning:
+        monthly = {}
+        for customer_id, creator_id, timestamp, price in db.session.execute(stmt.returning(
+            model.customer_id, model.creator_id, model.timestamp, model.price
+        )):
+            key = (analytics.month_start(timestamp), customer_id, creator_id)
+            count, revenue = monthly.get(key, (0, 0.0))
+            monthly[key] = (count + 1, revenue + (price or 0.0))
+        return [key + value for key, value in monthly.items()]
+    month = analytics.bucket(model.timestamp, "month", db.session.get_bind().dialect.name)
+    monthly = db.session.execute(
+        select(month, model.customer_id, model.creator_id, func.count(), func.sum(model.price))
+        .where(*criteria).group_by(month, model.customer_id, model.creator_id)
+    ).all()
+    db.session.execute(stmt)
+    return monthly
+
+def _delete_activities(criteria_for, start=None):
+    # criteria_for(model) gives the WHERE criteria for Activity or
+    # ArchivedActivity. Archived rows match the same filters on /activities,
+    # so they go too, unless the filter starts after the newest of them.
+    monthly = _delete_rows(Activity, criteria_for(Activity))
+    if archive.reaches(start):
+        monthly += _delete_rows(ArchivedActivity, criteria_for(ArchivedActivity))
+    totals = {}
+    for _, customer_id, _, count, revenue in monthly:
+        before = totals.get(customer_id, (0, 0.0))
+        totals[customer_id] = (before[0] + count, before[1] + (revenue or 0.0))
+    deleted = sum(count for count, _ in totals.values())
+    rollups.remove_totals(db.session.connection(), [
+        (customer_id, count, revenue) for customer_id, (count, revenue) in totals.items()
+    ])
+    analytics.remove_totals(db.session.connection(), monthly)
+    db.session.commit()
+    return deleted
+
+@main_bp.route("/activities/bulk_delete", methods=["POST"])
+@login_required
+def bulk_delete_activities():
+    # JSON or form body: {"ids": [...]} or any of the /activities filters
+    data = request.get_json(silent=True)
+    if data is None:
+        data = request.form.to_dict()
+        if "ids" in request.form:
+            data["ids"] = request.form.getlist("ids")
+    elif not isinstance(data, dict):
+        return jsonify({"error": gettext("Send a JSON object.")}), 400
+
+    try:
+        if data.get("ids"):
+            if not isinstance(data["ids"], list):
+                raise TypeError("ids must be a list")
+            ids = [int(value) for value in data["ids"]]
+            if len(ids) > MAX_BULK_DELETE_IDS:
+                return jsonify({"error": gettext("At most %(max)d ids per request.", max=MAX_BULK_DELETE_IDS)}), 400
+            start = None
+            def criteria_for(model):
+                return [model.id.in_(ids)]
+        else:
+            filters = {
+                "customer_id": int(data["customer_id"]) if data.get("customer_id") else None,
+                "text": data.get("text") or None,
+                "start_date": data.get("start_date") or None,
+                "end_date": data.get("end_date") or None,
+            }
+            start = datetime.strptime(filters["start_date"], "%Y-%m-%d") if filters["start_date"] else None
+            def criteria_for(model):
+                return queries.activity_criteria(**filters, model=model)
+        criteria = criteria_for(Activity)
+    except (TypeError, ValueError):
+        return jsonify({"error": gettext("Invalid ids or filter values.")}), 400
+    if not criteria:
+        # Never delete every activity because the filter came through empty
+        return jsonify({"error": gettext("Give activity ids or at least one filter.")}), 400
+
+    return jsonify({"deleted": _delete_activities(criteria_for, start)})
+
+def _activity_filter_args():
+    # Filters shared by /activities and everything that mirrors it
+    return {
+        "customer_id": request.args.get("customer_id", type=int),
+        "text": request.args.get("text", type=str),
+        "start_date": request.args.get("start_date"),
+        "end_date": request.args.get("end_date"),
+    }
+
+def _customer_choices():
+    # Template context for the customer <select>s: the options markup is cached
+    # per customers data version, so the list is only read when it is rendered
+    return {
+        "customers_version": versions.current(db.session.connection(), autocomplete.VERSION_NAME),
+        "load_customers": lambda: db.session.query(Customer.id, Customer.name).order_by(Customer.name).all(),
+    }
+
+def _page_size():
+    size = request.args.get("per_page", type=int) or current_app.config["ACTIVITIES_PAGE_SIZE"]
+    return max(1, min(size, current_app.config["ACTIVITIES_MAX_PAGE_SIZE"]))
+
+def _keyset_links(rows, per_page, after, before, endpoint, url_args):
+    # Trim a keyset page fetched with one extra row; returns (rows, prev_url, next_url)
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before:
+        rows.reverse()
+
+    has_next = has_more if not before else True
+    has_prev = bool(after) or (before is not None and has_more)
+
+    next_url = prev_url = None
+    if rows and has_next:
+        next_url = url_for(endpoint, after=queries.encode_cursor(rows[-1].timestamp, rows[-1].id), **url_args)
+    if rows and has_prev:
+        prev_url = url_for(endpoint, before=queries.encode_cursor(rows[0].timestamp, rows[0].id), **url_args)
+    return rows, prev_url, next_url
+
 @main_bp.route("/activities")
 @login_required
+@replica_reads
 def activities():
-    customer_id = request.args.get("customer_id", type=int)
-    text = request.args.get("text", type=str)
-    start_date = request.args.get("start_date")
-    end_date = request.args.get("end_date")
+    filters = _activity_filter_args()
+    per_page = _page_size()
+    after = queries.decode_cursor(request.args.get("after"))
+    before = None if after else queries.decode_cursor(request.args.get("before"))
 
-    query = Activity.query.join(Customer).join(User)
+    # Newest first; (timestamp, id) keeps the order total so no row is skipped
+    # or repeated between pages, and every page is an index range scan.
+    # Archived activities are merged in once a page reaches back to them.
+    rows = archive.activity_page(filters, per_page, after=after, before=before)
+
+    filter_args = {k: v for k, v in filters.items() if v}
+    if request.args.get("per_page"):
+        filter_args["per_page"] = per_page
+    rows, prev_url, next_url = _keyset_links(rows, per_page, after, before, "main.activities", filter_args)
 
-    if customer_id:
-        query = query.filter(Activity.customer_id == customer_id)
-    if text:
-        query = query.filter(Activity.text.ilike(f"%{text}%"))
-    if start_date:
-        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-        query = query.filter(Activity.timestamp >= start_dt)
-    if end_date:
-        end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-        query = query.filter(Activity.timestamp <= end_dt)
-
-    activities = query.order_by(Activity.timestamp.desc()).all()
-    customers = Customer.query.all()
     return render_template(
         "activities.html",
-        activities=activities,
-        customers=customers,
-        filter_customer_id=customer_id,
-        filter_text=text,
-        filter_start_date=start_date,
-        filter_end_date=end_date
+        activities=rows,
+        **_customer_choices(),
+        live_since=live.watermark(),
+        # New activities are added to the unfiltered first page; elsewhere the page offers a reload
+        live_insert=not filter_args and not after and not before,
+        filter_customer_id=filters["customer_id"],
+        filter_text=filters["text"],
+        filter_start_date=filters["start_date"],
+        filter_end_date=filters["end_date"],
+        next_url=next_url,
+        prev_url=prev_url
     )
 
+@main_bp.route("/activities/events")
+@login_required
+def activity_events():
+    # Server-Sent Events for activities written or deleted after Last-Event-ID
+    # (sent by the browser when it reconnects) or ?last_event_id= (the
+    # watermark the page was rendered at); without either, from now on.
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        since = int(last_event_id) if last_event_id else live.watermark()
+    except ValueError:
+        return jsonify({"error": gettext("Invalid event id.")}), 400
+    notifier = live.get_notifier()
+    if not notifier.slots.acquire(blocking=False):
+        # Every stream slot of this worker is taken; the page retries later
+        return Response(status=503, headers={"Retry-After": "10"})
+    db.session.close()
+    response = Response(
+        stream_with_context(live.stream(since)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    response.call_on_close(notifier.slots.release)
+    return response
+
+@main_bp.route("/customer_options")
+@login_required
+@replica_reads
+def customer_options():
+    # Lightweight id/name list for the on-demand customer pickers
+    customers = db.session.query(Customer.id, Customer.name).order_by(Customer.name).all()
+    return jsonify([{"id": c.id, "name": c.name} for c in customers])
+
 # -----------------------------
 # Customers routes
 # -----------------------------
 @main_bp.route("/customers")
 @login_required
+@replica_reads
 def customers():
-    search_query = request.args.get("q", "", type=str)
+    search_query = request.args.get("q", "", type=str).strip()
 
-    query = Customer.query
     if search_query:
-        query = query.filter(
-            gettext(
-                Customer.name.ilike(f"%{search_query}%"),
-                Customer.email.ilike(f"%{search_query}%"),
-                Customer.phone.ilike(f"%{search_query}%")
-            )
-        )
-
-    customers = query.order_by(Customer.name).all()
+        customers = search.search_customers(search_query, current_app.config["SEARCH_RESULT_LIMIT"])
+    else:
+        customers = db.session.execute(queries.customers_by_name()).scalars().all()
     return render_template("customers.html", customers=customers, search_query=search_query)
 
 @main_bp.route("/customer/<int:customer_id>")
 @login_required
+@replica_reads
 def view_customer(customer_id):
     customer = Customer.query.get_or_404(customer_id)
-    # Fetch activities sorted by timestamp descending
-    activities = (
-        Activity.query
-        .filter_by(customer_id=customer.id)
-        .order_by(Activity.timestamp.desc())
-        .all()
+    per_page = _page_size()
+    after = queries.decode_cursor(request.args.get("after"))
+    before = None if after else queries.decode_cursor(request.args.get("before"))
+    # The timeline pages like /activities filtered to this customer: newest
+    # first, and the archive is read only once a page reaches back to it
+    rows = archive.activity_page({"customer_id": customer.id}, per_page, after=after, before=before)
+    url_args = {"customer_id": customer.id}
+    if request.args.get("per_page"):
+        url_args["per_page"] = per_page
+    activities, prev_url, next_url = _keyset_links(rows, per_page, after, before, "main.view_customer", url_args)
+    return render_template(
+        "view_customer.html", customer=customer, activities=activities, stats=rollups.get_stats(customer.id),
+        archived_count=archive.count(customer.id), prev_url=prev_url, next_url=next_url
     )
-    return render_template("view_customer.html", customer=customer, activities=activities)
+
+@main_bp.route("/customer/<int:customer_id>/stats")
+@login_required
+@replica_reads
+def customer_stats(customer_id):
+    Customer.query.get_or_404(customer_id)
+    return jsonify(rollups.get_stats(customer_id))
 
 @main_bp.route("/add_customer", methods=["GET", "POST"])
 @login_required
@@ -327,31 +520,15 @@ def delete_customer(customer_id):
 
 @main_bp.route("/search_customers")
 @login_required
+@replica_reads
 def search_customers():
+    # Served from the per-worker typeahead index; no database hit per keystroke
     query = request.args.get("q", "").strip()
-    if query:
-        customers = Customer.query.filter(
-            or_(
-                Customer.name.ilike(f"%{query}%"),
-                Customer.email.ilike(f"%{query}%"),
-                Customer.phone.ilike(f"%{query}%"),
-                Customer.address.ilike(f"%{query}%")
-            )
-        ).all()
-    else:
-        customers = Customer.query.all()
-
-    # Return JSON data
-    results = []
-    for c in customers:
-        results.append({
-            "id": c.id,
-            "name": c.name,
-            "email": c.email,
-            "phone": c.phone,
-            "address": c.address
-        })
-    return jsonify(results)
+    rows = autocomplete.get_index().search(query, current_app.config["AUTOCOMPLETE_LIMIT"])
+    return jsonify([
+        {"id": id, "name": name, "email": email, "phone": phone, "address": address}
+        for id, name, email, phone, address in rows
+    ])
 
 # -----------------------------
 # Settings routes
@@ -365,31 +542,61 @@ def settings():
 @login_required
 def save_settings():
     data = request.get_json()
-    current_user.primary_color = data.get("primary_color", current_user.primary_color)
-    current_user.sidebar_bg_color = data.get("sidebar_bg_color", current_user.sidebar_bg_color)
-    current_user.text_color = data.get("text_color", current_user.text_color)
-    current_user.theme = data.get("theme", current_user.theme)
+    # current_user is a detached copy from the user cache; update the stored row
+    user = db.session.get(User, current_user.id)
+    user.primary_color = data.get("primary_color", user.primary_color)
+    user.sidebar_bg_color = data.get("sidebar_bg_color", user.sidebar_bg_color)
+    user.text_color = data.get("text_color", user.text_color)
+    user.theme = data.get("theme", user.theme)
     db.session.commit()
     return jsonify({"status": "success"})
 
 # ----------------------------
 # Export Customers
 # ----------------------------
+def _export_response(header, rows, filename, headers=None, types=None):
+    # Stream the CSV as it is produced; ?gzip=1 compresses it on the fly.
+    # ?format=parquet or ?format=arrow writes typed columns instead (``types``
+    # gives each column's kind), one row group per batch.
+    fmt = request.args.get("format", "csv")
+    if fmt != "csv":
+        if fmt not in COLUMNAR_FORMATS or types is None:
+            return jsonify({"error": gettext("Unknown export format.")}), 400
+        if not columnar_available():
+            return jsonify({"error": gettext("Parquet and Arrow exports need pyarrow installed.")}), 400
+        extension, mimetype = COLUMNAR_FORMATS[fmt]
+        return Response(
+            stream_with_context(iter_columnar(fmt, list(zip(header, types)), rows)),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f"attachment;filename={filename.rsplit('.', 1)[0]}.{extension}",
+                     **(headers or {})}
+        )
+    chunks = iter_csv(header, rows)
+    if request.args.get("gzip", type=int):
+        return Response(
+            stream_with_context(iter_gzip(chunks)),
+            mimetype="application/gzip",
+            headers={"Content-Disposition": f"attachment;filename={filename}.gz", **(headers or {})}
+        )
+    return Response(
+        stream_with_context(chunks),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment;filename={filename}", **(headers or {})}
+    )
+
 @main_bp.route("/export/customers")
 @login_required
+@replica_reads
 def export_customers():
-    customers = Customer.query.all()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["ID", "Name", "Email", "Phone", "Address"])
-    for c in customers:
-        writer.writerow([c.id, c.name, c.email, c.phone, c.address])
-    
-    output.seek(0)
-    return Response(
-        output,
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment;filename=customers.csv"}
+    stmt = (
+        select(Customer.id, Customer.name, Customer.email, Customer.phone, Customer.address)
+        .order_by(Customer.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    rows = db.session.execute(stmt)
+    return _export_response(
+        ["ID", "Name", "Email", "Phone", "Address"], rows, "customers.csv",
+        types=["int", "str", "str", "str", "str"]
     )
 
 # ----------------------------
@@ -397,25 +604,94 @@ def export_customers():
 # ----------------------------
 @main_bp.route("/export/activities")
 @login_required
+@replica_reads
 def export_activities():
-    activities = Activity.query.all()
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["ID", "CustomerID", "CustomerName", "Text", "Price", "Creator", "Timestamp"])
-    for a in activities:
-        writer.writerow([a.id, a.customer.id, a.customer.name, a.text, a.price, a.creator.username, a.timestamp])
-    
-    output.seek(0)
-    return Response(
-        output,
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment;filename=activities.csv"}
+    # Customer and creator names come from the same query (no per-row lazy loads),
+    # and the same filters as /activities apply, archive included when they reach it.
+    filters = _activity_filter_args()
+
+    def build(model):
+        stmt = queries.filter_activities(
+            select(
+                model.id,
+                model.customer_id,
+                Customer.name,
+                model.text,
+                model.price,
+                User.username,
+                model.timestamp,
+            )
+            .join(Customer, model.customer_id == Customer.id)
+            .join(User, model.creator_id == User.id),
+            **filters,
+            model=model
+        )
+        return stmt.order_by(model.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    rows = archive.export_rows(build, filters)
+    return _export_response(
+        ["ID", "CustomerID", "CustomerName", "Text", "Price", "Creator", "Timestamp"],
+        rows,
+        "activities.csv",
+        types=["int", "int", "str", "str", "float", "str", "datetime"]
     )
 
-ALLOWED_EXTENSIONS = {'csv'}
+# ----------------------------
+# Delta exports
+# ----------------------------
+CHANGE_COLUMNS = {
+    "customers": (
+        Customer,
+        ["name", "email", "phone", "address"],
+        ["Name", "Email", "Phone", "Address"],
+        ["str", "str", "str", "str"],
+    ),
+    "activities": (
+        Activity,
+        ["customer_id", "text", "price", "creator_id", "timestamp"],
+        ["CustomerID", "Text", "Price", "CreatorID", "Timestamp"],
+        ["int", "str", "float", "int", "datetime"],
+    ),
+}
+
+@main_bp.route("/export/<any(customers, activities):kind>/changes")
+@login_required
+@replica_reads
+def export_changes(kind):
+    # Rows changed or deleted after the ?since= watermark (the X-Watermark of
+    # the previous page); without it, every row. Pages end on a transaction
+    # boundary, and X-More-Changes says whether to fetch the next one.
+    model, columns, titles, types = CHANGE_COLUMNS[kind]
+    since = request.args.get("since", -1, type=int)
+    limit = min(request.args.get("limit", current_app.config["CHANGES_PAGE_SIZE"], type=int),
+                current_app.config["CHANGES_PAGE_SIZE"])
+    if limit < 1:
+        return jsonify({"error": gettext("limit must be at least 1.")}), 400
+    upto, more = changes.change_window(model, since, limit)
+    rows = changes.iter_changes(model, columns + ["created_at", "updated_at"], since, upto, EXPORT_BATCH_SIZE)
+    headers = {"X-Watermark": str(upto), "X-More-Changes": "1" if more else "0"}
+    if more:
+        next_url = url_for("main.export_changes", kind=kind, since=upto, limit=limit,
+                           format=request.args.get("format"))
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    return _export_response(
+        ["Op", "ChangeSeq", "ID"] + titles + ["CreatedAt", "UpdatedAt"],
+        rows,
+        f"{kind}-changes-{upto}.csv",
+        headers=headers,
+        types=["str", "int", "int"] + types + ["datetime", "datetime"]
+    )
+
+ALLOWED_EXTENSIONS = {'csv', 'parquet', 'arrow', 'feather'}
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    if '.' not in filename:
+        return False
+    extension = filename.rsplit('.', 1)[1].lower()
+    if extension != 'csv' and extension in ALLOWED_EXTENSIONS and not columnar_available():
+        flash(gettext("Parquet and Arrow imports need pyarrow installed."), "warning")
+        return False
+    return extension in ALLOWED_EXTENSIONS
 
 @main_bp.route("/import/customers", methods=["GET", "POST"])
 @login_required
@@ -431,50 +707,7 @@ def import_customers():
             return redirect(request.url)
 
         if file and allowed_file(file.filename):
-            df = pd.read_csv(file, dtype=str)  # force all columns as strings
-            df = df.fillna("")  # replace NaN with empty strings
-
-            added_count = 0
-            skipped_count = 0
-
-            for _, row in df.iterrows():
-                name = row.get("Name", "").strip() or gettext("Unnamed Customer")
-                email = row.get("Email", "").strip()
-                phone = row.get("Phone", "").strip()
-                address = row.get("Address", "").strip()
-
-                # ✅ If all are empty, generate unique placeholder values
-                if not email:
-                    email = f"email_{uuid.uuid4().hex[:8]}@email.com"
-                if not phone:
-                    phone = f"09XX-{uuid.uuid4().hex[:4]}"
-                if not address:
-                    address = f"Unknown Address {uuid.uuid4().hex[:4]}"
-
-                # ✅ Check for existing by email only if valid (not placeholder)
-                existing = Customer.query.filter_by(email=email).first()
-                if existing:
-                    skipped_count += 1
-                    continue
-
-                customer = Customer(
-                    name=name,
-                    email=email,
-                    phone=phone,
-                    address=address
-                )
-                db.session.add(customer)
-                added_count += 1
-
-            db.session.commit()
-
-            flash(gettext(
-                "Customers imported successfully — %(added)d added, %(skipped)d skipped.",
-                added=added_count,
-                skipped=skipped_count
-            ), "success")
-
-            return redirect(url_for("main.customers"))
+            return _import_queued(jobs.enqueue("customers", file, current_user.id))
 
     return render_template("import_customers.html")
 
@@ -484,21 +717,40 @@ def import_activities():
     if request.method == "POST":
         file = request.files.get("file")
         if file and allowed_file(file.filename):
-            df = pd.read_csv(file)
-            for _, row in df.iterrows():
-                customer = Customer.query.get(row["CustomerID"])
-                creator = User.query.filter_by(username=row["Creator"]).first()  # adjust as needed
-                if customer and creator:
-                    activity = Activity(
-                        customer_id=customer.id,
-                        text=row["Text"],
-                        price=float(row.get("Price", 0.0)),
-                        creator_id=creator.id,
-                        timestamp=pd.to_datetime(row["Timestamp"])
-                    )
-                    db.session.add(activity)
-            db.session.commit()
-            flash(gettext("Activities imported successfully"))
-            return redirect(url_for("main.activities"))
+            return _import_queued(jobs.enqueue("activities", file, current_user.id))
     return render_template("import_activities.html")
 
+# ----------------------------
+# Import jobs
+# ----------------------------
+def _import_queued(job):
+    # The upload is spooled; `flask jobs worker` does the parsing and writing
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({
+            "job_id": job.id,
+            "status_url": url_for("main.import_job_status", job_id=job.id)
+        }), 202
+    flash(gettext("Import queued as job #%(id)d.", id=job.id))
+    return redirect(url_for("main.import_job", job_id=job.id))
+
+@main_bp.route("/import/jobs/<int:job_id>")
+@login_required
+def import_job(job_id):
+    job = db.get_or_404(ImportJob, job_id)
+    return render_template("import_job.html", job=job, status=jobs.status(job))
+
+@main_bp.route("/import/jobs/<int:job_id>/status")
+@login_required
+def import_job_status(job_id):
+    return jsonify(jobs.status(db.get_or_404(ImportJob, job_id)))
+
+@main_bp.route("/import/jobs/<int:job_id>/resume", methods=["POST"])
+@login_required
+def resume_import_job(job_id):
+    job = db.get_or_404(ImportJob, job_id)
+    if jobs.resume(job):
+        flash(gettext("Import job #%(id)d queued again.", id=job.id))
+    else:
+        flash(gettext("Only failed imports can be resumed."), "warning")
+    return redirect(url_for("main.import_job", job_id=job.id))
+
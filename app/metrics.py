@@ -0,0 +1,327 @@
+import glob
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from flask import (
+    Response, abort, before_render_template, current_app, g, has_request_context, request, template_rendered
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Per-request timing and SQL accounting, exported at /metrics in the
+# Prometheus text format. Every worker keeps its own numbers; with
+# METRICS_DIR set, workers also dump them there and /metrics adds up all
+# workers' files, so any worker can answer a scrape.
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+DUMP_INTERVAL = 5.0
+# Cache label -> app.extensions key of the cache whose counters are exported
+CACHES = {"dashboard": "dashboard_cache", "users": "user_cache", "fragments": "fragment_cache"}
+
+
+class Registry:
+    """Histograms and counters keyed by label values; cheap enough to update per query."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # name -> (kind, help, label names, buckets)
+        self.families = {}
+        # name -> {label values tuple: [bucket counts..., sum, count] or [value]}
+        self.values = {}
+
+    def histogram(self, name, help, labels, buckets):
+        self.families[name] = ("histogram", help, labels, buckets)
+        self.values[name] = {}
+
+    def counter(self, name, help, labels):
+        self.families[name] = ("counter", help, labels, None)
+        self.values[name] = {}
+
+    def observe(self, name, value, *labels):
+        buckets = self.families[name][3]
+        with self._lock:
+            series = self.values[name].get(labels)
+            if series is None:
+                series = self.values[name][labels] = [0] * (len(buckets) + 1) + [0.0, 0]
+            # Bucket counts are stored per bucket and summed up when rendered
+            series[bisect_left(buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def inc(self, name, *labels, amount=1):
+        with self._lock:
+            series = self.values[name].setdefault(labels, [0])
+            series[0] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return {name: [[list(k), list(v)] for k, v in series.items()] for name, series in self.values.items()}
+
+
+def _merge(total, snapshot):
+    for name, series in snapshot.items():
+        merged = total.setdefault(name, {})
+        for labels, values in series:
+            key = tuple(labels)
+            if key in merged:
+                merged[key] = [a + b for a, b in zip(merged[key], values)]
+            else:
+                merged[key] = list(values)
+
+
+def _label_text(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(families, values):
+    lines = []
+    for name, (kind, help, label_names, buckets) in families.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, series in sorted(values.get(name, {}).items()):
+            if kind == "counter":
+                lines.append(f"{name}{_label_text(label_names, labels)} {series[0]}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ["+Inf"], series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{name}_bucket{_label_text(label_names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(label_names, labels)} {series[-2]}")
+            lines.append(f"{name}_count{_label_text(label_names, labels)} {series[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def _new_registry():
+    registry = Registry()
+    registry.histogram(
+        "kartoteka_http_request_duration_seconds", "Time spent in the view, per endpoint.",
+        ("endpoint", "method", "status"), REQUEST_BUCKETS
+    )
+    registry.histogram(
+        "kartoteka_http_request_sql_queries", "SQL statements issued per request.",
+        ("endpoint",), COUNT_BUCKETS
+    )
+    registry.histogram(
+        "kartoteka_http_request_sql_seconds", "Time spent in SQL per request.",
+        ("endpoint",), REQUEST_BUCKETS
+    )
+    registry.histogram(
+        "kartoteka_sql_query_duration_seconds", "Duration of single SQL statements.",
+        ("endpoint",), QUERY_BUCKETS
+    )
+    registry.histogram(
+        "kartoteka_template_render_seconds", "Time spent rendering a template, per template.",
+        ("template",), QUERY_BUCKETS
+    )
+    registry.counter(
+        "kartoteka_sql_slow_queries_total", "Statements slower than SLOW_QUERY_MS.", ("endpoint",)
+    )
+    registry.counter(
+        "kartoteka_n_plus_one_total", "Requests that repeated one statement N_PLUS_ONE_THRESHOLD times or more.",
+        ("endpoint",)
+    )
+    registry.counter(
+        "kartoteka_cache_hits_total", "Cache lookups answered from the cache.", ("cache",)
+    )
+    registry.counter(
+        "kartoteka_cache_misses_total", "Cache lookups that had to be rebuilt.", ("cache",)
+    )
+    registry.counter(
+        "kartoteka_auth_attempts_total", "Login and registration attempts, accepted or throttled.",
+        ("endpoint", "outcome")
+    )
+    return registry
+
+
+def _before_render_template(app, template, context, **extra):
+    g.setdefault("render_started", []).append(time.perf_counter())
+
+
+def _template_rendered(app, template, context, **extra):
+    started = g.get("render_started")
+    if started:
+        app.extensions["metrics"].observe(
+            "kartoteka_template_render_seconds", time.perf_counter() - started.pop(), template.name or "string"
+        )
+
+
+def _endpoint():
+    return request.endpoint or "unmatched"
+
+
+# -- SQL hooks ---------------------------------------------------------------
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    if not has_request_context():
+        return
+    stats = g.get("sql_stats")
+    registry = current_app.extensions.get("metrics")
+    if stats is None or registry is None:
+        # Outside the view (e.g. a streamed export body) or metrics disabled
+        return
+    elapsed = time.perf_counter() - started
+    stats["count"] += 1
+    stats["seconds"] += elapsed
+    stats["statements"][statement] += 1
+
+    endpoint = _endpoint()
+    registry.observe("kartoteka_sql_query_duration_seconds", elapsed, endpoint)
+    if elapsed * 1000 >= current_app.config["SLOW_QUERY_MS"]:
+        registry.inc("kartoteka_sql_slow_queries_total", endpoint)
+        logger.warning("Slow query (%.0f ms) in %s: %s", elapsed * 1000, endpoint, statement[:1000])
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None:
+        started = context.connection.info.get("query_started")
+        if started:
+            started.pop()
+
+
+# -- request hooks -----------------------------------------------------------
+
+def _before_request():
+    g.request_started = time.perf_counter()
+    g.sql_stats = {"count": 0, "seconds": 0.0, "statements": Counter()}
+
+
+def _after_request(response):
+    started = g.pop("request_started", None)
+    stats = g.pop("sql_stats", None)
+    if started is None or stats is None:
+        return response
+    registry = current_app.extensions["metrics"]
+    endpoint = _endpoint()
+    registry.observe(
+        "kartoteka_http_request_duration_seconds", time.perf_counter() - started,
+        endpoint, request.method, str(response.status_code)
+    )
+    registry.observe("kartoteka_http_request_sql_queries", stats["count"], endpoint)
+    registry.observe("kartoteka_http_request_sql_seconds", stats["seconds"], endpoint)
+
+    if stats["statements"]:
+        statement, repeats = stats["statements"].most_common(1)[0]
+        if repeats >= current_app.config["N_PLUS_ONE_THRESHOLD"]:
+            registry.inc("kartoteka_n_plus_one_total", endpoint)
+            logger.warning(
+                "Possible N+1 in %s: one statement ran %d times (%d statements in total): %s",
+                endpoint, repeats, stats["count"], statement[:500]
+            )
+
+    _maybe_dump(registry)
+    return response
+
+
+# -- multi-worker aggregation ------------------------------------------------
+
+def _collect(registry):
+    # Cache counters live on the cache objects; copy them in at collection time
+    snapshot = registry.snapshot()
+    for cache_name, extension in CACHES.items():
+        cache = current_app.extensions.get(extension)
+        if cache is not None:
+            snapshot["kartoteka_cache_hits_total"].append([[cache_name], [cache.hits]])
+            snapshot["kartoteka_cache_misses_total"].append([[cache_name], [cache.misses]])
+    return snapshot
+
+
+def _dump_path(directory):
+    return os.path.join(directory, f"metrics-{os.getpid()}.json")
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _maybe_dump(registry, force=False):
+    directory = current_app.config["METRICS_DIR"]
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - getattr(registry, "dumped_at", 0.0) < DUMP_INTERVAL:
+        return
+    registry.dumped_at = now
+    os.makedirs(directory, exist_ok=True)
+    path = _dump_path(directory)
+    with open(path + ".tmp", "w") as handle:
+        json.dump(_collect(registry), handle)
+    os.replace(path + ".tmp", path)
+
+
+def metrics_view():
+    # Per-endpoint traffic and SQL timings are not public: without a token
+    # configured there is no way in
+    token = current_app.config["METRICS_TOKEN"]
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        abort(401)
+    registry = current_app.extensions["metrics"]
+    values = {}
+    _merge(values, _collect(registry))
+    directory = current_app.config["METRICS_DIR"]
+    if directory:
+        # Other workers' latest dumps. A recycled worker's file goes with it:
+        # its counters would otherwise be added forever
+        own = _dump_path(directory)
+        for path in glob.glob(os.path.join(directory, "metrics-*.json")):
+            if path == own:
+                continue
+            pid = os.path.basename(path)[len("metrics-"):-len(".json")]
+            if pid.isascii() and pid.isdigit() and not _alive(int(pid)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as handle:
+                    _merge(values, json.load(handle))
+            except (OSError, ValueError):
+                continue
+    return Response(render(registry.families, values), mimetype="text/plain; version=0.0.4")
+
+
+def init_metrics(app):
+    if not app.config["METRICS_ENABLED"]:
+        return
+    app.extensions["metrics"] = _new_registry()
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
@@ -1,4 +1,5 @@
 from . import db
+from flask import current_app, has_app_context
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
@@ -17,11 +18,24 @@ class User(UserMixin, db.Model):
     theme = db.Column(db.String(10), default="light")
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        method = _password_hash_method()
+        if method:
+            self.password_hash = generate_password_hash(password, method=method)
+        else:
+            self.password_hash = generate_password_hash(password)
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def password_needs_rehash(self):
+        """True when the stored hash was made with other than PASSWORD_HASH_METHOD."""
+        method = _password_hash_method()
+        return bool(method) and self.password_hash.split("$", 1)[0] != method
+
+
+def _password_hash_method():
+    return current_app.config.get("PASSWORD_HASH_METHOD") if has_app_context() else None
+
 
 class Customer(db.Model):
     __tablename__ = "customers"
@@ -30,21 +44,145 @@ class Customer(db.Model):
     email = db.Column(db.String(150), nullable=False, unique=True)
     phone = db.Column(db.String(50))
     address = db.Column(db.String(255))
-    activities = db.relationship("Activity", back_populates="customer", cascade="all, delete-orphan")
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Value of the "changes" counter when the row was last written (see app/changes.py)
+    change_seq = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
+    # The foreign keys cascade in the database; passive_deletes keeps the ORM
+    # from loading every activity just to delete it.
+    activities = db.relationship(
+        "Activity", back_populates="customer", cascade="all, delete-orphan", passive_deletes=True
+    )
+    stats = db.relationship("CustomerStats", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        db.Index("ix_customers_name", "name"),
+        db.Index("ix_customers_change_seq", "change_seq", "id"),
+    )
 
 
 class Activity(db.Model):
     __tablename__ = "activities"
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String(255), nullable=False)
-    customer_id = db.Column(db.Integer, db.ForeignKey("customers.id"), nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey("customers.id", ondelete="CASCADE"), nullable=False)
     creator_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     price = db.Column(db.Float, default=0.0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    change_seq = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
 
     # Relationships
     customer = db.relationship("Customer", back_populates="activities")
     creator = db.relationship("User")
 
+    # Every listing is newest first: /activities and the dashboard walk
+    # (timestamp, id), the customer timeline walks (customer_id, timestamp).
+    # B-tree indexes are scanned backwards just as cheaply, so plain ascending
+    # columns serve ORDER BY ... DESC too.
+    __table_args__ = (
+        db.Index("ix_activities_timestamp_id", "timestamp", "id"),
+        db.Index("ix_activities_customer_timestamp", "customer_id", "timestamp", "id"),
+        db.Index("ix_activities_creator_id", "creator_id"),
+        db.Index("ix_activities_change_seq", "change_seq", "id"),
+    )
 
-    
+    archived = False
+
+
+class ArchivedActivity(db.Model):
+    # Cold storage for old activities, moved here by `flask archive move`
+    # (see app/archive.py). Same columns and ids as activities; read-only.
+    __tablename__ = "activities_archive"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    text = db.Column(db.String(255), nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey("customers.id", ondelete="CASCADE"), nullable=False)
+    creator_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    price = db.Column(db.Float, default=0.0)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    change_seq = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    customer = db.relationship("Customer")
+    creator = db.relationship("User")
+
+    __table_args__ = (
+        db.Index("ix_activities_archive_timestamp_id", "timestamp", "id"),
+        db.Index("ix_activities_archive_customer_timestamp", "customer_id", "timestamp", "id"),
+        db.Index("ix_activities_archive_change_seq", "change_seq", "id"),
+    )
+
+    archived = True
+
+
+class DataVersion(db.Model):
+    # Monotonic change counters, bumped in the same transaction as the writes
+    # they describe; lets per-worker caches notice changes made by other workers.
+    __tablename__ = "data_versions"
+    name = db.Column(db.String(32), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class CustomerStats(db.Model):
+    # Per-customer activity rollup, maintained incrementally by app/rollups.py
+    __tablename__ = "customer_stats"
+    customer_id = db.Column(db.Integer, db.ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True)
+    activity_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    last_activity_at = db.Column(db.DateTime)
+
+
+class MonthlyActivityStats(db.Model):
+    # Activity count and revenue per month, customer and creator, maintained
+    # incrementally by app/analytics.py
+    __tablename__ = "activity_monthly"
+    month = db.Column(db.Date, primary_key=True)  # first day of the month
+    customer_id = db.Column(db.Integer, db.ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True)
+    creator_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    activity_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    __table_args__ = (db.Index("ix_activity_monthly_customer_month", "customer_id", "month"),)
+
+
+class ImportJob(db.Model):
+    # Queued CSV import, run by `flask jobs worker` (see app/jobs.py)
+    __tablename__ = "import_jobs"
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)  # "customers" or "activities"
+    status = db.Column(db.String(16), nullable=False, default="queued")
+    filename = db.Column(db.String(255), nullable=False)
+    path = db.Column(db.String(512), nullable=False)  # spooled upload
+    created_by = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    worker = db.Column(db.String(64))
+    chunk_size = db.Column(db.Integer, nullable=False)  # fixed per job so a resume skips whole chunks
+    # Progress, committed together with each chunk's rows
+    chunks_done = db.Column(db.Integer, nullable=False, default=0)
+    elapsed = db.Column(db.Float, nullable=False, default=0.0)
+    rows = db.Column(db.Integer, nullable=False, default=0)
+    added = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    duplicates = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)
+    rejections = db.Column(db.JSON)
+    error = db.Column(db.Text)
+
+    __table_args__ = (db.Index("ix_import_jobs_status_id", "status", "id"),)
+
+
+class Tombstone(db.Model):
+    # One row per deleted customer or activity, for the delta exports
+    __tablename__ = "tombstones"
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(32), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    change_seq = db.Column(db.BigInteger, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (db.Index("ix_tombstones_table_change_seq", "table_name", "change_seq", "id"),)
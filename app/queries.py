@@ -0,0 +1,114 @@
+from datetime import datetime
+
+from sqlalchemy import literal, select, tuple_
+from sqlalchemy.orm import contains_eager, joinedload
+
+from . import search
+from .models import Activity, Customer, CustomerStats, User
+
+# Statement builders for the hot read paths. Routes execute them and
+# `flask plans check` EXPLAINs the very same statements, so a change here
+# is covered by the plan regression check.
+
+
+def recent_customers(limit):
+    return select(Customer).order_by(Customer.id.desc()).limit(limit)
+
+
+def recent_activities(limit):
+    return (
+        select(Activity)
+        .join(Customer, Activity.customer_id == Customer.id)
+        .join(User, Activity.creator_id == User.id)
+        .options(contains_eager(Activity.customer), contains_eager(Activity.creator))
+        .order_by(Activity.timestamp.desc(), Activity.id.desc())
+        .limit(limit)
+    )
+
+
+def customers_by_name():
+    return select(Customer).options(joinedload(Customer.stats)).order_by(Customer.name)
+
+
+def customer_page(columns, limit, after=None, with_stats=False):
+    """Customers in id order after the id ``after``, plus one row to tell
+    whether another page follows; ``columns`` may include CustomerStats ones."""
+    stmt = select(Customer.id, *columns)
+    if with_stats:
+        stmt = stmt.outerjoin(CustomerStats, CustomerStats.customer_id == Customer.id)
+    if after is not None:
+        stmt = stmt.where(Customer.id > after)
+    return stmt.order_by(Customer.id).limit(limit + 1)
+
+
+# The activity builders take ``model=ArchivedActivity`` to run the same
+# statement against the archive table (see app/archive.py).
+
+def activity_rows(model=Activity):
+    """Activities as plain rows with the customer and creator names joined in."""
+    return (
+        select(
+            model.id,
+            model.text,
+            model.price,
+            model.timestamp,
+            model.customer_id,
+            Customer.name.label("customer_name"),
+            User.username.label("creator_name"),
+            literal(model.archived).label("archived"),
+        )
+        .join(Customer, model.customer_id == Customer.id)
+        .join(User, model.creator_id == User.id)
+    )
+
+
+def activity_criteria(customer_id=None, text=None, start_date=None, end_date=None, model=Activity):
+    """WHERE criteria for the /activities filters (dates as ``YYYY-MM-DD`` strings)."""
+    criteria = []
+    if customer_id:
+        criteria.append(model.customer_id == customer_id)
+    if text:
+        criteria.append(search.activity_text_filter(text, model))
+    if start_date:
+        criteria.append(model.timestamp >= datetime.strptime(start_date, "%Y-%m-%d"))
+    if end_date:
+        criteria.append(model.timestamp <= datetime.strptime(end_date, "%Y-%m-%d"))
+    return criteria
+
+
+def filter_activities(stmt, customer_id=None, text=None, start_date=None, end_date=None, model=Activity):
+    """Apply the /activities filters to ``stmt``."""
+    return stmt.where(*activity_criteria(customer_id, text, start_date, end_date, model))
+
+
+# Keyset cursors are "<timestamp iso>~<id>" of the boundary row
+def encode_cursor(timestamp, row_id):
+    return f"{timestamp.isoformat()}~{row_id}"
+
+
+def decode_cursor(cursor):
+    """``(timestamp, id)`` from :func:`encode_cursor`; None when missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        timestamp, row_id = cursor.rsplit("~", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        return None
+
+
+def keyset_page(stmt, limit, after=None, before=None, model=Activity):
+    """Newest-first page of ``stmt`` bounded by a ``(timestamp, id)`` cursor.
+
+    ``after`` continues towards older rows, ``before`` goes back towards newer
+    ones (rows come back oldest first and must be reversed). One extra row is
+    fetched so the caller can tell whether there is another page.
+    """
+    key = tuple_(model.timestamp, model.id)
+    if before:
+        stmt = stmt.where(key > before).order_by(model.timestamp.asc(), model.id.asc())
+    else:
+        if after:
+            stmt = stmt.where(key < after)
+        stmt = stmt.order_by(model.timestamp.desc(), model.id.desc())
+    return stmt.limit(limit + 1)
@@ -0,0 +1,153 @@
+import json
+import sys
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import func, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from . import archive, db, queries
+from .models import Activity, ArchivedActivity, Customer, CustomerStats
+
+
+class explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(explain, "postgresql")
+def _explain_postgresql(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+@compiles(explain, "sqlite")
+def _explain_sqlite(element, compiler, **kw):
+    return "EXPLAIN QUERY PLAN " + compiler.process(element.statement, **kw)
+
+
+def _hot_queries():
+    # (name, statement, tables that must be reached through an index),
+    # mirroring what the routes execute
+    customer_id = db.session.execute(
+        select(Activity.customer_id).group_by(Activity.customer_id)
+        .order_by(func.count().desc()).limit(1)
+    ).scalar()
+    newest = db.session.execute(select(func.max(Activity.timestamp))).scalar() or datetime.utcnow()
+    month_ago = (newest - timedelta(days=30)).strftime("%Y-%m-%d")
+    page = db.session.execute(queries.keyset_page(queries.activity_rows(), 50)).all()
+    cursor = (page[-1].timestamp, page[-1].id) if page else (newest, 0)
+
+    both = (Activity.__tablename__, Customer.__tablename__)
+    archived = (ArchivedActivity.__tablename__, Customer.__tablename__)
+    return [
+        # Walks the primary key backwards; SQLite reports a rowid walk as "SCAN",
+        # so only the no-sort check applies here.
+        ("dashboard: recent customers", queries.recent_customers(30), ()),
+        ("dashboard: recent activities", queries.recent_activities(30), both),
+        ("activities: first page", queries.keyset_page(queries.activity_rows(), 50), both),
+        ("activities: next page", queries.keyset_page(queries.activity_rows(), 50, after=cursor), both),
+        ("activities: previous page", queries.keyset_page(queries.activity_rows(), 50, before=cursor), both),
+        ("activities: customer filter", queries.keyset_page(
+            queries.filter_activities(queries.activity_rows(), customer_id=customer_id), 50), both),
+        ("activities: date filter", queries.keyset_page(
+            queries.filter_activities(queries.activity_rows(), start_date=month_ago), 50), both),
+        ("view_customer: timeline next page", queries.keyset_page(
+            queries.filter_activities(queries.activity_rows(), customer_id=customer_id), 50, after=cursor), both),
+        ("customers: first page by name", queries.customers_by_name().limit(50), both),
+        ("api: customers page", queries.customer_page(
+            [Customer.name, CustomerStats.revenue], 100, after=customer_id, with_stats=True), (Customer.__tablename__,)),
+        ("activities: archived page", queries.keyset_page(
+            queries.activity_rows(ArchivedActivity), 50, after=cursor, model=ArchivedActivity), archived),
+        ("view_customer: archived timeline", queries.keyset_page(
+            queries.filter_activities(queries.activity_rows(ArchivedActivity), customer_id=customer_id, model=ArchivedActivity),
+            50, after=cursor, model=ArchivedActivity), archived),
+        ("view_customer: archived count", select(func.count()).select_from(archive.archive)
+            .where(archive.archive.c.customer_id == customer_id), (ArchivedActivity.__tablename__,)),
+    ]
+
+
+def _sqlite_problems(rows, tables):
+    problems = []
+    for row in rows:
+        detail = row.detail
+        for table in tables:
+            if detail in (f"SCAN {table}", f"SCAN TABLE {table}"):
+                problems.append(f"full scan of {table}")
+        if "USE TEMP B-TREE FOR ORDER BY" in detail:
+            problems.append("sort instead of index order")
+    return problems
+
+
+def _postgresql_problems(plan, tables):
+    problems = []
+
+    def walk(node):
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in tables:
+            problems.append(f"sequential scan of {node['Relation Name']}")
+        if node["Node Type"] in ("Sort", "Incremental Sort"):
+            problems.append("sort instead of index order")
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return problems
+
+
+def check_plans(verbose=False):
+    """EXPLAIN every hot query; return ``{name: [problems]}`` for the bad ones."""
+    dialect = db.session.get_bind().dialect.name
+    failures = {}
+    for name, statement, tables in _hot_queries():
+        result = db.session.execute(explain(statement))
+        if dialect == "postgresql":
+            plan = result.scalar()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            problems = _postgresql_problems(plan, tables)
+            text = json.dumps(plan, indent=2)
+        elif dialect == "sqlite":
+            rows = result.all()
+            problems = _sqlite_problems(rows, tables)
+            text = "\n".join(row.detail for row in rows)
+        else:
+            raise click.UsageError(f"EXPLAIN checks are not implemented for {dialect}")
+        if verbose:
+            click.echo(f"-- {name}\n{text}\n")
+        if problems:
+            failures[name] = problems
+    return failures
+
+
+def register_plan_commands(app):
+    @app.cli.group()
+    def plans():
+        """Query plan regression checks"""
+        pass
+
+    @plans.command()
+    @click.option("--customers", default=20000, help="Customers to seed")
+    @click.option("--activities", default=300000, help="Activities to seed")
+    @click.option("--database-url", default=None, help="Scratch database (default: temporary SQLite file)")
+    @click.option("--verbose", is_flag=True, help="Print every plan")
+    def check(customers, activities, database_url, verbose):
+        """Seed a scratch database and fail if a hot query stops using its index"""
+        from .bench import _scratch_app, seed_dataset
+
+        with _scratch_app(database_url) as scratch, scratch.app_context():
+            seed_dataset(customers=customers, activities=activities)
+            # Archive the oldest half year so the archive queries see real data too
+            newest = db.session.execute(select(func.max(Activity.timestamp))).scalar()
+            archive.move(newest - timedelta(days=180), batch_size=10000)
+            # Fresh statistics, or the planner judges the seeded tables as empty
+            db.session.execute(db.text("ANALYZE"))
+            db.session.commit()
+            failures = check_plans(verbose)
+            db.session.remove()
+
+        for name, problems in failures.items():
+            click.echo(f"FAIL {name}: {', '.join(problems)}")
+        if failures:
+            sys.exit(1)
+        click.echo("All hot queries use their indexes.")
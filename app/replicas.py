@@ -0,0 +1,196 @@
+import functools
+import itertools
+import sys
+import threading
+import time
+
+import click
+from flask import current_app, g, has_request_context, session as browser_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from .engines import engine_options
+
+# Read replicas for the heavy read paths. Views marked with @replica_reads
+# run their queries on a healthy replica (round robin); everything else,
+# flushes included, stays on the primary. A replica is checked at most every
+# REPLICA_CHECK_INTERVAL seconds and is skipped while it is unreachable or
+# more than REPLICA_MAX_LAG seconds behind; with none left the primary serves
+# the reads. After a request that committed, the same browser session reads
+# from the primary for REPLICA_READ_YOUR_WRITES seconds so it sees its own
+# writes despite replication lag.
+
+# Seconds a PostgreSQL replica may take to accept a connection
+CONNECT_TIMEOUT = 2
+# 0 while the replica has replayed all it received, otherwise the age of the
+# last replayed transaction; NULL on a server that is not a standby
+LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class Replica:
+    def __init__(self, url, engine_options):
+        self.url = make_url(url)
+        options = dict(engine_options)
+        if self.url.get_backend_name() == "postgresql":
+            options["connect_args"] = {"connect_timeout": CONNECT_TIMEOUT, **options.get("connect_args", {})}
+        self.engine = create_engine(self.url, **options)
+        self.healthy = False
+        self.lag = None
+        self.error = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+        event.listen(self.engine, "handle_error", self._handle_error)
+
+    @property
+    def name(self):
+        return self.url.render_as_string(hide_password=True)
+
+    def check(self, max_lag):
+        """Run a probe query and update ``healthy``, ``lag`` and ``error``."""
+        try:
+            with self.engine.connect() as connection:
+                if connection.dialect.name == "postgresql":
+                    lag = connection.execute(LAG_QUERY).scalar()
+                else:
+                    connection.execute(text("SELECT 1"))
+                    lag = None
+        except SQLAlchemyError as error:
+            self.healthy, self.lag, self.error = False, None, str(error.__cause__ or error).strip()
+        else:
+            self.lag = None if lag is None else float(lag)
+            self.healthy = self.lag is None or self.lag <= max_lag
+            self.error = None if self.healthy else f"{self.lag:.1f}s behind the primary"
+        self.checked_at = time.monotonic()
+
+    def _handle_error(self, context):
+        # Failing mid-request: skip the replica until the next check
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+            self.healthy = False
+            self.error = str(context.original_exception).strip()
+
+
+class ReplicaSet:
+    def __init__(self, urls, config, check_interval, max_lag):
+        self.replicas = [Replica(url, engine_options(url, config)) for url in urls]
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self._turn = itertools.count()
+
+    def choose(self):
+        """Engine of the next healthy replica, None when no replica is healthy."""
+        start = next(self._turn)
+        now = time.monotonic()
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+            if replica.checked_at is None or now - replica.checked_at >= self.check_interval:
+                # One thread probes; the others go by the last result meanwhile
+                if replica.lock.acquire(blocking=False):
+                    try:
+                        replica.check(self.max_lag)
+                    finally:
+                        replica.lock.release()
+            if replica.healthy:
+                return replica.engine
+        return None
+
+    def dispose(self, close=True):
+        for replica in self.replicas:
+            replica.engine.dispose(close=close)
+
+
+class RoutingSession(Session):
+    """Session that sends the reads of :func:`replica_reads` views to a replica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get("replica_reads"):
+            # One replica per request, so all of its reads see the same state
+            engine = g.get("replica_engine")
+            if engine is None:
+                engine = g.replica_engine = current_app.extensions["replicas"].choose() or False
+            if engine:
+                return engine
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def get_replicas():
+    return current_app.extensions.get("replicas")
+
+
+def _reads_own_writes():
+    return time.time() < browser_session.get("primary_until", 0)
+
+
+def replica_reads(view):
+    """Run the view's queries on a replica when one is configured and healthy.
+
+    Only for views that do not write: statements other than flushes would go
+    to the replica too.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if get_replicas() is None or _reads_own_writes():
+            return view(*args, **kwargs)
+        g.replica_reads = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.pop("replica_reads", None)
+            g.pop("replica_engine", None)
+    return wrapper
+
+
+def _after_commit(session):
+    if has_request_context():
+        g.wrote_to_primary = True
+
+
+def _after_request(response):
+    if g.pop("wrote_to_primary", False) and get_replicas() is not None:
+        window = current_app.config["REPLICA_READ_YOUR_WRITES"]
+        if window > 0:
+            browser_session["primary_until"] = time.time() + window
+    return response
+
+
+def init_replicas(app):
+    urls = app.config["DATABASE_REPLICA_URLS"]
+    if not urls:
+        return
+    from . import db
+    app.extensions["replicas"] = ReplicaSet(
+        urls, app.config, app.config["REPLICA_CHECK_INTERVAL"], app.config["REPLICA_MAX_LAG"]
+    )
+    app.after_request(_after_request)
+    if not event.contains(db.session, "after_commit", _after_commit):
+        event.listen(db.session, "after_commit", _after_commit)
+
+
+def register_replica_commands(app):
+    @app.cli.group()
+    def replicas():
+        """Read replica commands"""
+        pass
+
+    @replicas.command()
+    def check():
+        """Probe every configured replica"""
+        replica_set = get_replicas()
+        if replica_set is None:
+            click.echo("No replicas configured (DATABASE_REPLICA_URLS).")
+            return
+        down = 0
+        for replica in replica_set.replicas:
+            replica.check(replica_set.max_lag)
+            if replica.healthy:
+                lag = "" if replica.lag is None else f", {replica.lag:.1f}s lag"
+                click.echo(f"ok    {replica.name}{lag}")
+            else:
+                down += 1
+                click.echo(f"DOWN  {replica.name}: {replica.error}")
+        if down:
+            sys.exit(1)
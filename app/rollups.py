@@ -0,0 +1,250 @@
+import sys
+
+import click
+from sqlalchemy import bindparam, case, delete, event, func, insert, or_, select, update
+from sqlalchemy.orm import attributes
+
+from . import db
+from .archive import all_activities
+from .models import Activity, ArchivedActivity, Customer, CustomerStats
+
+stats = CustomerStats.__table__
+activities = Activity.__table__
+archived = ArchivedActivity.__table__
+
+# Rollup rows whose revenue differs by more than this are reported as drift
+REVENUE_TOLERANCE = 0.005
+
+
+class _Delta:
+    def __init__(self):
+        self.count = 0
+        self.revenue = 0.0
+        self.last = None          # newest timestamp added
+        self.recompute_last = False  # an activity left, the max must be re-read
+
+    def add(self, price, timestamp):
+        self.count += 1
+        self.revenue += price or 0.0
+        if timestamp is not None and (self.last is None or timestamp > self.last):
+            self.last = timestamp
+
+    def remove(self, price):
+        self.count -= 1
+        self.revenue -= price or 0.0
+        self.recompute_last = True
+
+
+def _ensure_rows(connection, customer_ids):
+    dialect = connection.dialect.name
+    rows = [{"customer_id": cid, "activity_count": 0, "revenue": 0.0} for cid in customer_ids]
+    if not rows:
+        return
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        existing = set(connection.execute(
+            select(stats.c.customer_id).where(stats.c.customer_id.in_(customer_ids))
+        ).scalars())
+        rows = [row for row in rows if row["customer_id"] not in existing]
+        if rows:
+            connection.execute(insert(stats), rows)
+        return
+    connection.execute(dialect_insert(stats).on_conflict_do_nothing(index_elements=["customer_id"]), rows)
+
+
+def apply_deltas(connection, deltas):
+    """Apply ``{customer_id: _Delta}`` to the rollup rows in the current transaction."""
+    _ensure_rows(connection, [cid for cid, d in deltas.items() if d.count > 0 or d.last is not None])
+
+    newest = bindparam("newest", type_=stats.c.last_activity_at.type)
+    connection.execute(
+        update(stats)
+        .where(stats.c.customer_id == bindparam("cid"))
+        .values(
+            activity_count=stats.c.activity_count + bindparam("count"),
+            revenue=stats.c.revenue + bindparam("revenue"),
+            last_activity_at=case(
+                (newest.is_(None), stats.c.last_activity_at),
+                (or_(stats.c.last_activity_at.is_(None), stats.c.last_activity_at < newest), newest),
+                else_=stats.c.last_activity_at
+            )
+        ),
+        [
+            {"cid": cid, "count": d.count, "revenue": d.revenue, "newest": d.last}
+            for cid, d in deltas.items()
+        ]
+    )
+
+    recompute = [cid for cid, d in deltas.items() if d.recompute_last]
+    if recompute:
+        newest_live, newest_archived = (
+            select(func.max(table.c.timestamp))
+            .where(table.c.customer_id == stats.c.customer_id)
+            .scalar_subquery()
+            for table in (activities, archived)
+        )
+        connection.execute(
+            update(stats).where(stats.c.customer_id.in_(recompute)).values(last_activity_at=case(
+                (newest_archived.is_(None), newest_live),
+                (or_(newest_live.is_(None), newest_archived > newest_live), newest_archived),
+                else_=newest_live
+            ))
+        )
+
+
+def add_totals(connection, totals):
+    """Add bulk-inserted activities, given as ``(customer_id, count, revenue, newest)`` rows."""
+    deltas = {}
+    for customer_id, count, revenue, newest in totals:
+        delta = deltas[customer_id] = _Delta()
+        delta.count, delta.revenue, delta.last = count, revenue, newest
+    if deltas:
+        apply_deltas(connection, deltas)
+
+
+def remove_totals(connection, totals):
+    """Subtract bulk-deleted activities, given as ``(customer_id, count, revenue)`` rows."""
+    deltas = {}
+    for customer_id, count, revenue in totals:
+        delta = deltas[customer_id] = _Delta()
+        delta.count, delta.revenue, delta.recompute_last = -count, -(revenue or 0.0), True
+    if deltas:
+        apply_deltas(connection, deltas)
+
+
+def old_value(obj, field):
+    """Value of ``field`` as loaded, before the changes being flushed."""
+    history = attributes.get_history(obj, field)
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(obj, field)
+
+
+def _after_flush(session, flush_context):
+    deleted_customers = {obj.id for obj in session.deleted if isinstance(obj, Customer)}
+    deltas = {}
+
+    def delta(customer_id):
+        return deltas.setdefault(customer_id, _Delta())
+
+    for obj in session.new:
+        if isinstance(obj, Activity):
+            delta(obj.customer_id).add(obj.price, obj.timestamp)
+
+    for obj in session.deleted:
+        if isinstance(obj, Activity) and obj.customer_id not in deleted_customers:
+            delta(old_value(obj, "customer_id")).remove(old_value(obj, "price"))
+
+    for obj in session.dirty:
+        if not isinstance(obj, Activity) or obj in session.deleted:
+            continue
+        old_customer = old_value(obj, "customer_id")
+        old_price = old_value(obj, "price")
+        old_timestamp = old_value(obj, "timestamp")
+        if old_customer != obj.customer_id:
+            if old_customer not in deleted_customers:
+                delta(old_customer).remove(old_price)
+            delta(obj.customer_id).add(obj.price, obj.timestamp)
+        elif old_price != obj.price or old_timestamp != obj.timestamp:
+            d = delta(obj.customer_id)
+            d.revenue += (obj.price or 0.0) - (old_price or 0.0)
+            if old_timestamp != obj.timestamp:
+                d.recompute_last = True
+
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+event.listen(db.session, "after_flush", _after_flush)
+
+
+def get_stats(customer_id):
+    """Rollup for one customer as a dict (zeros when the customer has no activities)."""
+    row = db.session.get(CustomerStats, customer_id)
+    return {
+        "customer_id": customer_id,
+        "activity_count": row.activity_count if row else 0,
+        "revenue": round(row.revenue, 2) if row else 0.0,
+        "last_activity_at": row.last_activity_at.isoformat() if row and row.last_activity_at else None,
+    }
+
+
+def _actual_totals():
+    # Archived activities count too
+    rows = all_activities("customer_id", "price", "timestamp")
+    return (
+        select(
+            rows.c.customer_id,
+            func.count().label("activity_count"),
+            func.coalesce(func.sum(rows.c.price), 0.0).label("revenue"),
+            func.max(rows.c.timestamp).label("last_activity_at"),
+        )
+        .group_by(rows.c.customer_id)
+    )
+
+
+def rebuild(connection):
+    """Recompute every rollup row from the activities and archive tables."""
+    connection.execute(delete(stats))
+    connection.execute(
+        insert(stats).from_select(
+            ["customer_id", "activity_count", "revenue", "last_activity_at"], _actual_totals()
+        )
+    )
+
+
+def verify(connection):
+    """Return ``(customer_id, stored, actual)`` for every rollup row that drifted."""
+    actual = _actual_totals().subquery()
+    rows = connection.execute(
+        select(
+            func.coalesce(stats.c.customer_id, actual.c.customer_id).label("customer_id"),
+            stats.c.activity_count, stats.c.revenue, stats.c.last_activity_at,
+            actual.c.activity_count.label("actual_count"),
+            actual.c.revenue.label("actual_revenue"),
+            actual.c.last_activity_at.label("actual_last"),
+        )
+        .select_from(stats.join(actual, stats.c.customer_id == actual.c.customer_id, full=True))
+    ).all()
+    drift = []
+    for row in rows:
+        stored = (row.activity_count or 0, row.revenue or 0.0, row.last_activity_at)
+        expected = (row.actual_count or 0, row.actual_revenue or 0.0, row.actual_last)
+        if (stored[0] != expected[0] or stored[2] != expected[2]
+                or abs(stored[1] - expected[1]) > REVENUE_TOLERANCE):
+            drift.append((row.customer_id, stored, expected))
+    return drift
+
+
+def register_rollup_commands(app):
+    @app.cli.group()
+    def rollups():
+        """Customer activity rollup commands"""
+        pass
+
+    @rollups.command("rebuild")
+    def rebuild_command():
+        """Recompute all customer rollups from the activities table"""
+        with db.engine.begin() as connection:
+            rebuild(connection)
+        click.echo("Customer rollups rebuilt.")
+
+    @rollups.command("verify")
+    @click.option("--fix", is_flag=True, help="Rebuild the rollups when drift is found")
+    def verify_command(fix):
+        """Compare the rollups with the activities table"""
+        with db.engine.begin() as connection:
+            drift = verify(connection)
+            for customer_id, stored, expected in drift[:50]:
+                click.echo(f"customer {customer_id}: stored {stored}, actual {expected}")
+            if drift and fix:
+                rebuild(connection)
+                click.echo(f"{len(drift)} drifted customers; rollups rebuilt.")
+                return
+        if drift:
+            click.echo(f"{len(drift)} drifted customers.")
+            sys.exit(1)
+        click.echo("Customer rollups match the activities table.")
@@ -0,0 +1,156 @@
+import click
+from sqlalchemy import column, func, literal_column, or_, select, table, text
+from sqlalchemy.orm import joinedload
+
+from . import db
+from .models import Activity, Customer
+
+SEARCH_RESULT_LIMIT = 50
+
+# Trigram indexes make ILIKE '%q%' an index scan and power similarity() ranking
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_customers_name_trgm ON customers USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_customers_email_trgm ON customers USING gin (email gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_customers_phone_trgm ON customers USING gin (phone gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_customers_address_trgm ON customers USING gin (address gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_activities_text_trgm ON activities USING gin (text gin_trgm_ops)",
+]
+
+# External-content FTS5 tables with the trigram tokenizer (substring matching,
+# case-insensitive), kept in sync with their base tables by triggers.
+SQLITE_FTS_TABLES = {
+    "customers": ["name", "email", "phone", "address"],
+    "activities": ["text"],
+}
+
+
+def _sqlite_ddl():
+    statements = []
+    for base, columns in SQLITE_FTS_TABLES.items():
+        fts = f"{base}_fts"
+        cols = ", ".join(columns)
+        new = ", ".join(f"new.{c}" for c in columns)
+        old = ", ".join(f"old.{c}" for c in columns)
+        statements += [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, "
+            f"content='{base}', content_rowid='id', tokenize='trigram')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {base} BEGIN "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {base} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {base} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ]
+    return statements
+
+
+def install_search(connection):
+    """Create the search indexes for the connected backend (safe to re-run).
+
+    Call it from a migration (``install_search(op.get_bind())``) or through
+    ``flask search install``.
+    """
+    if connection.dialect.name == "postgresql":
+        statements = POSTGRES_DDL
+    elif connection.dialect.name == "sqlite":
+        statements = _sqlite_ddl()
+    else:
+        return False
+    for statement in statements:
+        connection.execute(text(statement))
+    _backends.clear()
+    return True
+
+
+# Detected once per engine: "trgm", "fts5" or None (plain ILIKE)
+_backends = {}
+
+
+def _backend():
+    engine = db.engine
+    if engine not in _backends:
+        backend = None
+        with engine.connect() as connection:
+            if engine.dialect.name == "postgresql":
+                if connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first():
+                    backend = "trgm"
+            elif engine.dialect.name == "sqlite":
+                if connection.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'customers_fts'"
+                )).first():
+                    backend = "fts5"
+        _backends[engine] = backend
+    return _backends[engine]
+
+
+def _fts_phrase(query):
+    # One quoted FTS5 phrase; with the trigram tokenizer it matches substrings
+    return '"' + query.replace('"', '""') + '"'
+
+
+def _fts_match(name, query):
+    return literal_column(name).op("MATCH")(_fts_phrase(query))
+
+
+def _customer_ilike(query):
+    pattern = f"%{query}%"
+    return or_(
+        Customer.name.ilike(pattern),
+        Customer.email.ilike(pattern),
+        Customer.phone.ilike(pattern),
+        Customer.address.ilike(pattern)
+    )
+
+
+def search_customers(query, limit=SEARCH_RESULT_LIMIT):
+    """Return up to ``limit`` customers matching ``query``, best matches first."""
+    backend = _backend()
+    # Trigram indexes need at least three characters to narrow anything down
+    if backend == "fts5" and len(query) >= 3:
+        fts = table("customers_fts", column("rowid"), column("rank"))
+        stmt = (
+            select(Customer)
+            .join(fts, Customer.id == fts.c.rowid)
+            .where(_fts_match("customers_fts", query))
+            .order_by(fts.c.rank, Customer.name)
+        )
+    elif backend == "trgm":
+        rank = func.greatest(
+            func.similarity(Customer.name, query),
+            func.similarity(Customer.email, query),
+            func.similarity(func.coalesce(Customer.phone, ""), query),
+            func.similarity(func.coalesce(Customer.address, ""), query)
+        )
+        stmt = select(Customer).where(_customer_ilike(query)).order_by(rank.desc(), Customer.name)
+    else:
+        stmt = select(Customer).where(_customer_ilike(query)).order_by(Customer.name)
+    stmt = stmt.options(joinedload(Customer.stats)).limit(limit)
+    return db.session.execute(stmt).scalars().all()
+
+
+def activity_text_filter(query, model=Activity):
+    """Return a WHERE criterion for activities (or archived ones) whose text contains ``query``."""
+    if model is Activity and _backend() == "fts5" and len(query) >= 3:
+        fts = table("activities_fts", column("rowid"))
+        return Activity.id.in_(select(fts.c.rowid).where(_fts_match("activities_fts", query)))
+    # On PostgreSQL the trigram index serves ILIKE directly; the archive is not indexed
+    return model.text.ilike(f"%{query}%")
+
+
+def register_search_commands(app):
+    @app.cli.group()
+    def search():
+        """Search index commands"""
+        pass
+
+    @search.command()
+    def install():
+        """Create the search indexes for the configured database"""
+        with db.engine.begin() as connection:
+            if install_search(connection):
+                click.echo(f"Search indexes installed ({connection.dialect.name}).")
+            else:
+                click.echo(f"No search indexes for {connection.dialect.name}; using plain ILIKE.")
@@ -0,0 +1,195 @@
+import gc
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+# Worker startup: what importing the app costs, and what preloading it in
+# the gunicorn master saves. pandas, numpy and pyarrow are imported inside
+# the functions that use them (analytics, imports, exports, benchmarks), so
+# a worker that never serves those routes never loads them.
+
+# Modules that should not be loaded by importing the app
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow")
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def warm_up(app):
+    """Do once in the gunicorn master what every worker would otherwise repeat.
+
+    Called before forking when the app is preloaded: mapper configuration and
+    compiled templates are inherited by the workers, and freezing the objects
+    made so far keeps the garbage collector from writing to (and so copying)
+    the pages the workers share.
+    """
+    from sqlalchemy.orm import configure_mappers
+
+    from .fragments import compile_templates
+
+    configure_mappers()
+    compile_templates(app)
+    gc.collect()
+    gc.freeze()
+
+
+# -- measurement ---------------------------------------------------------------
+
+def _project_root():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(module="wsgi", top=10):
+    """Import ``module`` in a fresh interpreter under ``-X importtime``.
+
+    Returns the total import time, the peak RSS of that process, the
+    heaviest top-level packages by their own import time and which of
+    ``HEAVY_MODULES`` got loaded.
+    """
+    code = (
+        f"import resource, sys, {module}\n"
+        "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+        f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=_project_root(), capture_output=True, text=True, check=True
+    )
+    packages = defaultdict(int)
+    total = 0
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        own, cumulative, indent, name = int(match[1]), int(match[2]), match[3], match[4]
+        packages[name.split(".")[0]] += own
+        if not indent and name == module:
+            total = cumulative
+    max_rss_kib, heavy = completed.stdout.splitlines()[-2:]
+    return {
+        "import_ms": round(total / 1000, 1),
+        "max_rss_mib": round(int(max_rss_kib) / 1024, 1),
+        "heavy_modules": [name for name in heavy.split(",") if name],
+        "packages_ms": {
+            name: round(us / 1000, 1)
+            for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]
+        },
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as handle:
+            return [int(child) for child in handle.read().split()]
+    except OSError:
+        return []
+
+
+def _memory_kib(pid):
+    # RSS, and on Linux PSS (shared pages split between the processes sharing
+    # them) and private memory, from /proc/<pid>/smaps_rollup
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as handle:
+            for line in handle:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    values[key] = int(rest.split()[0])
+    except OSError:
+        return None
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }
+
+
+def _get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            response.read()
+            return response.status
+    except (urllib.error.URLError, OSError):
+        return None
+
+
+def serve_profile(workers, preload, requests=20, timeout=60.0):
+    """Start gunicorn with ``gunicorn.conf.py`` and measure its startup.
+
+    Reports seconds until the first page was served and until ``requests``
+    more were served and the workers' memory stopped growing, and then the
+    memory of the master and of each worker.
+    """
+    port = _free_port()
+    env = dict(
+        os.environ, GUNICORN_BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(workers),
+        GUNICORN_PRELOAD="1" if preload else "0",
+    )
+    url = f"http://127.0.0.1:{port}/auth/login"
+    started = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+        cwd=_project_root(), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        first_response = None
+        while first_response is None:
+            if server.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+            if time.monotonic() - started > timeout:
+                raise RuntimeError(f"gunicorn did not answer within {timeout:.0f}s")
+            if _get(url) == 200:
+                first_response = time.monotonic() - started
+            else:
+                time.sleep(0.05)
+        for _ in range(requests):
+            _get(url)
+        # Workers still importing the app (no preload) keep growing; wait for them
+        previous, pids, memory = None, [], []
+        while time.monotonic() - started < timeout:
+            pids = _children(server.pid)
+            memory = [_memory_kib(pid) for pid in pids]
+            sizes = [m and m["rss"] for m in memory]
+            if len(pids) >= workers and sizes == previous:
+                break
+            previous = sizes
+            time.sleep(0.5)
+        warm = time.monotonic() - started
+        master = _memory_kib(server.pid)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    def mib(kib):
+        return round(kib / 1024, 1)
+
+    result = {
+        "preload": preload,
+        "workers": len(pids),
+        "first_response_s": round(first_response, 2),
+        "warm_s": round(warm, 2),
+    }
+    if master is not None and all(memory):
+        result.update(
+            master_rss_mib=mib(master["rss"]),
+            worker_rss_mib=[mib(m["rss"]) for m in memory],
+            worker_pss_mib=[mib(m["pss"]) for m in memory],
+            worker_private_mib=[mib(m["private"]) for m in memory],
+            total_pss_mib=mib(master["pss"] + sum(m["pss"] for m in memory)),
+        )
+    return result
@@ -0,0 +1,203 @@
+import os
+import sqlite3
+import threading
+import time
+
+import click
+from flask import current_app, request
+
+# Token buckets for login and registration. Every attempt takes a token from
+# its client IP's bucket and, for logins, from the username's bucket, before
+# the user is looked up or a password hashed; an empty bucket answers 429
+# with the wait until the next token. Buckets hold LOGIN_*_BURST tokens and
+# refill at LOGIN_*_PER_MINUTE. A successful login returns the username's
+# token, so only failed attempts count against an account.
+
+# Seconds between sweeps of buckets that have refilled completely
+PRUNE_INTERVAL = 60
+# Longest username kept in a bucket key
+MAX_KEY_LENGTH = 200
+
+
+def _level(state, capacity, rate, now):
+    if state is None:
+        return capacity
+    tokens, updated = state
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+def _take(states, limits, now):
+    # Returns (new states, 0) or (None, seconds until every bucket has a token)
+    levels = {key: _level(states.get(key), capacity, rate, now) for key, capacity, rate in limits}
+    wait = max(((1 - levels[key]) / rate for key, _, rate in limits if levels[key] < 1), default=0.0)
+    if wait:
+        return None, wait
+    return {key: (levels[key] - 1, now) for key, _, _ in limits}, 0.0
+
+
+class MemoryBuckets:
+    """Buckets in this process only: with several workers each one limits separately.
+
+    ``keep_for`` is the longest refill time of any bucket; a bucket untouched
+    for that long is full and can be forgotten.
+    """
+
+    def __init__(self, keep_for):
+        self.keep_for = keep_for
+        self._lock = threading.Lock()
+        self._states = {}  # key -> (tokens, updated)
+        self._pruned_at = 0.0
+
+    def take(self, limits):
+        now = time.time()
+        with self._lock:
+            taken, wait = _take(self._states, limits, now)
+            if taken:
+                self._states.update(taken)
+            if now - self._pruned_at >= PRUNE_INTERVAL:
+                self._pruned_at = now
+                horizon = now - self.keep_for
+                self._states = {key: state for key, state in self._states.items() if state[1] >= horizon}
+        return wait
+
+    def give_back(self, key, capacity):
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None:
+                self._states[key] = (min(capacity, state[0] + 1), state[1])
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+
+class SQLiteBuckets:
+    """Buckets in a local SQLite file, shared by every worker on the host; ``keep_for`` as above."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS ix_buckets_updated ON buckets (updated);
+    """
+
+    def __init__(self, path, keep_for):
+        self.path = path
+        self.keep_for = keep_for
+        self._local = threading.local()
+        self._pruned_at = 0.0
+
+    def _connection(self):
+        # One connection per thread and per process (workers fork after import)
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(self.SCHEMA)
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    def take(self, limits):
+        connection = self._connection()
+        now = time.time()
+        keys = [key for key, _, _ in limits]
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            states = {
+                key: (tokens, updated) for key, tokens, updated in connection.execute(
+                    f"SELECT key, tokens, updated FROM buckets WHERE key IN ({','.join('?' * len(keys))})", keys
+                )
+            }
+            taken, wait = _take(states, limits, now)
+            if taken:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                    [(key, tokens, updated) for key, (tokens, updated) in taken.items()]
+                )
+            if now - self._pruned_at >= PRUNE_INTERVAL:
+                self._pruned_at = now
+                connection.execute("DELETE FROM buckets WHERE updated < ?", (now - self.keep_for,))
+        finally:
+            connection.execute("COMMIT")
+        return wait
+
+    def give_back(self, key, capacity):
+        self._connection().execute(
+            "UPDATE buckets SET tokens = min(?, tokens + 1) WHERE key = ?", (capacity, key)
+        )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM buckets")
+
+
+def get_buckets():
+    return current_app.extensions["throttle"]
+
+
+def _limits(username):
+    config = current_app.config
+    limits = [("ip:" + (request.remote_addr or "-"), config["LOGIN_IP_BURST"], config["LOGIN_IP_PER_MINUTE"] / 60)]
+    if username is not None:
+        limits.append(_user_limit(username))
+    return limits
+
+
+def _user_limit(username):
+    config = current_app.config
+    key = "user:" + username.strip().lower()[:MAX_KEY_LENGTH]
+    return key, config["LOGIN_USER_BURST"], config["LOGIN_USER_PER_MINUTE"] / 60
+
+
+def attempt(username=None):
+    """Take a token for an attempt from this client (and for ``username``).
+
+    Returns 0 when the attempt may go ahead, otherwise the seconds until it may.
+    """
+    if not current_app.config["LOGIN_THROTTLE"]:
+        return 0
+    wait = get_buckets().take(_limits(username))
+    registry = current_app.extensions.get("metrics")
+    if registry is not None:
+        registry.inc("kartoteka_auth_attempts_total", request.endpoint, "throttled" if wait else "accepted")
+    return wait
+
+
+def succeeded(username):
+    """Return the username's token after a successful login."""
+    if current_app.config["LOGIN_THROTTLE"]:
+        key, capacity, _ = _user_limit(username)
+        get_buckets().give_back(key, capacity)
+
+
+def init_throttle(app):
+    config = app.config
+    # Whatever limits a call passes, prune only buckets that every limit has refilled:
+    # an IP-only call must not forget an account bucket that is still refilling
+    keep_for = max(config["LOGIN_IP_BURST"] / config["LOGIN_IP_PER_MINUTE"],
+                   config["LOGIN_USER_BURST"] / config["LOGIN_USER_PER_MINUTE"]) * 60
+    kind = config["THROTTLE_BACKEND"]
+    if kind == "memory":
+        buckets = MemoryBuckets(keep_for)
+    elif kind == "sqlite":
+        path = config["THROTTLE_PATH"] or os.path.join(app.instance_path, "throttle.sqlite")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        buckets = SQLiteBuckets(path, keep_for)
+    else:
+        raise ValueError(f"Unknown THROTTLE_BACKEND: {kind!r}")
+    app.extensions["throttle"] = buckets
+
+
+def register_throttle_commands(app):
+    @app.cli.group()
+    def throttle():
+        """Login throttling commands"""
+        pass
+
+    @throttle.command()
+    def clear():
+        """Refill every bucket (unblocks throttled clients and accounts)"""
+        get_buckets().clear()
+        click.echo("All login buckets are full again.")
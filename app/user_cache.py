@@ -0,0 +1,70 @@
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import make_transient_to_detached
+
+from . import db
+from .cache import make_cache
+from .models import User
+
+NAMESPACE = "users"
+
+# Everything the request cycle reads off current_user; the password hash
+# stays out of the cache and is only loaded by the login form.
+COLUMNS = ("id", "username", "email", "primary_color", "sidebar_bg_color", "text_color", "theme")
+
+
+def _snapshot(user_id):
+    row = db.session.execute(
+        select(*(getattr(User, name) for name in COLUMNS)).where(User.id == user_id)
+    ).first()
+    return dict(row._mapping) if row else None
+
+
+def get_cache():
+    return current_app.extensions["user_cache"]
+
+
+def load_user(user_id):
+    """Flask-Login loader backed by the user cache.
+
+    Every call builds a new detached ``User`` from the cached columns, so no
+    instance is shared between requests or tied to a session. Code that
+    modifies the user must load it with ``db.session.get`` first.
+    """
+    columns = get_cache().get_or_set(user_id, lambda: _snapshot(user_id))
+    if columns is None:
+        return None
+    user = User(**columns)
+    make_transient_to_detached(user)
+    return user
+
+
+def _after_flush(session, flush_context):
+    stale = {obj.id for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User)}
+    if stale:
+        session.info.setdefault("user_cache_stale", set()).update(stale)
+
+
+def _after_commit(session):
+    # Only the changed users; a new user has nothing cached yet
+    stale = session.info.pop("user_cache_stale", None)
+    if stale and has_app_context():
+        cache = current_app.extensions.get("user_cache")
+        if cache is not None:
+            for user_id in stale:
+                cache.delete(user_id)
+
+
+def _after_rollback(session):
+    session.info.pop("user_cache_stale", None)
+
+
+def init_user_cache(app):
+    app.extensions["user_cache"] = make_cache(
+        app, NAMESPACE, app.config["USER_CACHE_SIZE"], app.config["USER_CACHE_TTL"]
+    )
+
+
+event.listen(db.session, "after_flush", _after_flush)
+event.listen(db.session, "after_commit", _after_commit)
+event.listen(db.session, "after_rollback", _after_rollback)
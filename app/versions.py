@@ -0,0 +1,44 @@
+from sqlalchemy import insert, select, update
+
+from .models import DataVersion
+
+versions = DataVersion.__table__
+
+
+def current(connection, name):
+    """Return the change counter for ``name`` (0 if nothing was recorded yet)."""
+    version = connection.execute(select(versions.c.version).where(versions.c.name == name)).scalar()
+    return version or 0
+
+
+def current_many(connection, names):
+    """Return ``{name: counter}`` for every name in ``names``, read in one query."""
+    rows = dict(connection.execute(
+        select(versions.c.name, versions.c.version).where(versions.c.name.in_(names))
+    ).all())
+    return {name: rows.get(name) or 0 for name in names}
+
+
+def bump(connection, name):
+    """Increment the change counter for ``name`` inside the current transaction.
+
+    Returns the new value. The row lock taken by the increment serialises
+    concurrent writers, so every committed bump is observed exactly once.
+    """
+    dialect = connection.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(versions).values(name=name, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[versions.c.name],
+            set_={"version": versions.c.version + 1}
+        )
+        connection.execute(stmt)
+    elif not connection.execute(
+        update(versions).where(versions.c.name == name).values(version=versions.c.version + 1)
+    ).rowcount:
+        connection.execute(insert(versions).values(name=name, version=1))
+    return current(connection, name)
@@ -0,0 +1,53 @@
+import multiprocessing
+import os
+
+# Production serving profile (gunicorn -c gunicorn.conf.py wsgi:app).
+#
+# Threaded workers by default: a request waiting on PostgreSQL or on a slow
+# client no longer holds a whole process. GUNICORN_WORKER_CLASS=gevent
+# serves more concurrent (I/O-bound) requests per process; psycopg2 is then
+# made cooperative with psycogreen. Database sessions are scoped to the
+# request's app context, so every thread or greenlet gets its own. Keep
+# DB_POOL_SIZE + DB_MAX_OVERFLOW at least GUNICORN_THREADS per worker.
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+if worker_class == "gevent":
+    # Before the app is preloaded, so its locks are gevent locks: a greenlet
+    # waiting on the database must not block the others holding a lock
+    from gevent import monkey
+
+    monkey.patch_all()
+
+    from psycogreen.gevent import patch_psycopg
+
+    patch_psycopg()
+
+workers = int(os.environ.get("WEB_CONCURRENCY", max(2, multiprocessing.cpu_count())))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 100))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so a slow leak cannot grow without bound
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = max_requests // 10
+
+# Import the app once in the master; workers share its memory copy-on-write
+# and start serving without importing Flask, SQLAlchemy and the rest
+# themselves, so restarts and max_requests recycling fork in milliseconds.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+
+def when_ready(server):
+    if preload_app:
+        from app.startup import warm_up
+
+        warm_up(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app.engines import dispose_after_fork
+
+        dispose_after_fork(server.app.wsgi())
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import Activity, Customer, User
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    # Apps on one database, like several workers; everything on disk under
+    # tmp_path, nothing in instance/
+    apps = []
+
+    def make_app(**config):
+        app = create_app({
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'test.db'}",
+            "CACHE_BACKEND": "memory",
+            "CACHE_PATH": str(tmp_path / "cache.sqlite"),
+            "THROTTLE_BACKEND": "memory",
+            "LOGIN_THROTTLE": False,
+            "JINJA_BYTECODE_CACHE": False,
+            "IMPORT_SPOOL_DIR": str(tmp_path / "imports"),
+            "METRICS_TOKEN": "token",
+            **config,
+        })
+        apps.append(app)
+        return app
+
+    yield make_app
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        db.create_all()
+        user = User(username="bob", email="bob@example.com")
+        user.set_password("pw")
+        db.session.add(user)
+        for i in range(30):
+            db.session.add(Customer(name=f"Customer {i}", email=f"c{i}@example.com",
+                                    phone=f"09{i:08d}", address=f"Street {i}"))
+        db.session.commit()
+        for i in range(120):
+            db.session.add(Activity(text=f"Activity {i}", customer_id=i % 30 + 1, creator_id=user.id,
+                                    price=float(i), timestamp=datetime(2024, 1, 1) + timedelta(hours=i * 7)))
+        db.session.commit()
+    return app
+
+
+def login(app, username="bob", password="pw"):
+    client = app.test_client()
+    response = client.post("/auth/login", data={"username": username, "password": password})
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def client(app):
+    return login(app)
+
+
+@pytest.fixture
+def statements(app):
+    # SQL sent to the database while the test runs
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(engine, "before_cursor_execute", record)
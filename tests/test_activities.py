@@ -0,0 +1,78 @@
+import html
+import re
+from datetime import datetime
+
+from app import db
+from app.models import Activity
+
+
+def page(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    body = response.get_data(as_text=True)
+    ids = [int(i) for i in re.findall(r'save-btn" data-id="(\d+)"', body) if i != "0"]
+    links = {title: html.unescape(url) for url, title in re.findall(r'<a href="([^"]+)"[^>]*>(?:&laquo; )?(Newer|Older)', body)}
+    return ids, links, body
+
+
+def newest_first(app, **filters):
+    with app.app_context():
+        return [a.id for a in Activity.query.filter_by(**filters)
+                .order_by(Activity.timestamp.desc(), Activity.id.desc())]
+
+
+def test_older_links_walk_every_activity_once(app, client):
+    with app.app_context():
+        # Equal timestamps: only the id orders these
+        for i in range(5):
+            db.session.add(Activity(text=f"Same time {i}", customer_id=1, creator_id=1, price=1.0,
+                                    timestamp=datetime(2024, 1, 3)))
+        db.session.commit()
+    seen, url = [], "/activities?per_page=7"
+    while url:
+        ids, links, _ = page(client, url)
+        assert 0 < len(ids) <= 7
+        seen += ids
+        url = links.get("Older")
+    assert seen == newest_first(app)
+
+
+def test_newer_link_returns_the_previous_page(client):
+    first, links, _ = page(client, "/activities?per_page=10")
+    assert "Newer" not in links
+    second, links, _ = page(client, links["Older"])
+    back, links, _ = page(client, links["Newer"])
+    assert back == first and "Newer" not in links
+    assert not set(first) & set(second)
+
+
+def test_filters_carry_over_to_the_links(app, client):
+    ids, links, _ = page(client, "/activities?customer_id=4&text=Activity&per_page=2")
+    assert "customer_id=4" in links["Older"] and "text=Activity" in links["Older"]
+    while "Older" in links:
+        more, links, _ = page(client, links["Older"])
+        ids += more
+    assert ids == newest_first(app, customer_id=4)
+
+    ids, _, _ = page(client, "/activities?start_date=2024-01-02&end_date=2024-01-03")
+    with app.app_context():
+        assert ids == [a.id for a in Activity.query
+                       .filter(Activity.timestamp >= datetime(2024, 1, 2), Activity.timestamp <= datetime(2024, 1, 3))
+                       .order_by(Activity.timestamp.desc(), Activity.id.desc())]
+
+
+def test_page_size_is_bounded(app, client):
+    ids, _, _ = page(client, "/activities")
+    assert len(ids) == app.config["ACTIVITIES_PAGE_SIZE"]
+    app.config["ACTIVITIES_MAX_PAGE_SIZE"] = 20
+    assert len(page(client, "/activities?per_page=1000")[0]) == 20
+    # A malformed cursor starts over at the first page
+    assert page(client, "/activities?after=garbage&per_page=10")[0] == ids[:10]
+
+
+def test_customer_picker_is_loaded_on_demand(client):
+    # A row holds its own customer only, not all 30
+    assert page(client, "/activities?per_page=50")[2].count("<option") < 3 * 50
+    options = client.get("/customer_options").json
+    assert len(options) == 30
+    assert [o["name"] for o in options] == sorted(o["name"] for o in options)
@@ -0,0 +1,64 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from app import analytics, db
+from app.models import Activity
+
+SEEDED = [(datetime(2024, 1, 1) + timedelta(hours=i * 7), i % 30 + 1, float(i)) for i in range(120)]
+
+
+def get(client, **args):
+    response = client.get("/analytics", query_string={"start_date": "2024-01-01", "end_date": "2024-02-29", **args})
+    assert response.status_code == 200
+    return response.json
+
+
+def test_months_match_the_activities(client):
+    summary = get(client)
+    assert summary["buckets"] == ["2024-01-01", "2024-02-01"]
+    (series,) = summary["series"]
+    assert series["count"] == [sum(1 for t, _, _ in SEEDED if t.month == m) for m in (1, 2)]
+    assert series["revenue"] == [sum(p for t, _, p in SEEDED if t.month == m) for m in (1, 2)]
+    assert summary["total_revenue"] == sum(range(120))
+
+
+def test_partial_months_and_days(client):
+    # Mid-month edges are grouped from the activities, whole months from the summary
+    summary = get(client, start_date="2024-01-15", end_date="2024-02-03")
+    expected = [t for t, _, _ in SEEDED if datetime(2024, 1, 15) <= t < datetime(2024, 2, 4)]
+    assert summary["total_count"] == len(expected)
+
+    days = get(client, start_date="2024-01-01", end_date="2024-01-07", granularity="day")
+    per_day = Counter(t.date().isoformat() for t, _, _ in SEEDED if t < datetime(2024, 1, 8))
+    assert days["series"][0]["count"] == [per_day[day] for day in days["buckets"]]
+
+
+def test_group_by_customer(client):
+    summary = get(client, group_by="customer", top=3)
+    revenue = Counter()
+    for _, customer_id, price in SEEDED:
+        revenue[customer_id] += price
+    leaders = [customer_id for customer_id, _ in revenue.most_common(3)]
+    assert [series["key"] for series in summary["series"]] == leaders + [None]
+    assert summary["series"][0]["label"] == f"Customer {leaders[0] - 1}"
+    assert sum(sum(series["revenue"]) for series in summary["series"]) == sum(range(120))
+
+
+def test_bad_arguments(client):
+    assert client.get("/analytics?granularity=hour").status_code == 400
+    assert client.get("/analytics?start_date=2024-02-01&end_date=2024-01-01").status_code == 400
+    assert client.get("/analytics?start_date=1900-01-01&end_date=2024-01-01&granularity=day").status_code == 400
+
+
+def test_summary_follows_writes(app, client):
+    client.post("/add_activity/2", data={"text": "March", "price": "5"})
+    with app.app_context():
+        activity = db.session.get(Activity, 1)
+        activity.timestamp = datetime(2023, 12, 31)
+        activity.price = 9.0
+        db.session.delete(db.session.get(Activity, 2))
+        db.session.commit()
+        assert analytics.verify(db.session.connection()) == []
+    summary = get(client, start_date="2023-12-01")
+    assert summary["series"][0]["count"][0] == 1
+    assert summary["total_revenue"] == sum(range(120)) - 1 + 9
@@ -0,0 +1,97 @@
+import gzip
+import json
+
+from app import archive
+from app.models import Activity
+
+
+def walk(client, url):
+    # Follow "next" links; every page but the last hands out a cursor
+    items = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        items += response.json["items"]
+        assert (response.json["next"] is None) == (response.json["next_cursor"] is None)
+        url = response.json["next"]
+    return items
+
+
+def test_login_required(app):
+    response = app.test_client().get("/api/v1/customers")
+    assert response.status_code == 401
+    assert "error" in response.json
+
+
+def test_customer_cursor_walk(client):
+    items = walk(client, "/api/v1/customers?limit=7")
+    assert [item["id"] for item in items] == list(range(1, 31))
+    assert set(items[0]) == {"id", "name", "email", "phone", "address"}
+
+
+def test_activity_cursor_walk(client):
+    items = walk(client, "/api/v1/activities?limit=11")
+    assert len(items) == 120 and len({item["id"] for item in items}) == 120
+    keys = [(item["timestamp"], item["id"]) for item in items]
+    assert keys == sorted(keys, reverse=True)
+
+    items = walk(client, "/api/v1/customers/4/activities?limit=3&fields=id,customer_id")
+    assert len(items) == 4 and {item["customer_id"] for item in items} == {4}
+    assert set(items[0]) == {"id", "customer_id"}
+
+
+def test_cursor_walk_crosses_into_the_archive(app, client):
+    with app.app_context():
+        assert archive.move(Activity.query.order_by(Activity.timestamp).offset(50).first().timestamp) == 50
+    items = walk(client, "/api/v1/activities?limit=13")
+    assert len(items) == 120 and len({item["id"] for item in items}) == 120
+
+
+def test_fields_and_cursor_errors(client):
+    assert client.get("/api/v1/customers?fields=id,password_hash").status_code == 400
+    assert client.get("/api/v1/customers?after=abc").status_code == 400
+    assert client.get("/api/v1/activities?after=not-a-cursor").status_code == 400
+    assert client.get("/api/v1/activities?start_date=yesterday").status_code == 400
+    response = client.get("/api/v1/customers/999/activities")
+    assert response.status_code == 404 and "error" in response.json
+
+
+def test_not_modified(client, statements):
+    response = client.get("/api/v1/activities?limit=5")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200 and etag
+
+    statements.clear()
+    response = client.get("/api/v1/activities?limit=5", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.headers["ETag"] == etag
+    assert response.data == b""
+    # Only the change counter is read
+    assert len(statements) == 1
+
+    # Another page is another ETag
+    other = client.get("/api/v1/activities?limit=6", headers={"If-None-Match": etag})
+    assert other.status_code == 200 and other.headers["ETag"] != etag
+
+
+def test_writes_change_the_etag(client):
+    etag = client.get("/api/v1/customers").headers["ETag"]
+    client.post("/add_activity/2", data={"text": "New", "price": "1"})
+    response = client.get("/api/v1/customers", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+
+    etag = response.headers["ETag"]
+    client.post("/activities/bulk_delete", json={"ids": [5]})
+    assert client.get("/api/v1/customers", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_gzip(client):
+    response = client.get("/api/v1/activities?limit=100", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["ETag"].endswith('-gzip"')
+    assert len(json.loads(gzip.decompress(response.data))["items"]) == 100
+
+    plain = client.get("/api/v1/activities?limit=100")
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["ETag"] != response.headers["ETag"]
+    response = client.get("/api/v1/activities?limit=100", headers={"If-None-Match": plain.headers["ETag"]})
+    assert response.status_code == 304
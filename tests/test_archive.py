@@ -0,0 +1,91 @@
+import csv
+import io
+import re
+from datetime import datetime
+
+import pytest
+
+from app import analytics, archive, db, rollups
+from app.models import Activity, ArchivedActivity
+
+
+def assert_consistent():
+    connection = db.session.connection()
+    assert rollups.verify(connection) == []
+    assert analytics.verify(connection) == []
+
+
+@pytest.fixture
+def archived(app):
+    # Activity 0-31 (up to Jan 10) into the archive
+    with app.app_context():
+        assert archive.move(datetime(2024, 1, 10, 8), batch_size=7) == 32
+        yield
+
+
+def test_move_keeps_totals(archived):
+    assert Activity.query.count() == 88 and ArchivedActivity.query.count() == 32
+    assert archive.newest() == datetime(2024, 1, 10, 1)
+    assert_consistent()
+    assert rollups.get_stats(1)["activity_count"] == 4
+
+
+def test_commands(app):
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=["archive", "move"]).exit_code == 1
+    result = runner.invoke(args=["archive", "move", "--before", "2024-01-05"])
+    assert result.exit_code == 0 and "Moved 14 activities" in result.output
+    result = runner.invoke(args=["archive", "status"])
+    assert result.exit_code == 0 and "106 live activities, 14 archived." in result.output
+
+
+def test_pages_continue_into_the_archive(archived, client):
+    seen, url = [], "/activities?per_page=25"
+    while url:
+        body = client.get(url).get_data(as_text=True)
+        seen += [int(i) for i in re.findall(r'data-id="(\d+)"', body) if i != "0"]
+        older = re.search(r'<a href="([^"]+)"[^>]*>Older', body)
+        url = older.group(1).replace("&amp;", "&") if older else None
+    assert seen == list(range(120, 0, -1))
+
+    rows = list(csv.reader(io.StringIO(client.get("/export/activities").get_data(as_text=True))))
+    assert len(rows) == 121
+
+
+def test_recent_filters_skip_the_archive(archived, statements):
+    statements.clear()
+    rows = archive.activity_page({"start_date": "2024-01-20"}, 10)
+    assert len(rows) == 11  # one more than asked: the next page exists
+    assert not any("activities_archive" in s and "max" not in s for s in statements)
+
+
+def test_customer_page_counts_archived(archived, client):
+    body = client.get("/customer/2").get_data(as_text=True)
+    assert "Activities:</strong> 4 (2 archived)" in body
+    assert archive.count(2) == 2
+
+
+def test_bulk_delete_reaches_archived_rows(archived, client):
+    response = client.post("/activities/bulk_delete", json={"customer_id": 2})
+    assert response.json == {"deleted": 4}
+    assert archive.count(2) == 0
+    assert_consistent()
+
+    response = client.post("/activities/bulk_delete", json={"ids": [5, 6, 100]})
+    assert response.json == {"deleted": 3}
+    response = client.post("/activities/bulk_delete", json={"end_date": "2024-01-05"})
+    assert response.json["deleted"] > 0
+    assert ArchivedActivity.query.filter(ArchivedActivity.timestamp <= datetime(2024, 1, 5)).count() == 0
+    assert_consistent()
+
+    # Starting after the archive: the archive is left alone
+    before = ArchivedActivity.query.count()
+    client.post("/activities/bulk_delete", json={"start_date": "2024-01-25", "customer_id": 3})
+    assert ArchivedActivity.query.count() == before
+    assert_consistent()
+
+
+def test_customer_delete_takes_archived_rows(archived, client):
+    client.get("/delete_customer/2")
+    assert archive.count(2) == 0
+    assert_consistent()
@@ -0,0 +1,63 @@
+import io
+
+from sqlalchemy import select
+
+from app import db
+from app.autocomplete import CustomerIndex
+from app.importers import import_customers, read_csv_chunks
+from app.models import Customer
+
+
+def names(index, query, limit=10):
+    return [row[1] for row in index.search(query, limit)]
+
+
+def test_ranking_and_incremental_updates(app):
+    with app.app_context():
+        for name in ["Zed Alpha", "Alpha Zulu", "Beta alpha", "Gamma"]:
+            db.session.add(Customer(name=name, email=name.replace(" ", "").lower() + "@example.com"))
+        db.session.add(Customer(name="Omega", email="alphamail@example.com"))
+        db.session.commit()
+        index = app.extensions["customer_index"]
+
+        # Prefix matches, then name matches, then e-mail matches; the limit
+        # applies after ranking
+        assert names(index, "alph") == ["Alpha Zulu", "Beta alpha", "Zed Alpha", "Omega"]
+        assert names(index, "alph", 2) == ["Alpha Zulu", "Beta alpha"]
+
+        customer = db.session.execute(select(Customer).where(Customer.name == "Zed Alpha")).scalar_one()
+        customer.name, customer.email = "Zed Omega", "zed@example.com"
+        db.session.commit()
+        assert "Zed Omega" in names(index, "omeg") and "Zed Omega" not in names(index, "alph")
+
+        customer_id = customer.id
+        db.session.delete(customer)
+        db.session.commit()
+        assert all(customer_id not in ids for ids in index._postings.values())
+
+        # Maintained incrementally, yet the same as a fresh build
+        assert index.builds == 1
+        fresh = CustomerIndex(0)
+        fresh._rebuild()
+        assert {gram: sorted(ids) for gram, ids in fresh._postings.items()} == \
+            {gram: sorted(ids) for gram, ids in index._postings.items()}
+        assert fresh._records == index._records
+
+
+def test_writes_from_other_workers_and_imports(make_app, app):
+    worker = make_app(AUTOCOMPLETE_CHECK_INTERVAL=0)
+    with worker.app_context():
+        index = worker.extensions["customer_index"]
+        assert names(index, "newco") == []
+    with app.app_context():
+        db.session.add(Customer(name="Newco", email="newco@example.com"))
+        db.session.commit()
+    with worker.app_context():
+        assert names(index, "newco") == ["Newco"]
+        assert index.builds == 2
+
+        # An import in this worker is applied without a rebuild
+        csv_text = "Name,Email,Phone,Address\nNewco Two,two@example.com,,\n"
+        import_customers(read_csv_chunks(io.BytesIO(csv_text.encode())))
+        assert names(index, "newco") == ["Newco", "Newco Two"]
+        assert index.builds == 2
@@ -0,0 +1,29 @@
+import json
+
+from app import analytics, db, rollups
+from app.bench import seed_dataset
+from app.models import Activity, Customer, User
+
+
+def test_seed_dataset_is_consistent(app):
+    with app.app_context():
+        seed_dataset(users=2, customers=40, activities=300, seed=7, batch_size=100)
+        assert db.session.query(User).count() == 3
+        assert db.session.query(Customer).count() == 70
+        assert db.session.query(Activity).count() == 420
+        connection = db.session.connection()
+        assert rollups.verify(connection) == []
+        assert analytics.verify(connection) == []
+
+
+def test_run_reports_every_scenario(app, tmp_path):
+    output = tmp_path / "results.json"
+    result = app.test_cli_runner().invoke(args=[
+        "bench", "run", "--requests", "2", "--warmup", "0", "--customers", "30", "--activities", "200",
+        "--import-rows", "20", "--no-memory", "--output", str(output),
+    ])
+    assert result.exit_code == 0, result.output
+    results = json.loads(output.read_text())
+    assert results["scenarios"]
+    for scenario in results["scenarios"].values():
+        assert scenario["errors"] == 0
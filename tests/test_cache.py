@@ -0,0 +1,97 @@
+import io
+import time
+
+import pytest
+
+from app import db
+from app.cache import MISSING, TOUCH_INTERVAL, Cache, MemoryBackend, SQLiteBackend
+from app.importers import import_customers, read_csv_chunks
+from app.models import Customer
+
+from .conftest import login
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend(3)
+    return SQLiteBackend(str(tmp_path / "cache.sqlite"), "test", 3)
+
+
+def test_lru_eviction_and_ttl(backend, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    cache = Cache(backend, ttl=3600)
+    for key in "abc":
+        now[0] += 60
+        cache.get_or_set(key, lambda: key.upper())
+    now[0] += 60
+    assert cache.get_or_set("a", lambda: "rebuilt") == "A"  # a is now the most recent
+    cache.get_or_set("d", lambda: "D")
+    assert backend.get("b") is MISSING and backend.get("a") == "A"
+    assert (cache.hits, cache.misses) == (1, 4)
+
+    backend.set("e", "E", -1, backend.generation())
+    assert backend.get("e") is MISSING
+
+
+def test_invalidation_during_a_build_wins(backend):
+    cache = Cache(backend, ttl=60)
+
+    def build():
+        cache.invalidate()
+        return "stale"
+
+    assert cache.get_or_set("a", build) == "stale"
+    assert backend.get("a") is MISSING
+
+
+def test_sqlite_hits_touch_entries_only_now_and_then(tmp_path, monkeypatch):
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite"), "test", 3)
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    backend.set("a", "A", 3600, backend.generation())
+    connection = backend._connection()
+    writes = connection.total_changes
+    now[0] += 1
+    for _ in range(5):
+        assert backend.get("a") == "A"
+    assert connection.total_changes == writes
+    now[0] += TOUCH_INTERVAL
+    backend.get("a")
+    assert connection.total_changes == writes + 1
+
+
+def test_dashboard_hits_until_a_write(app, client):
+    client.get("/dashboard")
+    client.get("/dashboard")
+    stats = client.get("/cache/stats").json["dashboard"]
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    client.post("/add_activity/3", data={"text": "Fresh call", "price": "1"})
+    assert "Fresh call" in client.get("/dashboard").get_data(as_text=True)
+    client.post("/edit_customer/3", data={"name": "Renamed", "email": "c2@example.com", "phone": "", "address": ""})
+    assert "Renamed" in client.get("/dashboard").get_data(as_text=True)
+
+
+def test_dashboard_sees_bulk_imports(app, client):
+    client.get("/dashboard")
+    with app.app_context():
+        csv_text = "Name,Email,Phone,Address\nImported Ltd,imported@example.com,1,a\n"
+        import_customers(read_csv_chunks(io.BytesIO(csv_text.encode())))
+    assert "Imported Ltd" in client.get("/dashboard").get_data(as_text=True)
+
+
+def test_dashboard_sees_writes_from_another_process(app, make_app):
+    # Memory backend: nothing is shared but the database
+    worker = make_app(DASHBOARD_CACHE_TTL=3600)
+    client = login(worker)
+    assert b"Far Away" not in client.get("/dashboard").data
+    client.get("/dashboard")
+    with worker.app_context():
+        assert worker.extensions["dashboard_cache"].stats()["hits"] >= 1
+
+    with app.app_context():
+        db.session.add(Customer(name="Far Away", email="far@example.com"))
+        db.session.commit()
+    assert b"Far Away" in client.get("/dashboard").data
@@ -0,0 +1,60 @@
+import io
+
+import pytest
+
+from app import db
+from app.importers import import_activities, import_customers, read_chunks
+from app.models import User
+
+from .conftest import login
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq  # noqa: E402
+
+
+def read_table(fmt, data):
+    if fmt == "parquet":
+        return pq.read_table(io.BytesIO(data))
+    return pa.ipc.open_file(pa.BufferReader(data)).read_all()
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_exports_are_typed(client, fmt):
+    response = client.get(f"/export/activities?format={fmt}")
+    assert response.status_code == 200
+    assert f"activities.{fmt}" in response.headers["Content-Disposition"]
+    table = read_table(fmt, response.data)
+    assert table.num_rows == 120
+    assert pa.types.is_floating(table.schema.field("Price").type)
+    assert pa.types.is_timestamp(table.schema.field("Timestamp").type)
+    assert table.column("CustomerName")[0].as_py() == "Customer 0"
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_round_trip(client, make_app, tmp_path, fmt):
+    exported = {}
+    for kind in ("customers", "activities"):
+        path = tmp_path / f"{kind}.{fmt}"
+        path.write_bytes(client.get(f"/export/{kind}?format={fmt}").data)
+        exported[kind] = path
+
+    # A second installation with only the user
+    other = make_app(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'other.db'}")
+    with other.app_context():
+        db.create_all()
+        user = User(username="bob", email="bob@example.com")
+        user.set_password("pw")
+        db.session.add(user)
+        db.session.commit()
+        assert import_customers(read_chunks(str(exported["customers"]))).added == 30
+        assert import_activities(read_chunks(str(exported["activities"]))).added == 120
+
+    again = login(other)
+    for kind, path in exported.items():
+        before = read_table(fmt, path.read_bytes())
+        after = read_table(fmt, again.get(f"/export/{kind}?format={fmt}").data)
+        assert after.equals(before)
+
+
+def test_unknown_format(client):
+    assert client.get("/export/customers?format=xlsx").status_code == 400
@@ -0,0 +1,61 @@
+import pytest
+from sqlalchemy import delete
+
+from app import analytics, db, rollups
+from app.models import Activity, Customer
+
+
+def assert_consistent():
+    connection = db.session.connection()
+    assert rollups.verify(connection) == []
+    assert analytics.verify(connection) == []
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+
+
+def test_customer_delete_cascades_in_the_database(client, ctx, statements):
+    statements.clear()
+    client.get("/delete_customer/9")
+    assert db.session.get(Customer, 9) is None
+    assert Activity.query.filter_by(customer_id=9).count() == 0
+    # The activities are not loaded to be deleted one by one
+    assert not any(s.startswith("DELETE FROM activities") for s in statements)
+    assert_consistent()
+
+    # Also for deletes that bypass the ORM
+    db.session.execute(delete(Customer).where(Customer.id == 10))
+    db.session.commit()
+    assert Activity.query.filter_by(customer_id=10).count() == 0
+
+
+def test_bulk_delete(client, ctx):
+    response = client.post("/activities/bulk_delete", json={"ids": [1, 2, 3, 999]})
+    assert response.json == {"deleted": 3}
+    assert_consistent()
+
+    response = client.post("/activities/bulk_delete", json={"customer_id": 8})
+    assert response.json == {"deleted": 4}
+    assert_consistent()
+
+    # A form body, as the /activities page sends it
+    response = client.post("/activities/bulk_delete", data={"text": "Activity 11", "end_date": "2024-02-01"})
+    assert response.json == {"deleted": 1}
+    response = client.post("/activities/bulk_delete", data={"text": "Activity 11"})
+    assert response.json == {"deleted": 10}
+    assert Activity.query.filter(Activity.text.like("Activity 11%")).count() == 0
+    assert_consistent()
+
+
+def test_bulk_delete_rejects_bad_input(client, ctx):
+    assert client.post("/activities/bulk_delete", json=[1, 2]).status_code == 400
+    assert client.post("/activities/bulk_delete", json={"ids": "1,2"}).status_code == 400
+    assert client.post("/activities/bulk_delete", json={"ids": ["x"]}).status_code == 400
+    assert client.post("/activities/bulk_delete", json={"start_date": "yesterday"}).status_code == 400
+    # An empty filter would delete everything
+    assert client.post("/activities/bulk_delete", json={}).status_code == 400
+    assert client.post("/activities/bulk_delete", json={"text": ""}).status_code == 400
+    assert Activity.query.count() == 120
@@ -0,0 +1,29 @@
+from app import db
+from app.engines import dispose_after_fork, engine_options
+
+CONFIG = {
+    "DB_POOL_SIZE": 3, "DB_MAX_OVERFLOW": 4, "DB_POOL_TIMEOUT": 5.0, "DB_POOL_RECYCLE": 600,
+    "DB_POOL_PRE_PING": True, "DB_STATEMENT_TIMEOUT_MS": 2000,
+}
+
+
+def test_pool_options_per_database():
+    assert engine_options("sqlite://", CONFIG) == {"pool_pre_ping": True, "pool_recycle": 600}
+    assert engine_options("sqlite:///data.db", CONFIG)["pool_size"] == 3
+    options = engine_options("postgresql://kartoteka@db/kartoteka", CONFIG)
+    assert (options["max_overflow"], options["pool_timeout"]) == (4, 5.0)
+    assert options["connect_args"] == {"options": "-c statement_timeout=2000"}
+
+
+def test_app_engine_uses_the_config(make_app, app):
+    pooled = make_app(DB_POOL_SIZE=2, DB_MAX_OVERFLOW=1)
+    with pooled.app_context():
+        assert db.engine.pool.size() == 2
+
+
+def test_a_forked_worker_opens_its_own_connections(app, client):
+    client.get("/dashboard")
+    dispose_after_fork(app)
+    with app.app_context():
+        assert db.engine.pool.checkedin() == 0
+    assert client.get("/dashboard").status_code == 200
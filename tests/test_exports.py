@@ -0,0 +1,52 @@
+import csv
+import gzip
+import io
+from datetime import datetime
+
+from app import db
+from app.models import Activity
+
+
+def rows(response):
+    assert response.status_code == 200
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+
+
+def test_customers_stream(client):
+    response = client.get("/export/customers")
+    assert response.is_streamed
+    table = rows(response)
+    assert table[0] == ["ID", "Name", "Email", "Phone", "Address"]
+    assert [row[0] for row in table[1:]] == [str(i) for i in range(1, 31)]
+
+
+def test_activities_carry_names(client):
+    table = rows(client.get("/export/activities"))
+    assert table[0] == ["ID", "CustomerID", "CustomerName", "Text", "Price", "Creator", "Timestamp"]
+    assert len(table) == 121
+    assert table[1][:6] == ["1", "1", "Customer 0", "Activity 0", "0.0", "bob"]
+
+
+def test_statements_do_not_grow_with_rows(app, client, statements):
+    rows(client.get("/export/activities"))
+    statements.clear()
+    rows(client.get("/export/activities"))
+    before = len(statements)
+    with app.app_context():
+        for i in range(200):
+            db.session.add(Activity(text=f"More {i}", customer_id=i % 30 + 1, creator_id=1, price=1.0,
+                                    timestamp=datetime(2024, 3, 1)))
+        db.session.commit()
+    statements.clear()
+    assert len(rows(client.get("/export/activities"))) == 321
+    assert len(statements) == before
+
+
+def test_filters_and_gzip(client):
+    plain = client.get("/export/activities?customer_id=4&start_date=2024-01-01")
+    table = rows(plain)
+    assert len(table) == 5 and {row[1] for row in table[1:]} == {"4"}
+
+    packed = client.get("/export/activities?customer_id=4&start_date=2024-01-01&gzip=1")
+    assert packed.mimetype == "application/gzip"
+    assert gzip.decompress(packed.data) == plain.data
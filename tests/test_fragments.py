@@ -0,0 +1,58 @@
+from app import db
+from app.models import Activity
+
+from .conftest import login
+
+
+def stats(client):
+    return client.get("/cache/stats").json["fragments"]
+
+
+def test_rows_are_rendered_once(client):
+    client.get("/customers")
+    first = stats(client)
+    assert first["misses"] > 0
+    client.get("/customers")
+    second = stats(client)
+    assert second["misses"] == first["misses"]
+    assert second["hits"] > first["hits"]
+
+
+def test_a_changed_customer_is_rendered_again(app, client):
+    client.get("/customers")
+    before = stats(client)
+    client.post("/edit_customer/3", data={"name": "Renamed", "email": "c2@example.com", "phone": "", "address": ""})
+    page = client.get("/customers").get_data(as_text=True)
+    assert "Renamed" in page and "Customer 2<" not in page
+    assert stats(client)["misses"] == before["misses"] + 1
+
+    # A new activity changes the stats shown in the customer's row
+    with app.app_context():
+        db.session.add(Activity(text="Row stats", customer_id=4, creator_id=1, price=1000.0))
+        db.session.commit()
+    client.get("/customers")
+    assert stats(client)["misses"] == before["misses"] + 2
+
+
+def test_customer_options_follow_the_customers(client):
+    options = client.get("/edit_activity/1").get_data(as_text=True)
+    assert '<option value="1" selected>Customer 0</option>' in options
+    client.post("/add_customer", data={"name": "Newcomer", "email": "new@example.com", "phone": "", "address": ""})
+    options = client.get("/edit_activity/2").get_data(as_text=True)
+    assert '<option value="2" selected>Customer 1</option>' in options
+    assert ">Newcomer</option>" in options
+
+
+def test_ttl_zero_renders_every_time(make_app, app):
+    client = login(make_app(FRAGMENT_CACHE_TTL=0))
+    client.get("/customers")
+    client.get("/customers")
+    assert stats(client)["hits"] == 0
+
+
+def test_templates_compile_into_the_bytecode_cache(make_app, app, tmp_path):
+    directory = tmp_path / "jinja"
+    worker = make_app(JINJA_BYTECODE_CACHE=True, JINJA_BYTECODE_CACHE_DIR=str(directory))
+    result = worker.test_cli_runner().invoke(args=["templates", "compile"])
+    assert "into the bytecode cache" in result.output
+    assert any(directory.iterdir())
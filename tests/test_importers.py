@@ -0,0 +1,62 @@
+import io
+
+from app import db
+from app.importers import import_activities, import_customers, read_csv_chunks
+from app.models import Activity, Customer
+
+
+def chunks(text, size=2):
+    return read_csv_chunks(io.BytesIO(text.encode()), chunk_size=size)
+
+
+def test_customers_in_chunks_skip_known_and_repeated_emails(app):
+    csv_text = (
+        "Name,Email,Phone,Address\n"
+        "Ann,ann@example.com,1,A\n"
+        "Ben,c3@example.com,2,B\n"       # already in the database
+        "Ann again,ann@example.com,3,C\n"  # repeated in a later chunk
+        "Cid,cid@example.com,4,D\n"
+        ",,,\n"                           # placeholders all round
+    )
+    with app.app_context():
+        result = import_customers(chunks(csv_text))
+        assert (result.rows, result.added, result.skipped, result.duplicates) == (5, 3, 1, 1)
+        assert db.session.query(Customer).count() == 33
+        ann = Customer.query.filter_by(email="ann@example.com").one()
+        assert (ann.name, ann.phone) == ("Ann", "1")
+        placeholder = Customer.query.order_by(Customer.id.desc()).first()
+        assert placeholder.name and placeholder.email
+
+        # Running the file again adds only the placeholder row, which gets a new email
+        again = import_customers(chunks(csv_text))
+        assert (again.added, again.skipped) == (1, 3) and db.session.query(Customer).count() == 34
+
+
+def test_activities_are_validated_as_arrays(app):
+    csv_text = (
+        "CustomerID,Text,Price,Creator,Timestamp\n"
+        "1,Call,10.5,bob,2024-05-01 10:00:00\n"
+        "2,Visit,,bob,2024-05-02\n"       # empty price counts as 0
+        "999,Lost,1,bob,2024-05-03\n"
+        "3,,1,bob,2024-05-03\n"
+        "3,Who,1,nobody,2024-05-03\n"
+        "3,When,1,bob,someday\n"
+        "3,How much,lots,bob,2024-05-03\n"
+        "x,Which,1,bob,2024-05-03\n"
+        "4,Late,2,bob,05/06/2024 09:30\n"  # another format, retried per element
+    )
+    with app.app_context():
+        result = import_activities(chunks(csv_text, size=4), batch_size=2)
+        assert (result.rows, result.added, result.rejected) == (9, 3, 6)
+        assert result.rejections == [
+            {"line": 4, "reason": "Unknown customer"},
+            {"line": 5, "reason": "Missing activity text"},
+            {"line": 6, "reason": "Unknown creator"},
+            {"line": 7, "reason": "Invalid timestamp"},
+            {"line": 8, "reason": "Invalid price"},
+            {"line": 9, "reason": "Invalid customer ID"},
+        ]
+        imported = {a.text: a for a in Activity.query.filter(Activity.id > 120)}
+        assert sorted(imported) == ["Call", "Late", "Visit"]
+        assert imported["Visit"].price == 0.0 and imported["Call"].creator_id == 1
+        assert imported["Late"].timestamp.isoformat() == "2024-05-06T09:30:00"
@@ -0,0 +1,79 @@
+import io
+import os
+
+import pytest
+from sqlalchemy import update
+
+from app import db, importers, jobs, rollups
+from app.models import Activity, ImportJob
+
+ROWS = "".join(f"{i % 5 + 1},Job {i},{i},bob,2024-05-0{1 + i % 9} 10:00:00\n" for i in range(6))
+
+
+@pytest.fixture
+def queue(app, client):
+    app.config["IMPORT_CHUNK_SIZE"] = 2
+
+    def queue(extra=""):
+        csv_text = "CustomerID,Text,Price,Creator,Timestamp\n" + ROWS + extra
+        response = client.post("/import/activities", data={"file": (io.BytesIO(csv_text.encode()), "a.csv")},
+                               content_type="multipart/form-data", headers={"Accept": "application/json"})
+        assert response.status_code == 202
+        return response.json["job_id"]
+
+    with app.app_context():
+        yield queue
+
+
+def imported():
+    return Activity.query.filter(Activity.text.like("Job %")).count()
+
+
+def test_run_to_completion(queue):
+    queue("999,Unknown,1,bob,2024-01-01 10:00:00\n")
+    job = jobs.run(jobs.claim("w1"))
+    assert job.status == "done" and job.chunks_done == 4 and job.added == 6 and job.rejected == 1
+    assert not os.path.exists(job.path)
+    assert jobs.claim("w1") is None
+    assert imported() == 6
+    assert rollups.verify(db.session.connection()) == []
+
+
+def test_failed_job_resumes_after_committed_chunks(queue, client, monkeypatch):
+    job_id = queue()
+    read_chunks = importers.read_chunks
+
+    def failing(path, size):
+        for i, chunk in enumerate(read_chunks(path, size)):
+            if i == 2:
+                raise RuntimeError("disk gone")
+            yield chunk
+
+    monkeypatch.setattr(importers, "read_chunks", failing)
+    job = jobs.run(jobs.claim("w1"))
+    assert job.status == "failed" and job.chunks_done == 2 and imported() == 4
+
+    monkeypatch.setattr(importers, "read_chunks", read_chunks)
+    assert client.post(f"/import/jobs/{job_id}/resume").status_code == 302
+    job = jobs.run(jobs.claim("w2"))
+    assert job.status == "done" and job.chunks_done == 3 and imported() == 6
+
+
+def test_taken_over_job_is_left_alone(queue, monkeypatch):
+    job_id = queue()
+    read_chunks = importers.read_chunks
+
+    def taken_over(path, size):
+        for i, chunk in enumerate(read_chunks(path, size)):
+            if i == 1:
+                # Another worker reclaims the job while this one works on chunk two
+                with db.engine.begin() as connection:
+                    connection.execute(update(ImportJob).where(ImportJob.id == job_id).values(worker="w2"))
+            yield chunk
+
+    monkeypatch.setattr(importers, "read_chunks", taken_over)
+    job = jobs.run(jobs.claim("w1"))
+    # The chunk in flight was rolled back; status and spool file belong to w2
+    assert job.worker == "w2" and job.status == "running" and job.chunks_done == 1
+    assert imported() == 2
+    assert os.path.exists(job.path)
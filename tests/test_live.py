@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from app import db, live
+from app.models import Activity
+
+from .conftest import login
+
+
+@pytest.fixture
+def app(app):
+    # One pass over the changes, then the stream ends
+    app.config.update(LIVE_MAX_SECONDS=0, LIVE_MAX_EVENTS=5)
+    return app
+
+
+def watermark(app):
+    with app.app_context():
+        return live.watermark()
+
+
+def events(client, since=None, header=False):
+    if since is None:
+        response = client.get("/activities/events")
+    elif header:
+        response = client.get("/activities/events", headers={"Last-Event-ID": str(since)})
+    else:
+        response = client.get(f"/activities/events?last_event_id={since}")
+    assert response.status_code == 200 and response.mimetype == "text/event-stream"
+    parsed = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line and not line.startswith(":"))
+        if "event" in fields:
+            parsed.append((fields["event"], fields.get("id"), json.loads(fields["data"])))
+    return parsed
+
+
+def test_writes_become_events(app, client):
+    start = watermark(app)
+    client.post("/add_activity/2", data={"text": "Live one", "price": "3"})
+    client.post("/edit_activity_ajax/5", data={"text": "Edited", "price": "4"})
+    client.post("/delete_activity/6")
+
+    sent = events(client, start)
+    assert [(name, data["op"], data["id"]) for name, _, data in sent] == [
+        ("activity", "upsert", 121), ("activity", "upsert", 5), ("activity", "delete", 6)
+    ]
+    assert sent[0][2]["customer_name"] == "Customer 1" and sent[0][2]["creator"] == "bob"
+    assert sent[-1][1] == str(watermark(app))
+
+
+def test_resume_after_the_last_event_id(app, client):
+    start = watermark(app)
+    client.post("/add_activity/2", data={"text": "First", "price": "1"})
+    first = events(client, start)
+    client.post("/add_activity/2", data={"text": "Second", "price": "1"})
+
+    resumed = events(client, first[-1][1], header=True)
+    assert [data["text"] for _, _, data in resumed] == ["Second"]
+    assert events(client) == []
+
+
+def test_one_transaction_shares_an_id(app, client):
+    start = watermark(app)
+    with app.app_context():
+        for i in range(3):
+            db.session.add(Activity(text=f"Batch {i}", customer_id=1, creator_id=1, price=1.0))
+        db.session.commit()
+    sent = events(client, start)
+    assert [event_id for _, event_id, _ in sent] == [None, None, str(watermark(app))]
+
+
+def test_too_many_changes_resync(app, client):
+    start = watermark(app)
+    with app.app_context():
+        for activity in db.session.query(Activity).limit(6):
+            activity.price += 1
+        db.session.commit()
+    assert [name for name, _, _ in events(client, start)] == ["resync"]
+
+
+def test_bad_event_id(client):
+    assert client.get("/activities/events?last_event_id=abc").status_code == 400
+
+
+def test_streams_per_worker_are_limited(make_app, app):
+    other = make_app(LIVE_MAX_STREAMS=1)
+    client = login(other)
+    with other.app_context():
+        assert other.extensions["live"].slots.acquire(blocking=False)
+    assert client.get("/activities/events").status_code == 503
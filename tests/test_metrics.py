@@ -0,0 +1,72 @@
+import json
+import os
+import subprocess
+import sys
+
+from app import db
+from app.models import Customer
+
+from .conftest import login
+
+AUTH = {"Authorization": "Bearer token"}
+DASHBOARD = 'kartoteka_http_request_duration_seconds_count{endpoint="main.dashboard",method="GET",status="200"}'
+
+
+def scrape(client):
+    response = client.get("/metrics", headers=AUTH)
+    assert response.status_code == 200
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+            for line in response.get_data(as_text=True).splitlines() if not line.startswith("#")}
+
+
+def test_metrics_need_the_token(make_app, app, client):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers=AUTH).status_code == 200
+    # Not configured: not served at all
+    assert make_app(METRICS_TOKEN=None).test_client().get("/metrics", headers=AUTH).status_code == 404
+
+
+def test_requests_and_sql_are_counted(client):
+    client.get("/dashboard")
+    client.get("/dashboard")
+    values = scrape(client)
+    assert values[DASHBOARD] == 2
+    assert values['kartoteka_http_request_sql_queries_count{endpoint="main.dashboard"}'] == 2
+    assert values['kartoteka_template_render_seconds_count{template="dashboard.html"}'] >= 2
+
+
+def test_n_plus_one_is_flagged(app):
+    def customer_names():
+        # One query per customer, the pattern the counter is meant to catch
+        return ",".join(db.session.get(Customer, i).name for i in (1, 2, 3))
+
+    app.add_url_rule("/customer-names", "customer_names", customer_names)
+    app.config["N_PLUS_ONE_THRESHOLD"] = 3
+    client = login(app)
+    client.get("/dashboard")
+    client.get("/customer-names")
+    values = scrape(client)
+    assert values['kartoteka_n_plus_one_total{endpoint="customer_names"}'] == 1
+    assert 'kartoteka_n_plus_one_total{endpoint="main.dashboard"}' not in values
+
+
+def test_workers_add_up_and_exited_workers_drop_out(make_app, app, tmp_path):
+    directory = tmp_path / "metrics"
+    directory.mkdir()
+    worker = make_app(METRICS_DIR=str(directory))
+    client = login(worker)
+    client.get("/dashboard")
+
+    dump = {"kartoteka_http_request_duration_seconds": [
+        [["main.dashboard", "GET", "200"], [0] * 11 + [1, 0.1, 1]]
+    ]}
+    # A live worker (this test's parent process) and one that has exited
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    for pid in (os.getppid(), exited.pid):
+        (directory / f"metrics-{pid}.json").write_text(json.dumps(dump))
+
+    assert scrape(client)[DASHBOARD] == 2
+    assert not (directory / f"metrics-{exited.pid}.json").exists()
+    assert (directory / f"metrics-{os.getppid()}.json").exists()
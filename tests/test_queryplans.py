@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from app import archive, db
+from app.bench import seed_dataset
+from app.models import Activity
+from app.queryplans import check_plans
+
+
+@pytest.fixture
+def seeded(app):
+    # `flask plans check`, scaled down: seed, archive the oldest half year, analyze
+    with app.app_context():
+        seed_dataset(customers=1000, activities=20000)
+        newest = db.session.execute(select(func.max(Activity.timestamp))).scalar()
+        archive.move(newest - timedelta(days=180), batch_size=10000)
+        db.session.execute(db.text("ANALYZE"))
+        db.session.commit()
+        yield app
+
+
+def test_hot_queries_use_their_indexes(seeded):
+    assert check_plans() == {}
+
+
+def test_dropped_index_is_reported(seeded):
+    db.session.execute(db.text("DROP INDEX ix_activities_timestamp_id"))
+    db.session.commit()
+    failures = check_plans()
+    assert "activities: first page" in failures
+    assert "activities: archived page" not in failures
+
+
+def test_plans_check_command(app, tmp_path):
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=[
+        "plans", "check", "--customers", "500", "--activities", "10000",
+        "--database-url", f"sqlite:///{tmp_path / 'plans.db'}",
+    ])
+    assert result.exit_code == 0, result.output
+    assert "All hot queries use their indexes." in result.output
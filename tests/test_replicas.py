@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+from app import db
+from app.models import Customer
+
+from .conftest import login
+
+
+@pytest.fixture
+def replica_url(app, tmp_path):
+    # A snapshot of the seeded primary, left behind by later writes
+    path = tmp_path / "replica.db"
+    source, target = sqlite3.connect(tmp_path / "test.db"), sqlite3.connect(path)
+    source.backup(target)
+    source.close()
+    target.close()
+    with app.app_context():
+        db.session.add(Customer(name="Only On Primary", email="primary@example.com"))
+        db.session.commit()
+    return f"sqlite:///{path}"
+
+
+def replica_client(make_app, replica_url):
+    app = make_app(DATABASE_REPLICA_URLS=[replica_url], REPLICA_READ_YOUR_WRITES=60)
+    client = login(app)
+    # Logging in may have written; start from a session that did not
+    with client.session_transaction() as session:
+        session.pop("primary_until", None)
+    return app, client
+
+
+def test_reads_go_to_the_replica(make_app, replica_url):
+    app, client = replica_client(make_app, replica_url)
+    assert b"Only On Primary" not in client.get("/export/customers").data
+    # Views that are not marked read the primary
+    assert b"Only On Primary" in client.get("/edit_customer/31").data
+
+
+def test_a_session_reads_its_own_writes(make_app, replica_url):
+    app, client = replica_client(make_app, replica_url)
+    client.post("/add_customer", data={"name": "Just Added", "email": "added@example.com", "phone": "", "address": ""})
+    data = client.get("/export/customers").data
+    assert b"Just Added" in data and b"Only On Primary" in data
+
+    other = login(app)
+    with other.session_transaction() as session:
+        session.pop("primary_until", None)
+    assert b"Just Added" not in other.get("/export/customers").data
+
+
+def test_unreachable_replica_falls_back_to_the_primary(make_app, tmp_path, app):
+    app, client = replica_client(make_app, f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    assert client.get("/customers").status_code == 200
+    with app.app_context():
+        (replica,) = app.extensions["replicas"].replicas
+        assert not replica.healthy and replica.error
+
+    result = app.test_cli_runner().invoke(args=["replicas", "check"])
+    assert result.exit_code == 1 and "DOWN" in result.output
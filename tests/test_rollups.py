@@ -0,0 +1,108 @@
+import io
+import re
+from datetime import datetime
+
+import pytest
+
+from app import analytics, db, rollups
+from app.importers import import_activities, read_csv_chunks
+from app.models import Activity, Customer, CustomerStats
+
+
+def assert_consistent():
+    connection = db.session.connection()
+    assert rollups.verify(connection) == []
+    assert analytics.verify(connection) == []
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+
+
+def test_seeded_data_is_consistent(ctx):
+    assert_consistent()
+    assert rollups.get_stats(5) == {
+        "customer_id": 5, "activity_count": 4, "revenue": 4 + 34 + 64 + 94.0,
+        "last_activity_at": "2024-01-28T10:00:00",
+    }
+
+
+def test_single_activity_writes(client, ctx):
+    client.post("/add_activity/3", data={"text": "Call", "price": "12.5"})
+    client.post("/add_activity", data={"customer_id": "4", "activity_text": "Visit", "price": "7"})
+    assert_consistent()
+
+    # Price and customer change together, through both edit routes
+    client.post("/edit_activity/1", data={"text": "Moved", "price": "100", "customer_id": "5"})
+    client.post("/edit_activity_ajax/2", data={"text": "Moved too", "price": "0", "customer_id": "6"})
+    assert_consistent()
+
+    client.post("/delete_activity/3")
+    assert db.session.get(Activity, 3) is None
+    assert_consistent()
+
+
+def test_session_writes(ctx):
+    activity = db.session.get(Activity, 10)
+    activity.timestamp = datetime(2023, 6, 1)
+    db.session.add(Activity(text="Direct", customer_id=1, creator_id=1, price=3.0,
+                            timestamp=datetime(2022, 2, 2)))
+    db.session.delete(db.session.get(Activity, 11))
+    db.session.commit()
+    assert_consistent()
+
+
+def test_import(ctx):
+    rows = "".join(f"{i % 5 + 1},Imported {i},{i},bob,2024-05-0{1 + i % 9} 10:00:00\n" for i in range(9))
+    csv_text = "CustomerID,Text,Price,Creator,Timestamp\n" + rows
+    import_activities(read_csv_chunks(io.BytesIO(csv_text.encode()), chunk_size=4))
+    assert_consistent()
+
+
+def test_delete_customer(client, ctx):
+    client.get("/delete_customer/9")
+    assert db.session.get(Customer, 9) is None
+    assert db.session.get(CustomerStats, 9) is None
+    assert_consistent()
+
+
+def test_stats_are_shown(client):
+    assert client.get("/customer/5/stats").json["activity_count"] == 4
+    assert client.get("/customer/999/stats").status_code == 404
+    body = client.get("/customer/5").get_data(as_text=True)
+    assert "196.00 €" in body
+    assert "196.00" in client.get("/customers").get_data(as_text=True)
+
+
+def test_verify_and_rebuild_commands(app):
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=["rollups", "verify"]).exit_code == 0
+    with app.app_context():
+        db.session.get(CustomerStats, 5).revenue = 1.0
+        db.session.commit()
+    result = runner.invoke(args=["rollups", "verify"])
+    assert result.exit_code == 1 and "customer 5" in result.output
+    assert runner.invoke(args=["rollups", "verify", "--fix"]).exit_code == 0
+    assert runner.invoke(args=["rollups", "verify"]).exit_code == 0
+
+
+def test_customer_timeline_is_paged(app, client):
+    with app.app_context():
+        for i in range(30):
+            db.session.add(Activity(text=f"Timeline {i}", customer_id=7, creator_id=1, price=1.0,
+                                    timestamp=datetime(2024, 2, 1, i % 24, i)))
+        db.session.commit()
+        expected = [a.id for a in Activity.query.filter_by(customer_id=7)
+                    .order_by(Activity.timestamp.desc(), Activity.id.desc())]
+
+    seen, url = [], "/customer/7?per_page=8"
+    while url:
+        body = client.get(url).get_data(as_text=True)
+        ids = [int(i) for i in re.findall(r'id="activity-(\d+)"', body)]
+        assert 0 < len(ids) <= 8
+        seen += ids
+        older = re.search(r'<a href="([^"]+)"[^>]*>Older', body)
+        url = older.group(1).replace("&amp;", "&") if older else None
+    assert seen == expected
@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import text
+
+from app import db
+from app.models import Activity, Customer
+from app.search import activity_text_filter, install_search, search_customers
+
+
+@pytest.fixture(params=["fts5", "ilike"])
+def backend(request, app):
+    with app.app_context():
+        if request.param == "fts5":
+            with db.engine.begin() as connection:
+                assert install_search(connection)
+        yield request.param
+
+
+def names(query):
+    return [customer.name for customer in search_customers(query)]
+
+
+def test_customers_match_substrings_of_any_field(backend):
+    assert names("ustomer 2") == ["Customer 2", "Customer 20", "Customer 21", "Customer 22", "Customer 23",
+                                  "Customer 24", "Customer 25", "Customer 26", "Customer 27", "Customer 28",
+                                  "Customer 29"]
+    assert names("C17@EXAMPLE") == ["Customer 17"]
+    assert names("Street 5") == ["Customer 5"]
+    assert names('"; drop') == []
+    # Too short for trigrams: a plain scan
+    assert len(names("1")) == 12
+    assert len(search_customers("Customer", limit=5)) == 5
+
+
+def test_writes_keep_the_index_current(backend):
+    customer = db.session.get(Customer, 3)
+    customer.name = "Zebra Works"
+    db.session.commit()
+    assert names("zebra") == ["Zebra Works"]
+    assert "Customer 2" not in names("Customer 2")
+
+    db.session.delete(customer)
+    db.session.commit()
+    assert names("zebra") == []
+
+    activity = db.session.get(Activity, 5)
+    activity.text = "Quarterly review"
+    db.session.commit()
+    matched = db.session.execute(
+        db.select(Activity.id).where(activity_text_filter("terly rev"))
+    ).scalars().all()
+    assert matched == [5]
+
+
+def test_unindexed_columns_leave_the_index_alone(app):
+    with app.app_context(), db.engine.begin() as connection:
+        install_search(connection)
+        before = connection.execute(text("SELECT total_changes()")).scalar()
+        connection.execute(text("UPDATE activities SET price = price + 1 WHERE id <= 10"))
+        assert connection.execute(text("SELECT total_changes()")).scalar() - before == 10
+        before = connection.execute(text("SELECT total_changes()")).scalar()
+        connection.execute(text("UPDATE activities SET text = text || '!' WHERE id <= 10"))
+        assert connection.execute(text("SELECT total_changes()")).scalar() - before > 10
+
+
+def test_routes_use_the_search(backend, client):
+    body = client.get("/customers?q=ustomer 29").get_data(as_text=True)
+    assert "Customer 29" in body and "Customer 28" not in body
+    body = client.get("/activities?text=ivity 119").get_data(as_text=True)
+    assert "Activity 119" in body and "Activity 118" not in body
@@ -0,0 +1,17 @@
+import subprocess
+import sys
+from pathlib import Path
+
+
+def test_app_starts_without_the_data_libraries(tmp_path):
+    # pandas, numpy and pyarrow load with the first request that needs them
+    code = (
+        "import sys\n"
+        "from app import create_app\n"
+        f"create_app({{'SQLALCHEMY_DATABASE_URI': 'sqlite:///{tmp_path / 'test.db'}', "
+        "'JINJA_BYTECODE_CACHE': False, 'CACHE_BACKEND': 'memory', 'THROTTLE_BACKEND': 'memory'})\n"
+        "print(sorted({'pandas', 'numpy', 'pyarrow'} & set(sys.modules)))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=Path(__file__).parents[1])
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,40 @@
+import pytest
+
+from app import throttle
+
+
+def test_login_attempts_are_throttled_per_user(make_app, app):
+    throttled = make_app(LOGIN_THROTTLE=True, LOGIN_USER_BURST=2, LOGIN_USER_PER_MINUTE=1)
+    client = throttled.test_client()
+    for _ in range(2):
+        assert client.post("/auth/login", data={"username": "bob", "password": "wrong"}).status_code == 200
+    response = client.post("/auth/login", data={"username": "bob", "password": "pw"})
+    assert response.status_code == 429 and int(response.headers["Retry-After"]) > 0
+    # Another user from the same address still gets through
+    assert client.post("/auth/login", data={"username": "amy", "password": "x"}).status_code == 200
+
+
+def test_successful_login_gives_the_token_back(make_app, app):
+    throttled = make_app(LOGIN_THROTTLE=True, LOGIN_USER_BURST=1, LOGIN_USER_PER_MINUTE=1)
+    for _ in range(3):
+        response = throttled.test_client().post("/auth/login", data={"username": "bob", "password": "pw"})
+        assert response.status_code == 302
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_registrations_do_not_forget_drained_accounts(make_app, app, monkeypatch, tmp_path, backend):
+    # IP buckets refill within a second, the account's in four minutes
+    throttled = make_app(
+        LOGIN_THROTTLE=True, THROTTLE_BACKEND=backend, THROTTLE_PATH=str(tmp_path / "throttle.sqlite"),
+        LOGIN_IP_BURST=100, LOGIN_IP_PER_MINUTE=6000, LOGIN_USER_BURST=2, LOGIN_USER_PER_MINUTE=0.5,
+    )
+    now = [1000.0]
+    monkeypatch.setattr(throttle.time, "time", lambda: now[0])
+    client = throttled.test_client()
+    for _ in range(2):
+        assert client.post("/auth/login", data={"username": "bob", "password": "wrong"}).status_code == 200
+
+    # A registration (IP only) after the prune interval sweeps the buckets
+    now[0] += throttle.PRUNE_INTERVAL + 1
+    client.post("/auth/register", data={"username": "", "email": "", "password": ""})
+    assert client.post("/auth/login", data={"username": "bob", "password": "pw"}).status_code == 429
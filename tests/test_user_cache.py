@@ -0,0 +1,39 @@
+from app import db
+from app.models import User
+
+from .conftest import login
+
+
+def test_logged_in_requests_skip_the_users_query(client, statements):
+    client.get("/dashboard")
+    statements.clear()
+    client.get("/cache/stats")
+    assert not [s for s in statements if "FROM users" in s]
+
+    with client.application.app_context():
+        client.application.extensions["user_cache"].invalidate()
+    client.get("/cache/stats")
+    assert [s for s in statements if "FROM users" in s]
+
+
+def test_user_change_drops_only_that_user(make_app, app):
+    # Two workers sharing the SQLite cache file
+    first = make_app(CACHE_BACKEND="sqlite")
+    second = make_app(CACHE_BACKEND="sqlite")
+    with first.app_context():
+        amy = User(username="amy", email="amy@example.com")
+        amy.set_password("pw")
+        db.session.add(amy)
+        db.session.commit()
+    bob, amy = login(first), login(first, "amy")
+    bob.get("/dashboard")
+    amy.get("/dashboard")
+    with first.app_context():
+        cache = first.extensions["user_cache"]
+        assert len(cache.backend) == 2
+
+    response = login(second).post("/save_settings", json={"primary_color": "#123456"})
+    assert response.json["status"] == "success"
+    with first.app_context():
+        assert len(cache.backend) == 1
+    assert b"#123456" in bob.get("/dashboard").data